@@ -0,0 +1,289 @@
+"""
+Arquivamento hot/cold do NextMind.
+
+Conversas sem atividade há N meses (por `updated_at`) saem do banco principal
+para um único banco de arquivo em <dir do banco>/archive/archive.db.
+O banco principal fica pequeno (índices e cache quentes) e o arquivo é anexado
+(ATTACH) como schema `archive` ao abrir a conexão: listagem e busca federam os
+schemas de forma transparente via `Database.schemas()`. Um só arquivo mantém
+a federação dentro do limite de bancos anexados do SQLite.
+"""
+import re
+import sqlite3
+import time
+from typing import Optional, List, Dict, Any
+from database import Database, ARCHIVE_SCHEMA
+from logger import get_execution_logger
+from profiling import Profiler, phase
+
+
+# Tabelas movidas para o arquivo, na ordem de inserção (pais antes dos filhos)
+ARCHIVE_TABLES = ('conversations', 'messages', 'message_attachments')
+
+# Restrição de tabela `FOREIGN KEY (...) REFERENCES t(...) [ON DELETE ...]`
+_FOREIGN_KEY_RE = re.compile(
+    r",\s*FOREIGN KEY\s*\([^)]*\)\s*REFERENCES\s+\w+\s*\([^)]*\)"
+    r"(\s+ON\s+(DELETE|UPDATE)\s+(SET NULL|SET DEFAULT|CASCADE|RESTRICT|NO ACTION))*",
+    re.IGNORECASE
+)
+
+
+class Archiver:
+    """Move conversas frias para bancos de arquivo e de volta."""
+
+    def __init__(self, db: Database):
+        self.db = db
+
+    def _ensure_archive(self) -> str:
+        """Cria (se preciso) e anexa o banco de arquivo, com as colunas do principal; retorna o schema."""
+        alias = ARCHIVE_SCHEMA
+        conn = self.db.connect()
+        if not self.db.attach_archive(create=True):
+            raise RuntimeError("Não é possível anexar o arquivo dentro de uma transação")
+
+        # Mesmo schema do banco principal para as tabelas arquivadas (sem triggers:
+        # o arquivo preserva `updated_at` original)
+        rows = conn.execute(
+            f"""
+            SELECT type, name, tbl_name, sql FROM main.sqlite_master
+            WHERE tbl_name IN ({', '.join('?' * len(ARCHIVE_TABLES))})
+              AND type IN ('table', 'index') AND sql IS NOT NULL
+            ORDER BY type DESC
+            """,
+            ARCHIVE_TABLES
+        ).fetchall()
+        for row in rows:
+            keyword = 'CREATE TABLE' if row['type'] == 'table' else 'CREATE INDEX'
+            sql = row['sql'].replace(
+                f"{keyword} {row['name']}",
+                f"{keyword} IF NOT EXISTS {alias}.{row['name']}", 1
+            )
+            if row['type'] == 'table':
+                # FKs não atravessam bancos anexados (projects e blobs ficam no principal)
+                # e só o Archiver grava no arquivo: as cópias não têm FOREIGN KEY
+                sql = _FOREIGN_KEY_RE.sub('', sql)
+            conn.execute(sql)
+
+        # Colunas adicionadas ao banco principal depois da criação do arquivo
+        for table in ARCHIVE_TABLES:
+            present = {row['name'] for row in conn.execute(f"PRAGMA {alias}.table_info({table})")}
+            for column in conn.execute(f"PRAGMA main.table_info({table})").fetchall():
+                if column['name'] in present:
+                    continue
+                definition = f"{column['name']} {column['type']}"
+                if column['dflt_value'] is not None:
+                    definition += f" DEFAULT {column['dflt_value']}"
+                conn.execute(f"ALTER TABLE {alias}.{table} ADD COLUMN {definition}")
+        conn.commit()
+        self.db.forget_columns(alias)
+        return alias
+
+    def _columns(self, conn: sqlite3.Connection, schema: str, table: str) -> str:
+        """Colunas comuns ao banco principal e ao arquivo (tolera schemas antigos)."""
+        main_columns = [row['name'] for row in conn.execute(f"PRAGMA main.table_info({table})")]
+        other = {row['name'] for row in conn.execute(f"PRAGMA {schema}.table_info({table})")}
+        return ', '.join(c for c in main_columns if c in other)
+
+    def _move(
+        self, conn: sqlite3.Connection, source: str, target: str, ids_table: str
+    ) -> Dict[str, int]:
+        """Copia as conversas listadas em `ids_table` de `source` para `target` e as remove da origem."""
+        filters = {
+            'conversations': f"id IN (SELECT id FROM {ids_table})",
+            'messages': f"conversation_id IN (SELECT id FROM {ids_table})",
+            'message_attachments': (
+                f"message_id IN (SELECT id FROM {source}.messages "
+                f"WHERE conversation_id IN (SELECT id FROM {ids_table}))"
+            ),
+        }
+        # Na restauração, mensagens entram antes da conversa: os triggers do banco
+        # principal (updated_at e usage_daily) não encontram a conversa e não disparam
+        # (a FK de messages é conferida só no commit, com a conversa já inserida)
+        order = list(ARCHIVE_TABLES)
+        if target == 'main':
+            order = ['messages', 'message_attachments', 'conversations']
+            conn.execute("PRAGMA defer_foreign_keys = ON")
+
+        # Mover entre schemas não muda o que a UI vê (as leituras são federadas):
+        # as linhas do change feed geradas pelos triggers são descartadas no fim
+        last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM main.changes").fetchone()[0]
+
+        # Arquivar não altera o uso histórico, mas as remoções do principal disparam os
+        # triggers de desconto: o rollup dos dias afetados fica numa tabela TEMP (local à
+        # conexão, desfeita com a transação) e é reposto depois das remoções
+        if source == 'main':
+            conn.execute("DROP TABLE IF EXISTS temp.usage_before")
+            conn.execute(
+                "CREATE TEMP TABLE usage_before AS SELECT * FROM main.usage_daily "
+                f"WHERE day IN (SELECT substr(timestamp, 1, 10) FROM main.messages "
+                f"WHERE {filters['messages']})"
+            )
+
+        counts = {}
+        for table in order:
+            columns = self._columns(conn, source if target == 'main' else target, table)
+            cursor = conn.execute(
+                f"INSERT OR REPLACE INTO {target}.{table} ({columns}) "
+                f"SELECT {columns} FROM {source}.{table} WHERE {filters[table]}"
+            )
+            counts[table] = cursor.rowcount
+        for table in reversed(ARCHIVE_TABLES):
+            conn.execute(f"DELETE FROM {source}.{table} WHERE {filters[table]}")
+        if source == 'main':
+            conn.execute("INSERT OR REPLACE INTO main.usage_daily SELECT * FROM temp.usage_before")
+            conn.execute("DROP TABLE temp.usage_before")
+        conn.execute("DELETE FROM main.changes WHERE seq > ?", (last_seq,))
+        return counts
+
+    def archive_older_than(self, months: int = 12, now: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Arquiva conversas cujo `updated_at` é anterior a `months` meses atrás.
+
+        A cópia para o arquivo e a remoção do banco principal rodam numa única
+        transação; com WAL ela não é atômica entre os dois arquivos, então uma falha
+        no meio deixa no máximo uma cópia duplicada (nunca perde dados) e a próxima
+        execução a corrige (INSERT OR REPLACE).
+
+        Args:
+            months: Idade mínima (meses sem atividade)
+            now: Data de referência ('YYYY-MM-DD', padrão: hoje)
+
+        Returns:
+            Estatísticas: data de corte, conversas/mensagens movidas e caminho do arquivo
+        """
+        if months < 0:
+            raise ValueError("months deve ser >= 0")
+        logger = get_execution_logger()
+        start_time = time.time()
+        with Profiler("archive.py") as profiler:
+            conn = self.db.connect()
+            cutoff = conn.execute(
+                "SELECT date(?, ?)", (now or 'now', f"-{months} months")
+            ).fetchone()[0]
+            stats: Dict[str, Any] = {
+                'cutoff': cutoff,
+                'conversations_archived': 0,
+                'messages_archived': 0,
+                'archive': None
+            }
+
+            try:
+                has_candidates = conn.execute(
+                    "SELECT 1 FROM main.conversations WHERE updated_at < ? LIMIT 1", (cutoff,)
+                ).fetchone()
+                if has_candidates:
+                    # ATTACH não pode ocorrer dentro de uma transação
+                    alias = self._ensure_archive()
+                    conn.execute("BEGIN IMMEDIATE")
+                    try:
+                        conn.execute("DROP TABLE IF EXISTS temp.archive_ids")
+                        conn.execute(
+                            "CREATE TEMP TABLE archive_ids AS SELECT id FROM main.conversations "
+                            "WHERE updated_at < ?",
+                            (cutoff,)
+                        )
+                        with phase('write'):
+                            counts = self._move(conn, 'main', alias, 'temp.archive_ids')
+                        conn.execute("DROP TABLE temp.archive_ids")
+                        conn.commit()
+                    except BaseException:
+                        conn.rollback()
+                        raise
+                    stats['conversations_archived'] = counts['conversations']
+                    stats['messages_archived'] = counts['messages']
+                    stats['archive'] = str(self.db.archive_path)
+            except Exception as e:
+                logger.log(
+                    script_name="archive.py",
+                    inputs={"db_path": str(self.db.db_path), "months": months},
+                    outputs=stats,
+                    duration_seconds=time.time() - start_time,
+                    status="error",
+                    error=str(e),
+                    profile=profiler.stop()
+                )
+                raise
+
+            if stats['conversations_archived']:
+                # Libera as páginas do banco principal (incremental vacuum)
+                self.db.maintenance.record_changes(
+                    stats['conversations_archived'] + stats['messages_archived']
+                )
+            logger.log(
+                script_name="archive.py",
+                inputs={"db_path": str(self.db.db_path), "months": months},
+                outputs=stats,
+                duration_seconds=time.time() - start_time,
+                status="success",
+                profile=profiler.stop()
+            )
+            return stats
+
+    def restore_conversation(self, conversation_id: str) -> bool:
+        """
+        Traz uma conversa arquivada de volta ao banco principal (ex: antes de editá-la).
+
+        Returns:
+            True se a conversa foi encontrada num arquivo
+        """
+        return self.db.ensure_in_main(conversation_id)
+
+    def restore_archived(
+        self,
+        conn: sqlite3.Connection,
+        conversation_id: Optional[str] = None,
+        message_id: Optional[str] = None
+    ) -> bool:
+        """
+        Restaura a conversa (ou a conversa da mensagem) se ela só existir no arquivo.
+        Roda dentro de uma transação de escrita já aberta em `conn` (ver `Database.write_job`).
+
+        Returns:
+            True se a conversa foi restaurada
+        """
+        alias = ARCHIVE_SCHEMA
+        if message_id is not None:
+            row = conn.execute(
+                f"SELECT conversation_id FROM {alias}.messages WHERE id = ?", (message_id,)
+            ).fetchone()
+            if not row:
+                return False
+            conversation_id = row[0]
+        if conn.execute(
+            "SELECT 1 FROM main.conversations WHERE id = ?", (conversation_id,)
+        ).fetchone():
+            return False
+        if not conn.execute(
+            f"SELECT 1 FROM {alias}.conversations WHERE id = ?", (conversation_id,)
+        ).fetchone():
+            return False
+        conn.execute("DROP TABLE IF EXISTS temp.archive_ids")
+        conn.execute("CREATE TEMP TABLE archive_ids (id TEXT PRIMARY KEY)")
+        conn.execute("INSERT INTO temp.archive_ids VALUES (?)", (conversation_id,))
+        self._move(conn, alias, 'main', 'temp.archive_ids')
+        conn.execute("DROP TABLE temp.archive_ids")
+        return True
+
+    def list_archives(self) -> List[Dict[str, Any]]:
+        """Banco de arquivo (se existir) com a contagem de conversas."""
+        if not self.db.attach_archive():
+            return []
+        conn = self.db.connect()
+        return [{
+            'schema': ARCHIVE_SCHEMA,
+            'path': str(self.db.archive_path),
+            'conversations': conn.execute(
+                f"SELECT COUNT(*) FROM {ARCHIVE_SCHEMA}.conversations"
+            ).fetchone()[0]
+        }]
+
+
+if __name__ == "__main__":
+    import json
+    import sys
+
+    db = Database()
+    db.ensure_schema()
+    months = int(sys.argv[1]) if len(sys.argv) > 1 else 12
+    print(json.dumps(Archiver(db).archive_older_than(months)))
+    db.close()
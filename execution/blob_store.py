@@ -0,0 +1,332 @@
+"""
+Blob store do NextMind: anexos (imagens, arquivos, saídas de código) guardados
+fora do SQLite, endereçados pelo SHA-256 do conteúdo.
+
+Layout: <raiz>/ab/cd/abcd...  (dois níveis de shard pelo prefixo do hash)
+- Escrita em streaming por blocos, com hash calculado durante a cópia
+- Conteúdo idêntico é gravado uma única vez (deduplicação entre conversas)
+- Leitura sem cópia via mmap ou os.sendfile para servir a UI
+"""
+import hashlib
+import mmap
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Optional, List, Dict, Any, BinaryIO, Tuple, Union
+from database import Database
+
+
+# Blobs gravados ou reaproveitados há menos que isso não são coletados: cobre a
+# janela entre `put_*` (que toca o mtime) e o INSERT do anexo num import concorrente
+GC_GRACE_SECONDS = 600
+
+
+class BlobStore:
+    """Armazenamento em disco endereçado por conteúdo."""
+
+    def __init__(self, root: Union[str, Path] = ".tmp/data/blobs", chunk_size: int = 1 << 20):
+        """
+        Args:
+            root: Diretório raiz do blob store
+            chunk_size: Tamanho dos blocos de leitura/escrita em bytes
+        """
+        self.root = Path(root)
+        self.chunk_size = chunk_size
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def for_database(cls, db: Database) -> 'BlobStore':
+        """Blob store ao lado do arquivo do banco (<dir do banco>/blobs)."""
+        return cls(db.db_path.parent / "blobs")
+
+    def path_for(self, blob_hash: str) -> Path:
+        """Caminho do blob no disco."""
+        return self.root / blob_hash[:2] / blob_hash[2:4] / blob_hash
+
+    def exists(self, blob_hash: str) -> bool:
+        return self.path_for(blob_hash).exists()
+
+    def modified_at(self, blob_hash: str) -> Optional[float]:
+        """mtime do blob (última gravação ou reaproveitamento); None se não existe."""
+        try:
+            return os.stat(self.path_for(blob_hash)).st_mtime
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _touch(target: Path) -> bool:
+        """Marca um blob existente como recém-usado (protege da coleta de lixo)."""
+        try:
+            os.utime(target)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def put_stream(self, fp: BinaryIO) -> Tuple[str, int]:
+        """
+        Grava um stream no store, em blocos, sem carregá-lo inteiro na memória.
+
+        Args:
+            fp: Stream binário de origem
+
+        Returns:
+            Tupla (hash SHA-256, tamanho em bytes)
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".incoming-")
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    chunk = fp.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+
+            blob_hash = digest.hexdigest()
+            target = self.path_for(blob_hash)
+            if self._touch(target):
+                # Conteúdo já armazenado: descarta a cópia
+                os.unlink(tmp_path)
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp_path, target)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return blob_hash, size
+
+    def put_bytes(self, data: bytes) -> Tuple[str, int]:
+        """Grava um conteúdo em memória no store."""
+        blob_hash = hashlib.sha256(data).hexdigest()
+        target = self.path_for(blob_hash)
+        if not self._touch(target):
+            target.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".incoming-")
+            try:
+                with os.fdopen(fd, 'wb') as out:
+                    out.write(data)
+                os.replace(tmp_path, target)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+        return blob_hash, len(data)
+
+    def open_mmap(self, blob_hash: str) -> Union[mmap.mmap, bytes]:
+        """
+        Mapeia o blob na memória (somente leitura, sem cópia).
+        O chamador deve fechar o mmap retornado. Blobs vazios retornam b''.
+        """
+        path = self.path_for(blob_hash)
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b''
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def sendfile(self, blob_hash: str, out_fd: int, offset: int = 0,
+                 count: Optional[int] = None) -> int:
+        """
+        Copia o blob para um descritor (socket, pipe, stdout) via os.sendfile,
+        sem passar o conteúdo pelo espaço de usuário quando suportado.
+
+        Args:
+            blob_hash: Hash do blob
+            out_fd: Descritor de destino
+            offset: Posição inicial no blob
+            count: Bytes a enviar (None até o fim)
+
+        Returns:
+            Bytes enviados
+        """
+        with open(self.path_for(blob_hash), 'rb') as f:
+            remaining = os.fstat(f.fileno()).st_size - offset
+            if count is not None:
+                remaining = min(remaining, count)
+            sent = 0
+            if hasattr(os, 'sendfile'):
+                try:
+                    while remaining > 0:
+                        n = os.sendfile(out_fd, f.fileno(), offset + sent, remaining)
+                        if n == 0:
+                            break
+                        sent += n
+                        remaining -= n
+                    return sent
+                except OSError:
+                    if sent:
+                        raise
+            # Fallback (ex: Windows ou destino sem suporte a sendfile)
+            f.seek(offset)
+            while remaining > 0:
+                chunk = f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                view = memoryview(chunk)
+                while view:
+                    written = os.write(out_fd, view)
+                    view = view[written:]
+                sent += len(chunk)
+                remaining -= len(chunk)
+            return sent
+
+    def delete(self, blob_hash: str):
+        """Remove o arquivo do blob (se existir)."""
+        try:
+            os.unlink(self.path_for(blob_hash))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        """Remove todo o conteúdo do store."""
+        shutil.rmtree(self.root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+
+class Attachment:
+    """Modelo para a entidade MessageAttachment (metadados no banco, conteúdo no BlobStore)."""
+
+    def __init__(self, db: Database, store: Optional[BlobStore] = None):
+        self.db = db
+        self.store = store or BlobStore.for_database(db)
+
+    def _link(
+        self,
+        message_id: str,
+        blob_hash: str,
+        size: int,
+        filename: Optional[str],
+        mime_type: Optional[str],
+        kind: str
+    ) -> str:
+        # Mensagem arquivada: a conversa volta ao principal antes do novo anexo
+        self.db.ensure_in_main(message_id=message_id)
+        attachment_id = str(uuid.uuid4())
+        self.db.write_many([
+            ("INSERT OR IGNORE INTO blobs (hash, size) VALUES (?, ?)", (blob_hash, size)),
+            (
+                """
+                INSERT INTO message_attachments (id, message_id, blob_hash, filename, mime_type, kind)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (attachment_id, message_id, blob_hash, filename, mime_type, kind)
+            ),
+        ])
+        return attachment_id
+
+    def create(
+        self,
+        message_id: str,
+        fp: BinaryIO,
+        filename: Optional[str] = None,
+        mime_type: Optional[str] = None,
+        kind: str = 'file'
+    ) -> str:
+        """
+        Anexa o conteúdo de um stream a uma mensagem.
+
+        Args:
+            message_id: ID da mensagem
+            fp: Stream binário com o conteúdo (gravado em blocos)
+            filename: Nome original do arquivo
+            mime_type: Tipo MIME
+            kind: 'image', 'file' ou 'code_output'
+
+        Returns:
+            UUID do anexo criado
+        """
+        blob_hash, size = self.store.put_stream(fp)
+        return self._link(message_id, blob_hash, size, filename, mime_type, kind)
+
+    def create_from_bytes(
+        self,
+        message_id: str,
+        data: bytes,
+        filename: Optional[str] = None,
+        mime_type: Optional[str] = None,
+        kind: str = 'file'
+    ) -> str:
+        """Anexa um conteúdo em memória a uma mensagem."""
+        blob_hash, size = self.store.put_bytes(data)
+        return self._link(message_id, blob_hash, size, filename, mime_type, kind)
+
+    def list_by_message(self, message_id: str) -> List[Dict[str, Any]]:
+        """Lista os anexos de uma mensagem (com o tamanho do blob), inclusive arquivada."""
+        conn = self.db.connect()
+        schemas = self.db.schemas()
+        # `blobs` fica sempre no banco principal; os anexos podem estar no arquivo
+        sql = " UNION ALL ".join(
+            f"""
+            SELECT {self.db.select_list(schema, 'message_attachments', prefix='a.')}, b.size
+            FROM {schema}.message_attachments a
+            JOIN main.blobs b ON b.hash = a.blob_hash
+            WHERE a.message_id = ?
+            """
+            for schema in schemas
+        )
+        rows = conn.execute(
+            f"SELECT * FROM ({sql}) ORDER BY created_at ASC", [message_id] * len(schemas)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def collect_garbage(self, grace_seconds: float = GC_GRACE_SECONDS) -> int:
+        """
+        Remove blobs sem nenhum anexo referenciando-os, no banco principal ou no
+        arquivo (anexos arquivados continuam usando os blobs do principal).
+
+        Cada candidato é reconfirmado dentro de uma transação BEGIN IMMEDIATE (nenhum
+        anexo novo entra até o commit), e blobs tocados há menos de `grace_seconds`
+        são mantidos: um import concorrente pode ter reaproveitado o arquivo e ainda
+        não ter gravado o anexo.
+
+        Args:
+            grace_seconds: Idade mínima (mtime) de um blob para ser removido
+
+        Returns:
+            Número de blobs removidos
+
+        Raises:
+            RuntimeError: O arquivo existe mas não pôde ser anexado (transação aberta)
+        """
+        conn = self.db.connect()
+        if self.db.archive_path.exists() and not self.db.attach_archive():
+            raise RuntimeError("Banco de arquivo não anexado: coleta de lixo cancelada")
+        unreferenced = " AND ".join(
+            f"NOT EXISTS (SELECT 1 FROM {schema}.message_attachments a WHERE a.blob_hash = blobs.hash)"
+            for schema in self.db.schemas()
+        )
+        candidates = [
+            row['hash'] for row in conn.execute(
+                f"SELECT hash FROM main.blobs WHERE {unreferenced}"
+            ).fetchall()
+        ]
+        if not candidates:
+            return 0
+
+        cutoff = time.time() - grace_seconds
+        removed = 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for blob_hash in candidates:
+                orphan = conn.execute(
+                    f"SELECT 1 FROM main.blobs WHERE hash = ? AND {unreferenced}", (blob_hash,)
+                ).fetchone()
+                if not orphan:
+                    continue
+                modified = self.store.modified_at(blob_hash)
+                if modified is not None and modified > cutoff:
+                    continue
+                conn.execute("DELETE FROM main.blobs WHERE hash = ?", (blob_hash,))
+                # Removido antes do commit: nenhum anexo novo pode apontar para ele
+                self.store.delete(blob_hash)
+                removed += 1
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return removed
@@ -0,0 +1,162 @@
+"""
+Change feed do NextMind.
+
+Triggers em `projects`, `conversations` e `messages` registram cada alteração
+na tabela append-only `changes` com um `seq` monotônico. A UI guarda o último
+`seq` visto e pede só o que mudou desde então (`changes_since`), em vez de
+reexecutar `list_by_project` / `list_by_conversation` a cada atualização.
+"""
+import json
+import time
+from typing import Optional, Dict, Any, Tuple
+from database import Database
+
+
+# Chave em `settings` com o menor seq ainda garantido: {"floor": ...}
+SETTINGS_KEY = 'change_feed'
+
+# Intervalo inicial (segundos) da verificação de escritas de outros processos em `wait`
+WAIT_MIN_INTERVAL = 0.05
+
+
+class ChangeFeed:
+    """Leitura e compactação do log de alterações."""
+
+    def __init__(self, db: Database):
+        self.db = db
+        # (versão do banco, floor): relido só quando algo foi gravado no banco
+        self._floor_cache: Optional[Tuple[Tuple[int, int], int]] = None
+
+    def latest_seq(self) -> int:
+        """Último seq registrado (0 se o log estiver vazio)."""
+        row = self.db.connect().execute(
+            "SELECT seq FROM sqlite_sequence WHERE name = 'changes'"
+        ).fetchone()
+        return row['seq'] if row else 0
+
+    def _version(self) -> Tuple[int, int]:
+        """
+        Muda a cada commit no banco: `data_version` cobre outras conexões (outros
+        processos, fila de escrita) e `total_changes` as escritas desta conexão.
+        """
+        conn = self.db.connect()
+        return conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes
+
+    def floor(self) -> int:
+        """Seq até o qual entradas podem ter sido removidas pela compactação por idade."""
+        version = self._version()
+        if self._floor_cache is not None and self._floor_cache[0] == version:
+            return self._floor_cache[1]
+        row = self.db.connect().execute(
+            "SELECT value FROM settings WHERE key = ?", (SETTINGS_KEY,)
+        ).fetchone()
+        floor = json.loads(row['value'])['floor'] if row else 0
+        self._floor_cache = (version, floor)
+        return floor
+
+    def changes_since(self, seq: int = 0, limit: int = 500) -> Dict[str, Any]:
+        """
+        Alterações com seq maior que `seq`, em ordem.
+
+        Args:
+            seq: Último seq já processado pelo cliente (0 na primeira chamada)
+            limit: Máximo de alterações retornadas
+
+        Returns:
+            Dict com `changes`, `last_seq` (cursor para a próxima chamada),
+            `has_more` e `reset` (True se o cliente ficou para trás da compactação
+            e precisa recarregar as listas inteiras)
+        """
+        conn = self.db.connect()
+        rows = conn.execute(
+            """
+            SELECT seq, entity, entity_id, op, parent_id, changed_at
+            FROM changes
+            WHERE seq > ?
+            ORDER BY seq
+            LIMIT ?
+            """,
+            (seq, limit + 1)
+        ).fetchall()
+        changes = [dict(row) for row in rows[:limit]]
+        return {
+            'changes': changes,
+            'last_seq': changes[-1]['seq'] if changes else max(seq, self.latest_seq()),
+            'has_more': len(rows) > limit,
+            'reset': seq < self.floor(),
+        }
+
+    def wait(
+        self,
+        seq: int,
+        timeout: float = 30.0,
+        poll_interval: float = 1.0,
+        limit: int = 500
+    ) -> Dict[str, Any]:
+        """
+        Long polling: retorna assim que houver alterações depois de `seq`
+        (ou vazio ao fim do `timeout`).
+
+        Escritas deste processo (`Database.write_many`) acordam a espera na hora.
+        Escritas de outros processos não geram notificação no SQLite: são vistas
+        por verificações do último seq em intervalos que dobram de
+        WAIT_MIN_INTERVAL até `poll_interval`.
+        """
+        deadline = time.monotonic() + timeout
+        interval = WAIT_MIN_INTERVAL
+        commits = self.db.commits
+        while True:
+            with commits:
+                seen = self.db.commit_count
+            if self.latest_seq() > seq:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            with commits:
+                notified = commits.wait_for(
+                    lambda: self.db.commit_count != seen, min(interval, remaining)
+                )
+            interval = WAIT_MIN_INTERVAL if notified else min(interval * 2, poll_interval)
+        return self.changes_since(seq, limit)
+
+    def compact(self, max_age_days: Optional[float] = 30) -> Dict[str, int]:
+        """
+        Compacta o log.
+
+        1. Mantém só a alteração mais recente de cada entidade: um cliente em
+           qualquer cursor continua vendo o estado final de tudo que mudou depois dele.
+        2. Remove entradas mais antigas que `max_age_days` e sobe o `floor`;
+           clientes com cursor abaixo dele recebem `reset`.
+
+        Returns:
+            Linhas removidas em cada etapa
+        """
+        conn = self.db.connect()
+        with conn:
+            collapsed = conn.execute(
+                """
+                DELETE FROM changes WHERE seq NOT IN (
+                    SELECT MAX(seq) FROM changes GROUP BY entity, entity_id
+                )
+                """
+            ).rowcount
+            expired = 0
+            if max_age_days is not None:
+                cutoff = f"-{max_age_days} days"
+                row = conn.execute(
+                    "SELECT MAX(seq) FROM changes WHERE changed_at < datetime('now', ?)",
+                    (cutoff,)
+                ).fetchone()
+                if row[0] is not None:
+                    expired = conn.execute(
+                        "DELETE FROM changes WHERE seq <= ?", (row[0],)
+                    ).rowcount
+                    conn.execute(
+                        """
+                        INSERT INTO settings (key, value, updated_at) VALUES (?, ?, datetime('now'))
+                        ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+                        """,
+                        (SETTINGS_KEY, json.dumps({'floor': row[0]}))
+                    )
+        return {'collapsed': collapsed, 'expired': expired}
@@ -3,12 +3,244 @@ NextMind Database Models
 Modelos Python para interação com o banco de dados SQLite.
 """
 import sqlite3
+import threading
+import queue
+import time
 import uuid
+import zlib
+from collections import namedtuple
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Sequence, Tuple, Iterator, Callable, TYPE_CHECKING
 from pathlib import Path
 import json
 
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+    from maintenance import MaintenanceScheduler
+
+
+# Instrução de escrita: (sql, parâmetros)
+Statement = Tuple[str, Sequence[Any]]
+
+# Escrita que precisa ler antes de gravar: recebe a conexão, já dentro da transação
+WriteJob = Callable[[sqlite3.Connection], Any]
+
+# Timeout (segundos) para aguardar o lock de escrita de outro processo
+BUSY_TIMEOUT_SECONDS = 30.0
+
+# schema.sql ao lado deste módulo (independe do diretório de trabalho)
+SCHEMA_PATH = Path(__file__).with_name('schema.sql')
+
+# Banco de arquivo (conversas frias) em <dir do banco>/archive/archive.db, anexado como `archive`
+ARCHIVE_DIRNAME = 'archive'
+ARCHIVE_FILENAME = 'archive.db'
+ARCHIVE_SCHEMA = 'archive'
+
+# Linhas buscadas por fetchmany nas variantes iter_*
+ITER_BATCH_SIZE = 256
+
+# Streams: `message_streams.last_heartbeat_at` guarda o horário do último checkpoint,
+# renovado mesmo sem chunks novos; `recover_streams` só finaliza streams sem
+# heartbeat há mais de STREAM_STALE_SECONDS (podem estar vivos em outro processo)
+STREAM_HEARTBEAT_SECONDS = 60.0
+STREAM_STALE_SECONDS = 300.0
+
+# Tipos de registro (namedtuple: sem __dict__ por linha) por tabela e projeção
+_RECORD_TYPES: Dict[Tuple[str, Tuple[str, ...]], type] = {}
+
+
+def record_type(table: str, columns: Tuple[str, ...]) -> type:
+    """Namedtuple compacto para linhas de `table` com as colunas projetadas."""
+    key = (table, columns)
+    if key not in _RECORD_TYPES:
+        name = ''.join(part.capitalize() for part in table.split('_')) + 'Record'
+        _RECORD_TYPES[key] = namedtuple(name, columns)
+    return _RECORD_TYPES[key]
+
+
+class WriteQueue:
+    """
+    Escritor único com group commit.
+
+    Uma thread dedicada, com conexão própria, consome pedidos de escrita de uma fila,
+    agrupa todos os pedidos pendentes numa única transação (um único fsync) e
+    confirma cada chamador via Future. Cada pedido roda num SAVEPOINT próprio,
+    então a falha de um pedido não descarta os demais do mesmo grupo.
+    Pedidos são listas de instruções ou jobs (`WriteJob`) que rodam na conexão
+    da thread escritora, com o banco de arquivo anexado.
+    """
+
+    _STOP = object()
+
+    def __init__(
+        self,
+        db_path: Path,
+        max_batch: int = 512,
+        max_delay: float = 0.0,
+        archive_path: Optional[Path] = None
+    ):
+        """
+        Args:
+            db_path: Caminho do banco de dados SQLite
+            max_batch: Máximo de pedidos agrupados numa transação
+            max_delay: Tempo extra (segundos) aguardando novos pedidos antes do commit
+            archive_path: Banco de arquivo, anexado antes do primeiro job
+        """
+        self.db_path = db_path
+        self.archive_path = archive_path
+        self._archive_attached = False
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.stats = {'writes': 0, 'transactions': 0, 'errors': 0}
+        self._queue: "queue.Queue[Any]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Inicia a thread escritora."""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="nextmind-writer", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        """Processa os pedidos pendentes e encerra a thread escritora."""
+        if self._thread is not None:
+            self._queue.put(self._STOP)
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, statements: List[Statement]) -> 'Future':
+        """
+        Enfileira um pedido de escrita atômico.
+
+        Args:
+            statements: Instruções executadas juntas (tudo ou nada)
+
+        Returns:
+            Future resolvido com o rowcount total após o commit
+        """
+        # Import tardio: concurrent.futures carrega `logging`, caro na partida da CLI
+        from concurrent.futures import Future
+        if self._thread is None:
+            raise RuntimeError("WriteQueue não iniciada")
+        future = Future()
+        self._queue.put((statements, future))
+        return future
+
+    def submit_job(self, job: WriteJob) -> 'Future':
+        """
+        Enfileira um job executado na thread escritora, dentro da transação do grupo.
+
+        Returns:
+            Future resolvido com o retorno do job após o commit
+        """
+        return self.submit(job)
+
+    def _next_batch(self, first: Any) -> List[Any]:
+        """Coleta pedidos pendentes até max_batch (aguardando até max_delay)."""
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            try:
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    item = self._queue.get(timeout=remaining)
+                else:
+                    item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is self._STOP:
+                # Reenfileira o sinal de parada para depois deste grupo
+                self._queue.put(item)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        conn = sqlite3.connect(
+            str(self.db_path), timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None
+        )
+        conn.row_factory = sqlite3.Row
+        Database.configure_connection(conn)
+        try:
+            while True:
+                first = self._queue.get()
+                if first is self._STOP:
+                    break
+                batch = self._next_batch(first)
+                try:
+                    if any(callable(work) for work, _ in batch):
+                        self._attach_archive(conn)
+                    self._commit_batch(conn, batch)
+                except Exception as e:
+                    # Falha fora do SAVEPOINT de cada pedido (ex: ROLLBACK TO, disco cheio):
+                    # o grupo inteiro falha, mas a thread escritora continua atendendo
+                    self._fail_batch(conn, batch, e)
+        finally:
+            conn.close()
+
+    def _attach_archive(self, conn: sqlite3.Connection):
+        """ATTACH do banco de arquivo (fora de transação), se ele existir."""
+        if self._archive_attached or self.archive_path is None or not self.archive_path.exists():
+            return
+        conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (str(self.archive_path),))
+        self._archive_attached = True
+
+    def _fail_batch(self, conn: sqlite3.Connection, batch: List[Any], error: Exception):
+        """Desfaz a transação aberta e propaga o erro aos pedidos ainda pendentes."""
+        try:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+        except sqlite3.Error:
+            pass
+        for _, future in batch:
+            if not future.done():
+                self.stats['errors'] += 1
+                future.set_exception(error)
+
+    def _commit_batch(self, conn: sqlite3.Connection, batch: List[Any]):
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.Error as e:
+            for _, future in batch:
+                future.set_exception(e)
+            self.stats['errors'] += len(batch)
+            return
+
+        for work, future in batch:
+            conn.execute("SAVEPOINT write_request")
+            try:
+                if callable(work):
+                    result = work(conn)
+                else:
+                    result = 0
+                    for sql, params in work:
+                        result += conn.execute(sql, params).rowcount
+                conn.execute("RELEASE write_request")
+                results.append((future, result, None))
+            except Exception as e:
+                conn.execute("ROLLBACK TO write_request")
+                conn.execute("RELEASE write_request")
+                results.append((future, None, e))
+
+        try:
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            results = [(future, None, e) for future, _, _ in results]
+
+        self.stats['transactions'] += 1
+        for future, result, error in results:
+            if error is None:
+                self.stats['writes'] += 1
+                future.set_result(result)
+            else:
+                self.stats['errors'] += 1
+                future.set_exception(error)
+
 
 class Database:
     """Gerenciador de conexão com o banco de dados SQLite."""
@@ -23,21 +255,325 @@ class Database:
         self.db_path = Path(db_path)
         self.db_path.parent.mkdir(parents=True, exist_ok=True)
         self.conn: Optional[sqlite3.Connection] = None
+        self.write_queue: Optional[WriteQueue] = None
+        self._maintenance: Optional['MaintenanceScheduler'] = None
+        self._stream_flusher: Optional['StreamFlusher'] = None
+        self.archive_path = self.db_path.parent / ARCHIVE_DIRNAME / ARCHIVE_FILENAME
+        self._archive_attached = False
+        self._schema_columns: Dict[Tuple[str, str], Tuple[str, ...]] = {}
+        # Notificado a cada write_many concluído (acorda ChangeFeed.wait)
+        self.commits = threading.Condition()
+        self.commit_count = 0
+
+    @staticmethod
+    def configure_connection(conn: sqlite3.Connection):
+        """
+        Aplica os PRAGMAs de concorrência a uma conexão.
+        WAL permite leitores simultâneos a um escritor e, com synchronous=NORMAL,
+        o fsync ocorre apenas nos checkpoints em vez de a cada commit.
+        """
+        if conn.execute("PRAGMA page_count").fetchone()[0] == 0:
+            # Banco novo: auto_vacuum só pode ser definido antes de gravar o cabeçalho
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        # Por conexão (não fica gravado no banco): sem ele ON DELETE CASCADE não dispara
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(BUSY_TIMEOUT_SECONDS * 1000)}")
         
     def connect(self) -> sqlite3.Connection:
         """Estabelece conexão com o banco de dados."""
         if self.conn is None:
-            self.conn = sqlite3.connect(str(self.db_path))
+            self.conn = sqlite3.connect(str(self.db_path), timeout=BUSY_TIMEOUT_SECONDS)
             self.conn.row_factory = sqlite3.Row  # Permite acesso por nome de coluna
+            self.configure_connection(self.conn)
+            # Conexão nova não tem transação aberta: momento seguro para o ATTACH
+            self.attach_archive()
         return self.conn
     
     def close(self):
         """Fecha a conexão com o banco de dados."""
+        self.disable_write_queue()
         if self.conn:
             self.conn.close()
             self.conn = None
+        self._archive_attached = False
+        self._schema_columns = {}
+
+    def attach_archive(self, create: bool = False) -> bool:
+        """
+        Anexa (ATTACH) o banco de arquivo como schema `archive`.
+        ATTACH falha dentro de uma transação: nesse caso nada é feito e a
+        leitura fica restrita ao banco principal até a próxima chamada.
+        
+        Args:
+            create: Cria o arquivo se ainda não existir (usado pelo Archiver)
+            
+        Returns:
+            True se o arquivo está anexado
+        """
+        if self._archive_attached:
+            return True
+        if not create and not self.archive_path.exists():
+            return False
+        conn = self.connect()
+        if conn.in_transaction:
+            return False
+        self.archive_path.parent.mkdir(parents=True, exist_ok=True)
+        conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (str(self.archive_path),))
+        self._archive_attached = True
+        return True
+
+    def ensure_in_main(
+        self,
+        conversation_id: Optional[str] = None,
+        message_id: Optional[str] = None
+    ) -> bool:
+        """
+        Garante que a conversa (ou a conversa da mensagem) está no banco principal
+        antes de uma escrita: se estiver arquivada, é restaurada (mensagens, anexos
+        e conversa juntos), para que triggers de `updated_at` e `usage_daily` a encontrem.
+        Verificação e restauração formam um único job de escrita (`write_job`),
+        então é seguro chamar de qualquer thread com a fila de escrita ativa.
+        
+        Returns:
+            True se a conversa foi restaurada do arquivo
+        """
+        if not self.archive_path.exists():
+            return False
+        # Import tardio: archive importa database
+        from archive import Archiver
+        archiver = Archiver(self)
+        return self.write_job(
+            lambda conn: archiver.restore_archived(conn, conversation_id, message_id)
+        )
+
+    def schemas(self, include_archived: bool = True) -> List[str]:
+        """
+        Schemas consultados pelas APIs de listagem e busca.
+        
+        Args:
+            include_archived: Inclui o banco de arquivo (federação transparente)
+            
+        Returns:
+            ['main'] ou ['main', 'archive']
+        """
+        if include_archived and self.attach_archive():
+            return ['main', ARCHIVE_SCHEMA]
+        return ['main']
+
+    def schema_columns(self, schema: str, table: str) -> Tuple[str, ...]:
+        """Colunas de uma tabela num schema (em cache; vazio se a tabela não existir)."""
+        key = (schema, table)
+        if key not in self._schema_columns:
+            rows = self.connect().execute(f"PRAGMA {schema}.table_info({table})").fetchall()
+            self._schema_columns[key] = tuple(row['name'] for row in rows)
+        return self._schema_columns[key]
+
+    def forget_columns(self, schema: Optional[str] = None):
+        """Descarta o cache de colunas (após ALTER TABLE)."""
+        self._schema_columns = {
+            key: value for key, value in self._schema_columns.items()
+            if schema is not None and key[0] != schema
+        }
+
+    def table_columns(self, table: str) -> Tuple[str, ...]:
+        """Colunas de uma tabela do banco principal (em cache)."""
+        columns = self.schema_columns('main', table)
+        if not columns:
+            raise ValueError(f"Tabela desconhecida: {table}")
+        return columns
+
+    def select_list(
+        self,
+        schema: str,
+        table: str,
+        columns: Optional[Sequence[str]] = None,
+        prefix: str = ''
+    ) -> str:
+        """
+        Lista explícita de colunas para um SELECT federado: segue a ordem do banco
+        principal e completa com NULL as colunas que um arquivo antigo ainda não tem,
+        então o UNION ALL continua válido depois de migrações.
+        
+        Args:
+            schema: Schema consultado ('main' ou 'archive')
+            table: Nome da tabela
+            columns: Colunas desejadas (padrão: todas as do banco principal)
+            prefix: Alias da tabela na consulta (ex: 'm.')
+        """
+        present = set(self.schema_columns(schema, table))
+        return ', '.join(
+            f"{prefix}{column}" if column in present else f"NULL AS {column}"
+            for column in (columns or self.table_columns(table))
+        )
+
+    def iter_records(
+        self,
+        table: str,
+        where: str,
+        params: Sequence[Any],
+        order_by: str,
+        columns: Optional[Sequence[str]] = None,
+        exclude: Sequence[str] = (),
+        include_archived: bool = False,
+        batch_size: int = ITER_BATCH_SIZE
+    ) -> Iterator[Any]:
+        """
+        Itera linhas de uma tabela sob demanda (fetchmany), como namedtuples.
+        
+        Args:
+            table: Nome da tabela
+            where: Condição SQL (com placeholders)
+            params: Parâmetros da condição
+            order_by: Coluna de ordenação (com ASC/DESC); não precisa estar projetada
+            columns: Colunas a retornar (None para todas)
+            exclude: Colunas a omitir (ex: 'content', 'meta_info')
+            include_archived: Federa os bancos de arquivo
+            batch_size: Linhas por fetchmany
+            
+        Returns:
+            Iterador de registros com as colunas projetadas (a consulta e a
+            validação das colunas ocorrem na chamada; as linhas, sob demanda)
+        """
+        available = self.table_columns(table)
+        selected = tuple(columns) if columns is not None else available
+        unknown = [c for c in list(selected) + list(exclude) if c not in available]
+        if unknown:
+            raise ValueError(f"Colunas desconhecidas em {table}: {', '.join(unknown)}")
+        selected = tuple(c for c in selected if c not in exclude)
+        if not selected:
+            raise ValueError("Nenhuma coluna selecionada")
+
+        order_column = order_by.split()[0]
+        inner_columns = selected if order_column in selected else selected + (order_column,)
+        schemas = self.schemas(include_archived)
+        inner = " UNION ALL ".join(
+            f"SELECT {self.select_list(schema, table, inner_columns)} FROM {schema}.{table} WHERE {where}"
+            for schema in schemas
+        )
+        sql = f"SELECT {', '.join(selected)} FROM ({inner}) ORDER BY {order_by}"
+
+        record = record_type(table, selected)
+        cursor = self.connect().cursor()
+        # Tuplas cruas: evita o custo de sqlite3.Row antes de montar o registro
+        cursor.row_factory = None
+        cursor.execute(sql, list(params) * len(schemas))
+
+        def generate():
+            try:
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield record._make(row)
+            finally:
+                cursor.close()
+
+        return generate()
+
+    @property
+    def maintenance(self) -> 'MaintenanceScheduler':
+        """Agendador de manutenção (ANALYZE/optimize/incremental vacuum) deste banco."""
+        if self._maintenance is None:
+            from maintenance import MaintenanceScheduler
+            self._maintenance = MaintenanceScheduler(self)
+        return self._maintenance
+
+    @property
+    def stream_flusher(self) -> 'StreamFlusher':
+        """Thread única que faz os checkpoints por tempo dos streams abertos (com a fila de escrita)."""
+        if self._stream_flusher is None:
+            self._stream_flusher = StreamFlusher()
+        return self._stream_flusher
+
+    def enable_write_queue(self, max_batch: int = 512, max_delay: float = 0.0):
+        """
+        Ativa o escritor único: escritas de qualquer thread passam a ser
+        agrupadas em transações compartilhadas (group commit).
+
+        Args:
+            max_batch: Máximo de pedidos por transação
+            max_delay: Tempo extra (segundos) para acumular pedidos antes do commit
+        """
+        if self.write_queue is None:
+            self.write_queue = WriteQueue(self.db_path, max_batch, max_delay, self.archive_path)
+            self.write_queue.start()
+
+    def disable_write_queue(self):
+        """Esvazia a fila de escrita e encerra a thread escritora."""
+        if self.write_queue is not None:
+            self.write_queue.stop()
+            self.write_queue = None
+
+    def write(self, sql: str, params: Sequence[Any] = ()) -> int:
+        """
+        Executa uma instrução de escrita e aguarda o commit.
+
+        Args:
+            sql: Instrução SQL (INSERT/UPDATE/DELETE)
+            params: Parâmetros da instrução
+
+        Returns:
+            Número de linhas afetadas
+        """
+        return self.write_many([(sql, params)])
+
+    def write_many(self, statements: List[Statement]) -> int:
+        """
+        Executa várias instruções numa única transação atômica.
+
+        Args:
+            statements: Lista de (sql, parâmetros)
+
+        Returns:
+            Número total de linhas afetadas
+        """
+        if self.write_queue is not None:
+            rowcount = self.write_queue.submit(statements).result()
+        else:
+            conn = self.connect()
+            rowcount = 0
+            with conn:
+                for sql, params in statements:
+                    rowcount += conn.execute(sql, params).rowcount
+        self._notify_commit()
+        return rowcount
+
+    def write_job(self, job: WriteJob) -> Any:
+        """
+        Executa `job(conn)` numa transação de escrita e aguarda o commit.
+        Com a fila ativa o job roda na thread escritora (conexão dela, em group
+        commit); sem a fila, na conexão principal. Nas duas o arquivo está anexado.
+
+        Args:
+            job: Função que recebe a conexão já dentro da transação
+
+        Returns:
+            Retorno do job
+        """
+        if self.write_queue is not None:
+            result = self.write_queue.submit_job(job).result()
+        else:
+            conn = self.connect()
+            self.attach_archive()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = job(conn)
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        self._notify_commit()
+        return result
+
+    def _notify_commit(self):
+        with self.commits:
+            self.commit_count += 1
+            self.commits.notify_all()
     
-    def initialize_schema(self, schema_path: str = "execution/schema.sql"):
+    def initialize_schema(self, schema_path: str = str(SCHEMA_PATH)):
         """
         Inicializa o schema do banco de dados.
         
@@ -48,7 +584,29 @@ class Database:
         with open(schema_path, 'r', encoding='utf-8') as f:
             schema_sql = f.read()
         conn.executescript(schema_sql)
+        conn.execute(f"PRAGMA user_version = {self._schema_version(schema_sql)}")
         conn.commit()
+    
+    def ensure_schema(self, schema_path: str = str(SCHEMA_PATH)):
+        """
+        Aplica o schema apenas se ele mudou desde a última inicialização.
+        A versão (CRC32 do schema.sql) fica em `PRAGMA user_version`, então
+        comandos curtos não reexecutam o script a cada invocação.
+        
+        Args:
+            schema_path: Caminho para o arquivo schema.sql
+        """
+        with open(schema_path, 'r', encoding='utf-8') as f:
+            schema_sql = f.read()
+        conn = self.connect()
+        current = conn.execute("PRAGMA user_version").fetchone()[0]
+        if current != self._schema_version(schema_sql):
+            self.initialize_schema(schema_path)
+    
+    @staticmethod
+    def _schema_version(schema_sql: str) -> int:
+        # user_version é um inteiro de 32 bits com sinal
+        return zlib.crc32(schema_sql.encode('utf-8')) & 0x7FFFFFFF
 
 
 class Project:
@@ -75,15 +633,13 @@ class Project:
             UUID do projeto criado
         """
         project_id = str(uuid.uuid4())
-        conn = self.db.connect()
-        conn.execute(
+        self.db.write(
             """
             INSERT INTO projects (id, name, description, global_instructions)
             VALUES (?, ?, ?, ?)
             """,
             (project_id, name, description, global_instructions)
         )
-        conn.commit()
         return project_id
     
     def get(self, project_id: str) -> Optional[Dict[str, Any]]:
@@ -102,6 +658,18 @@ class Project:
         ).fetchall()
         return [dict(row) for row in rows]
 
+    def iter_all(
+        self,
+        columns: Optional[Sequence[str]] = None,
+        exclude: Sequence[str] = (),
+        batch_size: int = ITER_BATCH_SIZE
+    ) -> Iterator[Any]:
+        """Variante em streaming de `list_all` (namedtuples, colunas opcionais)."""
+        return self.db.iter_records(
+            'projects', "1", (), "created_at DESC",
+            columns=columns, exclude=exclude, batch_size=batch_size
+        )
+
 
 class Conversation:
     """Modelo para a entidade Conversation."""
@@ -129,44 +697,87 @@ class Conversation:
             UUID da conversa criada
         """
         conversation_id = str(uuid.uuid4())
-        conn = self.db.connect()
-        conn.execute(
+        self.db.write(
             """
             INSERT INTO conversations (id, project_id, provider, model, title)
             VALUES (?, ?, ?, ?, ?)
             """,
             (conversation_id, project_id, provider, model, title)
         )
-        conn.commit()
         return conversation_id
     
     def get(self, conversation_id: str) -> Optional[Dict[str, Any]]:
-        """Busca uma conversa por ID."""
+        """Busca uma conversa por ID (inclusive em bancos de arquivo)."""
         conn = self.db.connect()
-        row = conn.execute(
-            "SELECT * FROM conversations WHERE id = ?", (conversation_id,)
-        ).fetchone()
-        return dict(row) if row else None
+        for schema in self.db.schemas():
+            row = conn.execute(
+                f"SELECT {self.db.select_list(schema, 'conversations')} "
+                f"FROM {schema}.conversations WHERE id = ?",
+                (conversation_id,)
+            ).fetchone()
+            if row:
+                return dict(row)
+        return None
     
-    def list_by_project(self, project_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    def list_by_project(
+        self,
+        project_id: Optional[str] = None,
+        include_archived: bool = True
+    ) -> List[Dict[str, Any]]:
         """
         Lista conversas de um projeto específico ou sem projeto.
         
         Args:
             project_id: ID do projeto (None para conversas sem projeto)
+            include_archived: Inclui conversas movidas para bancos de arquivo
         """
         conn = self.db.connect()
+        schemas = self.db.schemas(include_archived)
         if project_id is None:
-            rows = conn.execute(
-                "SELECT * FROM conversations WHERE project_id IS NULL ORDER BY updated_at DESC"
-            ).fetchall()
+            condition, params = "project_id IS NULL", []
         else:
-            rows = conn.execute(
-                "SELECT * FROM conversations WHERE project_id = ? ORDER BY updated_at DESC",
-                (project_id,)
-            ).fetchall()
+            condition, params = "project_id = ?", [project_id]
+        sql = " UNION ALL ".join(
+            f"SELECT {self.db.select_list(schema, 'conversations')} "
+            f"FROM {schema}.conversations WHERE {condition}"
+            for schema in schemas
+        )
+        rows = conn.execute(
+            sql + " ORDER BY updated_at DESC", params * len(schemas)
+        ).fetchall()
         return [dict(row) for row in rows]
 
+    def iter_by_project(
+        self,
+        project_id: Optional[str] = None,
+        include_archived: bool = True,
+        columns: Optional[Sequence[str]] = None,
+        exclude: Sequence[str] = (),
+        batch_size: int = ITER_BATCH_SIZE
+    ) -> Iterator[Any]:
+        """
+        Variante em streaming de `list_by_project`.
+        
+        Args:
+            project_id: ID do projeto (None para conversas sem projeto)
+            include_archived: Inclui conversas movidas para bancos de arquivo
+            columns: Colunas a retornar (None para todas)
+            exclude: Colunas a omitir
+            batch_size: Linhas por fetchmany
+            
+        Yields:
+            Namedtuples `ConversationsRecord`
+        """
+        if project_id is None:
+            where, params = "project_id IS NULL", ()
+        else:
+            where, params = "project_id = ?", (project_id,)
+        return self.db.iter_records(
+            'conversations', where, params, "updated_at DESC",
+            columns=columns, exclude=exclude,
+            include_archived=include_archived, batch_size=batch_size
+        )
+
 
 class Message:
     """Modelo para a entidade Message."""
@@ -179,7 +790,8 @@ class Message:
         conversation_id: str,
         role: str,
         content: str,
-        meta_info: Optional[Dict[str, Any]] = None
+        meta_info: Optional[Dict[str, Any]] = None,
+        timestamp: Optional[str] = None
     ) -> str:
         """
         Cria uma nova mensagem.
@@ -189,30 +801,391 @@ class Message:
             role: 'user', 'assistant', ou 'system'
             content: Conteúdo da mensagem
             meta_info: Metadados opcionais (tokens, latência, etc.)
+            timestamp: Horário ISO 8601 (UTC) da mensagem; padrão agora.
+                Importadores passam o original da exportação (dia de `usage_daily`,
+                `updated_at` da conversa e arquivamento seguem a data real)
             
         Returns:
             UUID da mensagem criada
         """
         message_id = str(uuid.uuid4())
-        timestamp = datetime.utcnow().isoformat() + 'Z'
+        timestamp = timestamp or datetime.utcnow().isoformat() + 'Z'
         meta_json = json.dumps(meta_info) if meta_info else None
         
-        conn = self.db.connect()
-        conn.execute(
+        # Conversa arquivada volta ao banco principal antes de receber a mensagem
+        self.db.ensure_in_main(conversation_id)
+        self.db.write(
             """
             INSERT INTO messages (id, conversation_id, role, content, timestamp, meta_info)
             VALUES (?, ?, ?, ?, ?, ?)
             """,
             (message_id, conversation_id, role, content, timestamp, meta_json)
         )
-        conn.commit()
         return message_id
     
+    def begin_stream(
+        self,
+        conversation_id: str,
+        role: str = 'assistant',
+        meta_info: Optional[Dict[str, Any]] = None,
+        checkpoint_interval: float = 0.5,
+        checkpoint_chars: int = 2048
+    ) -> 'MessageStream':
+        """
+        Inicia uma mensagem recebida em streaming (token a token).
+        
+        Args:
+            conversation_id: ID da conversa
+            role: 'user', 'assistant', ou 'system'
+            meta_info: Metadados iniciais (mesclados na finalização)
+            checkpoint_interval: Intervalo máximo (segundos) entre checkpoints
+            checkpoint_chars: Máximo de caracteres em buffer antes de um checkpoint
+            
+        Returns:
+            MessageStream para anexar chunks e finalizar
+        """
+        message_id = str(uuid.uuid4())
+        timestamp = datetime.utcnow().isoformat() + 'Z'
+        meta = dict(meta_info or {})
+        meta['streaming'] = True
+        
+        self.db.ensure_in_main(conversation_id)
+        self.db.write_many([
+            (
+                """
+                INSERT INTO messages (id, conversation_id, role, content, timestamp, meta_info)
+                VALUES (?, ?, ?, '', ?, ?)
+                """,
+                (message_id, conversation_id, role, timestamp, json.dumps(meta))
+            ),
+            ("INSERT INTO message_streams (message_id) VALUES (?)", (message_id,)),
+        ])
+        return MessageStream(
+            self.db, message_id, meta_info, checkpoint_interval, checkpoint_chars
+        )
+    
+    def recover_streams(self, stale_after: float = STREAM_STALE_SECONDS) -> List[str]:
+        """
+        Reconstrói mensagens cujo streaming foi interrompido (ex: crash).
+        O conteúdo salvo nos checkpoints é consolidado em `messages.content`
+        e a mensagem é marcada com `interrupted` em meta_info.
+        
+        Args:
+            stale_after: Segundos sem heartbeat para considerar o stream
+                abandonado (0 na inicialização de um processo único)
+        
+        Returns:
+            IDs das mensagens recuperadas
+        """
+        conn = self.db.connect()
+        message_ids = [
+            row['message_id'] for row in conn.execute(
+                "SELECT message_id FROM message_streams WHERE last_heartbeat_at <= datetime('now', ?)",
+                (f"-{stale_after} seconds",)
+            ).fetchall()
+        ]
+        for message_id in message_ids:
+            chunks = conn.execute(
+                "SELECT content FROM message_chunks WHERE message_id = ? ORDER BY seq",
+                (message_id,)
+            ).fetchall()
+            row = conn.execute(
+                "SELECT meta_info FROM messages WHERE id = ?", (message_id,)
+            ).fetchone()
+            meta = json.loads(row['meta_info']) if row and row['meta_info'] else {}
+            meta.pop('streaming', None)
+            meta['interrupted'] = True
+            self.db.write_many([
+                (
+                    "UPDATE messages SET content = ?, meta_info = ? WHERE id = ?",
+                    (''.join(chunk['content'] for chunk in chunks), json.dumps(meta), message_id)
+                ),
+                ("DELETE FROM message_chunks WHERE message_id = ?", (message_id,)),
+                ("DELETE FROM message_streams WHERE message_id = ?", (message_id,)),
+            ])
+        return message_ids
+    
     def list_by_conversation(self, conversation_id: str) -> List[Dict[str, Any]]:
         """Lista todas as mensagens de uma conversa ordenadas por timestamp."""
         conn = self.db.connect()
+        schemas = self.db.schemas()
+        sql = " UNION ALL ".join(
+            f"SELECT {self.db.select_list(schema, 'messages')} "
+            f"FROM {schema}.messages WHERE conversation_id = ?"
+            for schema in schemas
+        )
         rows = conn.execute(
-            "SELECT * FROM messages WHERE conversation_id = ? ORDER BY timestamp ASC",
-            (conversation_id,)
+            sql + " ORDER BY timestamp ASC", [conversation_id] * len(schemas)
         ).fetchall()
         return [dict(row) for row in rows]
+
+    def iter_by_conversation(
+        self,
+        conversation_id: str,
+        columns: Optional[Sequence[str]] = None,
+        exclude: Sequence[str] = (),
+        batch_size: int = ITER_BATCH_SIZE
+    ) -> Iterator[Any]:
+        """
+        Variante em streaming de `list_by_conversation`: as linhas são lidas
+        sob demanda e só as colunas pedidas são materializadas.
+        
+        Args:
+            conversation_id: ID da conversa
+            columns: Colunas a retornar (None para todas)
+            exclude: Colunas a omitir (ex: ('content', 'meta_info') para listar só metadados)
+            batch_size: Linhas por fetchmany
+            
+        Yields:
+            Namedtuples `MessagesRecord`
+        """
+        return self.db.iter_records(
+            'messages', "conversation_id = ?", (conversation_id,), "timestamp ASC",
+            columns=columns, exclude=exclude, include_archived=True, batch_size=batch_size
+        )
+    
+    def search(
+        self,
+        query: str,
+        limit: int = 50,
+        include_archived: bool = True
+    ) -> List[Dict[str, Any]]:
+        """
+        Busca mensagens cujo conteúdo contém o texto (sem diferenciar maiúsculas).
+        
+        Args:
+            query: Texto a buscar
+            limit: Máximo de resultados
+            include_archived: Inclui mensagens em bancos de arquivo
+            
+        Returns:
+            Mensagens com o título da conversa, das mais recentes para as mais antigas
+        """
+        pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        conn = self.db.connect()
+        schemas = self.db.schemas(include_archived)
+        sql = " UNION ALL ".join(
+            f"""
+            SELECT {self.db.select_list(schema, 'messages', prefix='m.')},
+                   c.title AS conversation_title
+            FROM {schema}.messages m
+            JOIN {schema}.conversations c ON c.id = m.conversation_id
+            WHERE m.content LIKE ? ESCAPE '\\'
+            """
+            for schema in schemas
+        )
+        rows = conn.execute(
+            sql + " ORDER BY timestamp DESC LIMIT ?", [pattern] * len(schemas) + [limit]
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+
+class MessageStream:
+    """
+    Mensagem em streaming: acumula chunks em memória e grava checkpoints
+    incrementais em `message_chunks` a cada `checkpoint_interval` segundos ou
+    `checkpoint_chars` caracteres. Cada checkpoint grava apenas o trecho novo,
+    então o custo de escrita por chunk é constante (não reescreve o conteúdo todo).
+
+    Com a WriteQueue ativa (escritas de qualquer thread), o `StreamFlusher` do banco
+    (uma thread para todos os streams) chama `flush_if_due()` periodicamente: chunks
+    parados no buffer são gravados mesmo se o provedor demorar a enviar o próximo,
+    e o heartbeat é renovado. Sem a fila, o chamador pode chamar `flush_if_due()`.
+    """
+    
+    def __init__(
+        self,
+        db: Database,
+        message_id: str,
+        meta_info: Optional[Dict[str, Any]],
+        checkpoint_interval: float,
+        checkpoint_chars: int
+    ):
+        self.db = db
+        self.message_id = message_id
+        self.meta_info = dict(meta_info or {})
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoint_chars = checkpoint_chars
+        self.checkpoints = 0
+        self.chunk_count = 0
+        self.finalized = False
+        
+        self._parts: List[str] = []
+        self._pending: List[str] = []
+        self._pending_chars = 0
+        self._started_at = time.monotonic()
+        self._first_chunk_at: Optional[float] = None
+        self._last_chunk_at = self._started_at
+        self._last_checkpoint_at = self._started_at
+        self._lock = threading.RLock()
+        self._flusher: Optional[StreamFlusher] = None
+        if db.write_queue is not None:
+            self._flusher = db.stream_flusher
+            self._flusher.add(self)
+    
+    def append(self, chunk: str):
+        """Anexa um chunk recebido do provedor."""
+        with self._lock:
+            if self.finalized:
+                raise RuntimeError("Stream já finalizado")
+            if not chunk:
+                return
+            now = time.monotonic()
+            if self._first_chunk_at is None:
+                self._first_chunk_at = now
+            self._last_chunk_at = now
+            self._parts.append(chunk)
+            self._pending.append(chunk)
+            self._pending_chars += len(chunk)
+            self.chunk_count += 1
+            
+            if (self._pending_chars >= self.checkpoint_chars
+                    or now - self._last_checkpoint_at >= self.checkpoint_interval):
+                self.checkpoint()
+    
+    def checkpoint(self):
+        """Grava no banco os chunks ainda não persistidos (e renova o heartbeat)."""
+        with self._lock:
+            if not self._pending:
+                return
+            self.db.write_many([
+                (
+                    "INSERT INTO message_chunks (message_id, seq, content) VALUES (?, ?, ?)",
+                    (self.message_id, self.checkpoints + 1, ''.join(self._pending))
+                ),
+                (
+                    "UPDATE message_streams SET last_heartbeat_at = datetime('now') WHERE message_id = ?",
+                    (self.message_id,)
+                ),
+            ])
+            self.checkpoints += 1
+            self._pending = []
+            self._pending_chars = 0
+            self._last_checkpoint_at = time.monotonic()
+    
+    def flush_if_due(self) -> bool:
+        """
+        Checkpoint por tempo, para streams parados entre chunks: grava o buffer se
+        `checkpoint_interval` expirou; sem buffer, renova o heartbeat a cada
+        STREAM_HEARTBEAT_SECONDS (enquanto chegaram chunks nos últimos
+        STREAM_STALE_SECONDS; um stream abandonado deixa de parecer vivo).
+        
+        Returns:
+            True se algo foi gravado
+        """
+        with self._lock:
+            if self.finalized:
+                return False
+            now = time.monotonic()
+            if now - self._last_checkpoint_at < self.checkpoint_interval:
+                return False
+            if self._pending:
+                self.checkpoint()
+                return True
+            if (now - self._last_checkpoint_at >= STREAM_HEARTBEAT_SECONDS
+                    and now - self._last_chunk_at < STREAM_STALE_SECONDS):
+                self.db.write(
+                    "UPDATE message_streams SET last_heartbeat_at = datetime('now') WHERE message_id = ?",
+                    (self.message_id,)
+                )
+                self._last_checkpoint_at = now
+                return True
+            return False
+    
+    @property
+    def abandoned(self) -> bool:
+        """Sem chunks há 2 x STREAM_STALE_SECONDS e sem finalize: a recuperação assume daqui."""
+        return time.monotonic() - self._last_chunk_at >= 2 * STREAM_STALE_SECONDS
+    
+    @property
+    def content(self) -> str:
+        """Conteúdo recebido até o momento."""
+        return ''.join(self._parts)
+    
+    def finalize(self, meta_info: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Consolida o conteúdo final na mensagem e remove os checkpoints.
+        
+        Args:
+            meta_info: Metadados adicionais (ex: tokens informados pelo provedor)
+            
+        Returns:
+            UUID da mensagem
+        """
+        with self._lock:
+            if self.finalized:
+                return self.message_id
+            finished_at = time.monotonic()
+            meta = dict(self.meta_info)
+            meta.update(meta_info or {})
+            meta['latency_ms'] = round((finished_at - self._started_at) * 1000, 1)
+            if self._first_chunk_at is not None:
+                meta['first_token_ms'] = round((self._first_chunk_at - self._started_at) * 1000, 1)
+            meta['chunks'] = self.chunk_count
+            
+            self.db.write_many([
+                (
+                    "UPDATE messages SET content = ?, meta_info = ? WHERE id = ?",
+                    (self.content, json.dumps(meta), self.message_id)
+                ),
+                ("DELETE FROM message_chunks WHERE message_id = ?", (self.message_id,)),
+                ("DELETE FROM message_streams WHERE message_id = ?", (self.message_id,)),
+            ])
+            self.finalized = True
+            self._pending = []
+            if self._flusher is not None:
+                self._flusher.discard(self)
+            return self.message_id
+
+
+class StreamFlusher:
+    """
+    Checkpoints por tempo dos streams abertos com uma única thread (em vez de uma
+    por stream). A thread acorda a cada menor `checkpoint_interval` entre os
+    streams registrados e termina sozinha quando não resta nenhum.
+    """
+
+    def __init__(self):
+        self._streams: List[MessageStream] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, stream: MessageStream):
+        with self._lock:
+            self._streams.append(stream)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="nextmind-stream-flush", daemon=True
+                )
+                self._thread.start()
+
+    def discard(self, stream: MessageStream):
+        with self._lock:
+            if stream in self._streams:
+                self._streams.remove(stream)
+
+    @property
+    def active(self) -> int:
+        """Streams registrados."""
+        with self._lock:
+            return len(self._streams)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._streams:
+                    self._thread = None
+                    return
+                interval = min(stream.checkpoint_interval for stream in self._streams)
+            time.sleep(interval)
+            with self._lock:
+                streams = list(self._streams)
+            for stream in streams:
+                if stream.finalized or stream.abandoned:
+                    self.discard(stream)
+                    continue
+                try:
+                    stream.flush_if_due()
+                except Exception:
+                    # Os chunks continuam no buffer: o próximo append/finalize tenta de novo
+                    pass
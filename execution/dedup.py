@@ -0,0 +1,307 @@
+"""
+Detecção de conversas quase-duplicadas do NextMind (MinHash + LSH).
+
+Importar históricos do ChatGPT e do Claude (e reexportações) gera muitas
+cópias quase idênticas. Comparar todos os pares é quadrático; aqui cada
+conversa recebe uma assinatura MinHash na importação e é indexada em bandas
+LSH no SQLite. Só conversas que colidem em alguma banda são comparadas, então
+listar os clusters custa aproximadamente o número de conversas.
+
+A assinatura usa one-permutation hashing: um único hash por shingle, dividido
+em NUM_PERM faixas, em vez de NUM_PERM permutações — O(shingles) por conversa.
+Faixas vazias (conversas curtas) são preenchidas copiando outra faixa numa
+ordem fixa por faixa (densificação), igual para todas as conversas.
+
+Conversas criadas fora dos importadores (chat, `Message.create`) são indexadas
+sob demanda em `clusters()`; um trigger descarta a assinatura quando a conversa
+recebe mensagens novas.
+"""
+import random
+import re
+import struct
+import zlib
+from hashlib import blake2b
+from typing import Optional, List, Dict, Any, Iterable, Sequence
+from database import Database, Conversation, Message
+from archive import Archiver
+
+
+# 16 bandas x 8 linhas: pares com similaridade de Jaccard ~0.7 colidem com 50% de chance
+NUM_PERM = 128
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+
+# Tamanho dos shingles (n-gramas de palavras)
+SHINGLE_SIZE = 3
+
+# Similaridade estimada mínima para considerar duas conversas duplicadas
+DEFAULT_THRESHOLD = 0.8
+
+# Primo maior que 2^32 para o hash (a * x + b) mod P; os 7 bits baixos escolhem a faixa
+_PRIME = (1 << 61) - 1
+_BIN_BITS = NUM_PERM.bit_length() - 1
+_BIN_MASK = NUM_PERM - 1
+_rng = random.Random(0x6E6D)  # Semente fixa: assinaturas estáveis entre execuções
+_A = _rng.randrange(1, _PRIME)
+_B = _rng.randrange(0, _PRIME)
+# Ordem em que cada faixa vazia procura uma faixa preenchida para copiar
+_DENSIFY = [_rng.sample(range(NUM_PERM), NUM_PERM) for _ in range(NUM_PERM)]
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def shingles(texts: Iterable[str]) -> set:
+    """
+    Conjunto de n-gramas de palavras (hash CRC32) do texto da conversa.
+
+    Args:
+        texts: Conteúdo das mensagens
+
+    Returns:
+        Hashes dos shingles
+    """
+    words = _WORD_RE.findall(' '.join(t for t in texts if t).lower())
+    if len(words) < SHINGLE_SIZE:
+        return {zlib.crc32(w.encode('utf-8')) for w in words}
+    return {
+        zlib.crc32(' '.join(words[i:i + SHINGLE_SIZE]).encode('utf-8'))
+        for i in range(len(words) - SHINGLE_SIZE + 1)
+    }
+
+
+def minhash(hashes: set) -> List[int]:
+    """Assinatura MinHash (mínimo de cada uma das NUM_PERM faixas) de um conjunto não vazio."""
+    bins: List[Optional[int]] = [None] * NUM_PERM
+    for x in hashes:
+        h = (_A * x + _B) % _PRIME
+        slot = h & _BIN_MASK
+        value = h >> _BIN_BITS
+        current = bins[slot]
+        if current is None or value < current:
+            bins[slot] = value
+    signature = []
+    for slot, value in enumerate(bins):
+        if value is None:
+            value = next(bins[j] for j in _DENSIFY[slot] if bins[j] is not None)
+        signature.append(value)
+    return signature
+
+
+def band_buckets(signature: Sequence[int]) -> List[int]:
+    """Hash de 64 bits (com sinal, cabe em INTEGER) de cada banda da assinatura."""
+    buckets = []
+    for band in range(BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = blake2b(struct.pack(f'<{ROWS_PER_BAND}Q', *rows), digest_size=8).digest()
+        buckets.append(int.from_bytes(digest, 'little', signed=True))
+    return buckets
+
+
+def similarity(sig_a: Sequence[int], sig_b: Sequence[int]) -> float:
+    """Similaridade de Jaccard estimada pela fração de posições iguais."""
+    return sum(1 for a, b in zip(sig_a, sig_b) if a == b) / NUM_PERM
+
+
+class DuplicateIndex:
+    """Índice LSH incremental de conversas e listagem de clusters de duplicatas."""
+
+    def __init__(self, db: Database, threshold: float = DEFAULT_THRESHOLD):
+        """
+        Args:
+            db: Instância do Database
+            threshold: Similaridade estimada mínima para agrupar conversas
+        """
+        self.db = db
+        self.threshold = threshold
+
+    def add(self, conversation_id: str, texts: Iterable[str]) -> bool:
+        """
+        Indexa (ou reindexa) uma conversa a partir do conteúdo das mensagens.
+
+        Returns:
+            False se a conversa não tem texto para indexar
+        """
+        hashes = shingles(texts)
+        if not hashes:
+            return False
+        signature = minhash(hashes)
+        statements = [
+            ("DELETE FROM lsh_buckets WHERE conversation_id = ?", (conversation_id,)),
+            (
+                """
+                INSERT OR REPLACE INTO conversation_signatures (conversation_id, signature, shingle_count)
+                VALUES (?, ?, ?)
+                """,
+                (conversation_id, struct.pack(f'<{NUM_PERM}Q', *signature), len(hashes))
+            ),
+        ]
+        statements.extend(
+            (
+                "INSERT OR IGNORE INTO lsh_buckets (band, bucket, conversation_id) VALUES (?, ?, ?)",
+                (band, bucket, conversation_id)
+            )
+            for band, bucket in enumerate(band_buckets(signature))
+        )
+        self.db.write_many(statements)
+        return True
+
+    def remove(self, conversation_id: str):
+        """Remove uma conversa do índice."""
+        self.db.write_many([
+            ("DELETE FROM lsh_buckets WHERE conversation_id = ?", (conversation_id,)),
+            ("DELETE FROM conversation_signatures WHERE conversation_id = ?", (conversation_id,)),
+        ])
+
+    def index_missing(self) -> int:
+        """
+        Indexa conversas ainda sem assinatura (bancos anteriores ao índice,
+        conversas criadas pelo chat ou que receberam mensagens novas).
+
+        Returns:
+            Número de conversas indexadas
+        """
+        conn = self.db.connect()
+        message_model = Message(self.db)
+        indexed = 0
+        for schema in self.db.schemas():
+            rows = conn.execute(
+                f"""
+                SELECT id FROM {schema}.conversations c
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM conversation_signatures s WHERE s.conversation_id = c.id
+                )
+                """
+            ).fetchall()
+            for row in rows:
+                messages = message_model.iter_by_conversation(row['id'], columns=('content',))
+                if self.add(row['id'], (m.content for m in messages)):
+                    indexed += 1
+        return indexed
+
+    def _signature(self, conversation_id: str) -> Optional[List[int]]:
+        row = self.db.connect().execute(
+            "SELECT signature FROM conversation_signatures WHERE conversation_id = ?",
+            (conversation_id,)
+        ).fetchone()
+        return list(struct.unpack(f'<{NUM_PERM}Q', row['signature'])) if row else None
+
+    def clusters(self) -> List[List[str]]:
+        """
+        Agrupa conversas quase-duplicadas.
+
+        Conversas ainda sem assinatura são indexadas antes. Apenas conversas que
+        compartilham um bucket são comparadas (cada membro contra o primeiro do
+        bucket); os pares confirmados são unidos (union-find).
+
+        Returns:
+            Clusters com 2+ conversas, cada um ordenado pelo ID
+        """
+        self.index_missing()
+        conn = self.db.connect()
+        parent: Dict[str, str] = {}
+
+        def find(x: str) -> str:
+            while parent.setdefault(x, x) != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        signatures: Dict[str, Optional[List[int]]] = {}
+
+        def signature(conversation_id: str) -> Optional[List[int]]:
+            if conversation_id not in signatures:
+                signatures[conversation_id] = self._signature(conversation_id)
+            return signatures[conversation_id]
+
+        buckets = conn.execute(
+            """
+            SELECT group_concat(conversation_id, ' ') AS members
+            FROM lsh_buckets
+            GROUP BY band, bucket
+            HAVING COUNT(*) > 1
+            """
+        )
+        for row in buckets:
+            members = row['members'].split(' ')
+            first = members[0]
+            for other in members[1:]:
+                if find(first) == find(other):
+                    continue
+                sig_a, sig_b = signature(first), signature(other)
+                if sig_a and sig_b and similarity(sig_a, sig_b) >= self.threshold:
+                    parent[find(other)] = find(first)
+
+        groups: Dict[str, List[str]] = {}
+        for conversation_id in parent:
+            groups.setdefault(find(conversation_id), []).append(conversation_id)
+
+        # Descarta entradas de conversas que não existem mais
+        conversation_model = Conversation(self.db)
+        clusters = []
+        for members in groups.values():
+            alive = sorted(m for m in members if conversation_model.get(m) is not None)
+            if len(alive) > 1:
+                clusters.append(alive)
+        return sorted(clusters)
+
+    def _message_count(self, conversation_id: str) -> int:
+        conn = self.db.connect()
+        return sum(
+            conn.execute(
+                f"SELECT COUNT(*) FROM {schema}.messages WHERE conversation_id = ?",
+                (conversation_id,)
+            ).fetchone()[0]
+            for schema in self.db.schemas()
+        )
+
+    def merge(self, cluster: Sequence[str], keep: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Mantém uma conversa do cluster e remove as demais.
+
+        Args:
+            cluster: IDs das conversas duplicadas
+            keep: Conversa a manter (padrão: a com mais mensagens; empate, a mais antiga)
+
+        Returns:
+            Dict com `kept` e `removed`
+        """
+        conversation_model = Conversation(self.db)
+        conversations = [c for c in (conversation_model.get(cid) for cid in cluster) if c]
+        if keep is None:
+            keep = min(
+                conversations,
+                key=lambda c: (-self._message_count(c['id']), c['created_at'], c['id'])
+            )['id']
+
+        archiver = Archiver(self.db)
+        removed = []
+        for conv in conversations:
+            if conv['id'] == keep:
+                continue
+            # Duplicatas arquivadas voltam ao banco principal para serem removidas
+            archiver.restore_conversation(conv['id'])
+            self.db.write_many([
+                (
+                    """
+                    DELETE FROM message_attachments WHERE message_id IN (
+                        SELECT id FROM messages WHERE conversation_id = ?
+                    )
+                    """,
+                    (conv['id'],)
+                ),
+                ("DELETE FROM messages WHERE conversation_id = ?", (conv['id'],)),
+                ("DELETE FROM conversations WHERE id = ?", (conv['id'],)),
+                ("DELETE FROM lsh_buckets WHERE conversation_id = ?", (conv['id'],)),
+                ("DELETE FROM conversation_signatures WHERE conversation_id = ?", (conv['id'],)),
+            ])
+            removed.append(conv['id'])
+        return {'kept': keep, 'removed': removed}
+
+    def merge_all(self) -> Dict[str, Any]:
+        """Aplica `merge` a todos os clusters encontrados."""
+        results = [self.merge(cluster) for cluster in self.clusters()]
+        return {
+            'clusters': len(results),
+            'conversations_removed': sum(len(r['removed']) for r in results),
+            'merges': results
+        }
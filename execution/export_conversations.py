@@ -0,0 +1,85 @@
+"""
+Exportador de conversas do NextMind.
+Grava conversas e mensagens num arquivo JSON, uma conversa por vez (sem carregar o banco inteiro).
+"""
+import json
+import time
+from pathlib import Path
+from typing import Dict, Optional
+from database import Database, Message
+from logger import get_execution_logger
+from profiling import Profiler, phase
+
+
+def export_conversations(
+    db: Database,
+    output_path: str,
+    project_id: Optional[str] = None
+) -> Dict[str, int]:
+    """
+    Exporta conversas para JSON.
+
+    Args:
+        db: Instância do Database
+        output_path: Caminho do arquivo JSON de saída
+        project_id: Exporta apenas este projeto (None para todas as conversas)
+
+    Returns:
+        Estatísticas da exportação
+    """
+    logger = get_execution_logger()
+    start_time = time.time()
+    with Profiler("export_conversations.py") as profiler:
+
+        conn = db.connect()
+        # Inclui as conversas movidas para bancos de arquivo
+        schemas = db.schemas()
+        condition, params = ("1", []) if project_id is None else ("project_id = ?", [project_id])
+        conversations = conn.execute(
+            " UNION ALL ".join(
+                f"SELECT {db.select_list(schema, 'conversations')} "
+                f"FROM {schema}.conversations WHERE {condition}"
+                for schema in schemas
+            ) + " ORDER BY created_at ASC",
+            params * len(schemas)
+        )
+        message_model = Message(db)
+        stats = {'conversations_exported': 0, 'messages_exported': 0}
+
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write('[')
+            # Cursor iterado sob demanda: só a conversa atual fica na memória
+            for conv in conversations:
+                messages = []
+                with phase('read'):
+                    for msg in message_model.iter_by_conversation(
+                        conv['id'], columns=('role', 'content', 'timestamp', 'meta_info')
+                    ):
+                        messages.append({
+                            'role': msg.role,
+                            'content': msg.content,
+                            'timestamp': msg.timestamp,
+                            'meta_info': json.loads(msg.meta_info) if msg.meta_info else None
+                        })
+
+                record = dict(conv)
+                record['messages'] = messages
+                with phase('write'):
+                    if stats['conversations_exported']:
+                        f.write(',')
+                    f.write('\n' + json.dumps(record, ensure_ascii=False))
+
+                stats['conversations_exported'] += 1
+                stats['messages_exported'] += len(messages)
+            f.write('\n]\n')
+
+        logger.log(
+            script_name="export_conversations.py",
+            inputs={"output_path": output_path, "project_id": project_id},
+            outputs=stats,
+            duration_seconds=time.time() - start_time,
+            status="success",
+            profile=profiler.stop()
+        )
+        return stats
@@ -0,0 +1,445 @@
+"""
+Leitura de exportações de conversas (ChatGPT e Claude) para o NextMind.
+Aceita o `conversations.json` extraído ou o `.zip` da exportação: o JSON é lido
+em streaming direto do membro do zip (sem extrair para o disco) e as conversas
+são decodificadas uma a uma, sem carregar o array inteiro na memória.
+`run_import` é o driver comum dos importadores de cada formato.
+"""
+import io
+import json
+import time
+import zipfile
+from itertools import chain
+from typing import Dict, Any, Iterator, Iterable, TextIO, BinaryIO, Optional, Callable, List, Tuple
+from database import Database, Conversation, Message
+from logger import get_execution_logger
+from blob_store import Attachment
+from dedup import DuplicateIndex
+from profiling import Profiler, phase
+
+
+CONVERSATIONS_MEMBER = 'conversations.json'
+
+
+class ConversationsFile:
+    """
+    Stream de texto do `conversations.json`, dono também do zip de onde foi aberto.
+    `close()` (ou o `with`) fecha os dois.
+    """
+
+    def __init__(self, stream: TextIO, archive: Optional[zipfile.ZipFile] = None):
+        self.stream = stream
+        self.archive = archive
+
+    def read(self, size: int = -1) -> str:
+        return self.stream.read(size)
+
+    def close(self):
+        try:
+            self.stream.close()
+        finally:
+            if self.archive is not None:
+                self.archive.close()
+
+    def __enter__(self) -> 'ConversationsFile':
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_conversations_file(path: str) -> ConversationsFile:
+    """
+    Abre o `conversations.json` de uma exportação (arquivo JSON ou zip).
+
+    Args:
+        path: Caminho do conversations.json ou do .zip exportado
+
+    Returns:
+        ConversationsFile posicionado no início do JSON
+    """
+    if not zipfile.is_zipfile(path):
+        return ConversationsFile(open(path, 'r', encoding='utf-8'))
+
+    archive = zipfile.ZipFile(path)
+    members = [
+        name for name in archive.namelist()
+        if name.rsplit('/', 1)[-1] == CONVERSATIONS_MEMBER
+    ]
+    if not members:
+        archive.close()
+        raise FileNotFoundError(f"{CONVERSATIONS_MEMBER} não encontrado em {path}")
+    # O membro mais próximo da raiz do zip é o da exportação
+    member = min(members, key=lambda name: name.count('/'))
+    return ConversationsFile(io.TextIOWrapper(archive.open(member), encoding='utf-8'), archive)
+
+
+class ExportFiles:
+    """Arquivos anexos dentro do zip da exportação, indexados pelo ID do arquivo."""
+
+    def __init__(self, archive: zipfile.ZipFile):
+        self.archive = archive
+        self._index: Dict[str, zipfile.ZipInfo] = {}
+        for info in archive.infolist():
+            if info.is_dir():
+                continue
+            basename = info.filename.rsplit('/', 1)[-1]
+            self._index.setdefault(basename, info)
+            # ChatGPT: 'file-<id>-<nome>' ou 'file_<id>-<nome>'
+            if basename.startswith('file-'):
+                self._index.setdefault('-'.join(basename.split('-')[:2]), info)
+            elif basename.startswith('file_'):
+                self._index.setdefault(basename.split('-')[0], info)
+
+    @classmethod
+    def open(cls, path: str) -> Optional['ExportFiles']:
+        """Abre os arquivos da exportação (None se `path` não for um zip)."""
+        if not zipfile.is_zipfile(path):
+            return None
+        return cls(zipfile.ZipFile(path))
+
+    def find(self, file_id: str) -> Optional[zipfile.ZipInfo]:
+        """
+        Localiza um arquivo pelo ID ou ponteiro ('file-service://file-abc').
+        """
+        return self._index.get(file_id.split('://', 1)[-1])
+
+    def open_member(self, info: zipfile.ZipInfo) -> BinaryIO:
+        """Stream descompactado do membro (lido em blocos pelo BlobStore)."""
+        return self.archive.open(info)
+
+    def close(self):
+        self.archive.close()
+
+
+def save_attachment(
+    attachment_model: Any,
+    message_id: str,
+    ref: Dict[str, Any],
+    export_files: Optional[ExportFiles]
+) -> bool:
+    """
+    Grava um anexo extraído pelos importadores no blob store.
+
+    Args:
+        attachment_model: Instância de blob_store.Attachment
+        message_id: ID da mensagem importada
+        ref: Dict com 'kind', 'name', 'mime_type' e 'text' (conteúdo inline) ou 'file_id'
+        export_files: Arquivos do zip da exportação (None para JSON avulso)
+
+    Returns:
+        True se o conteúdo foi encontrado e gravado
+    """
+    if ref.get('text') is not None:
+        attachment_model.create_from_bytes(
+            message_id, ref['text'].encode('utf-8'),
+            filename=ref.get('name'), mime_type=ref.get('mime_type'), kind=ref['kind']
+        )
+        return True
+
+    info = export_files.find(ref['file_id']) if export_files and ref.get('file_id') else None
+    if info is None:
+        return False
+    with export_files.open_member(info) as fp:
+        attachment_model.create(
+            message_id, fp,
+            filename=ref.get('name') or info.filename.rsplit('/', 1)[-1],
+            mime_type=ref.get('mime_type'), kind=ref['kind']
+        )
+    return True
+
+
+def iter_json_array(fp: TextIO, chunk_size: int = 1 << 20) -> Iterator[Any]:
+    """
+    Decodifica incrementalmente os itens de um array JSON de nível superior.
+
+    Args:
+        fp: Stream de texto contendo um array JSON
+        chunk_size: Caracteres lidos por vez (dobra enquanto um item não cabe no buffer)
+
+    Yields:
+        Cada item do array
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+    read_size = chunk_size
+
+    def fill():
+        nonlocal buf, pos, eof
+        with phase('read'):
+            chunk = fp.read(read_size)
+        if not chunk:
+            eof = True
+        buf = buf[pos:] + chunk
+        pos = 0
+
+    started = False
+    while True:
+        while pos < len(buf) and buf[pos] in ' \t\r\n':
+            pos += 1
+        if pos >= len(buf):
+            if eof:
+                raise ValueError("Array JSON incompleto")
+            fill()
+            continue
+
+        char = buf[pos]
+        if not started:
+            if char != '[':
+                raise ValueError("Esperado um array JSON de conversas")
+            started = True
+            pos += 1
+            continue
+        if char == ']':
+            return
+        if char == ',':
+            pos += 1
+            continue
+
+        try:
+            with phase('parse'):
+                item, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # Item maior que o buffer: lê mais (em blocos crescentes) e tenta de novo
+            fill()
+            read_size *= 2
+            continue
+        read_size = chunk_size
+        pos = end
+        yield item
+
+
+def iter_conversations(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Itera as conversas de uma exportação (JSON ou zip).
+    O arquivo é aberto imediatamente, então erros de leitura surgem na chamada.
+
+    Args:
+        path: Caminho do conversations.json ou do .zip exportado
+    """
+    fp = open_conversations_file(path)
+
+    def generate():
+        with fp:
+            yield from iter_json_array(fp)
+
+    return generate()
+
+
+class ImportSession:
+    """Estado de uma importação em andamento: modelos, arquivos do zip e estatísticas."""
+
+    def __init__(self, db: Database, project_id: Optional[str], export_files: Optional[ExportFiles]):
+        self.project_id = project_id
+        self.export_files = export_files
+        self.conversations = Conversation(db)
+        self.messages = Message(db)
+        self.attachments = Attachment(db)
+        self.duplicate_index = DuplicateIndex(db)
+        self.stats = {
+            'conversations_imported': 0,
+            'messages_imported': 0,
+            'conversations_skipped': 0,
+            'attachments_imported': 0,
+            'attachments_missing': 0
+        }
+
+    def save_attachments(self, message_id: str, refs: Iterable[Dict[str, Any]]):
+        """Grava os anexos de uma mensagem no blob store (deduplicado por hash)."""
+        for ref in refs:
+            if save_attachment(self.attachments, message_id, ref, self.export_files):
+                self.stats['attachments_imported'] += 1
+            else:
+                self.stats['attachments_missing'] += 1
+
+
+# Importa uma conversa: (conversation_id, título, textos das mensagens), ou None se ignorada
+ImportOne = Callable[[Dict[str, Any], ImportSession], Optional[Tuple[str, str, List[str]]]]
+
+
+def run_import(
+    script_name: str,
+    source_label: str,
+    import_one: ImportOne,
+    json_path: str,
+    db: Database,
+    project_id: Optional[str] = None,
+    conversations: Optional[Iterable[Dict[str, Any]]] = None,
+    profiler: Optional[Profiler] = None
+) -> Dict[str, int]:
+    """
+    Driver comum dos importadores: itera a exportação em streaming, chama
+    `import_one` por conversa, indexa as quase-duplicatas, roda a manutenção
+    pós-importação e registra a execução.
+
+    Erros de leitura (JSON inválido, zip corrompido, OSError, encoding) surgem
+    no meio da iteração: são registrados como "Failed to read JSON file" e
+    propagados. Os arquivos da exportação e o profiler são sempre fechados.
+
+    Args:
+        script_name: Nome do importador no log (ex: 'import_chatgpt.py')
+        source_label: Nome da origem nas mensagens ao usuário (ex: 'ChatGPT')
+        import_one: Importa uma conversa (ver `ImportOne`)
+        json_path: Caminho do conversations.json ou do .zip exportado
+        db: Instância do Database
+        project_id: ID do projeto para vincular (opcional)
+        conversations: Conversas já abertas por `import_conversations` (opcional)
+        profiler: Profiler já iniciado por `import_conversations` (opcional)
+
+    Returns:
+        Estatísticas da importação
+    """
+    logger = get_execution_logger()
+    start_time = time.time()
+    inputs = {"json_path": json_path, "project_id": project_id}
+    with (profiler or Profiler(script_name)) as active_profiler:
+        print(f"Importando conversas do {source_label} de: {json_path}\n")
+
+        data = conversations
+        export_files = None
+        try:
+            if data is None:
+                data = iter_conversations(json_path)
+            export_files = ExportFiles.open(json_path)
+            session = ImportSession(db, project_id, export_files)
+            for chat in data:
+                try:
+                    result = import_one(chat, session)
+                    if result is None:
+                        session.stats['conversations_skipped'] += 1
+                        continue
+                    conversation_id, title, texts = result
+
+                    # Assinatura MinHash / índice LSH para detectar quase-duplicatas
+                    with phase('index'):
+                        session.duplicate_index.add(conversation_id, texts)
+
+                    session.stats['conversations_imported'] += 1
+                    print(f"✓ Importada: {title} ({len(texts)} mensagens)")
+
+                except Exception as e:
+                    print(f"✗ Erro ao importar conversa: {e}")
+                    session.stats['conversations_skipped'] += 1
+
+        except Exception as e:
+            # Erros de uma conversa são tratados acima: o que chega aqui veio da leitura
+            logger.log(
+                script_name=script_name,
+                inputs=inputs,
+                outputs={},
+                duration_seconds=time.time() - start_time,
+                status="error",
+                error=f"Failed to read JSON file: {str(e)}",
+                profile=active_profiler.stop()
+            )
+            raise
+        finally:
+            if export_files is not None:
+                export_files.close()
+            close = getattr(data, 'close', None)
+            if close is not None:
+                close()
+
+        stats = session.stats
+        # Importação em massa: atualiza estatísticas do planner / recupera espaço se necessário.
+        # As conversas já foram gravadas: uma falha aqui não invalida a importação
+        try:
+            db.maintenance.record_changes(stats['conversations_imported'] + stats['messages_imported'])
+        except Exception as e:
+            print(f"⚠ Manutenção pós-importação falhou: {e}")
+            logger.log(
+                script_name=script_name,
+                inputs=inputs,
+                outputs=stats,
+                duration_seconds=time.time() - start_time,
+                status="error",
+                error=f"Post-import maintenance failed: {str(e)}"
+            )
+
+        print(f"\n=== Importação Concluída ===")
+        print(f"Conversas importadas: {stats['conversations_imported']}")
+        print(f"Mensagens importadas: {stats['messages_imported']}")
+        print(f"Conversas ignoradas: {stats['conversations_skipped']}")
+        print(f"Anexos importados: {stats['attachments_imported']}")
+
+        logger.log(
+            script_name=script_name,
+            inputs=inputs,
+            outputs=stats,
+            duration_seconds=time.time() - start_time,
+            status="success",
+            profile=active_profiler.stop()
+        )
+        return stats
+
+
+def detect_export_format(conversation: Dict[str, Any]) -> str:
+    """
+    Identifica a origem de uma conversa exportada.
+
+    Returns:
+        'chatgpt' (árvore `mapping`) ou 'claude' (lista `chat_messages`)
+    """
+    if 'mapping' in conversation:
+        return 'chatgpt'
+    if 'chat_messages' in conversation:
+        return 'claude'
+    raise ValueError("Formato de exportação não reconhecido")
+
+
+def import_conversations(
+    path: str,
+    db: Database,
+    project_id: Optional[str] = None,
+    source: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Ponto de entrada único de importação: detecta o formato e delega ao importador.
+
+    Args:
+        path: Caminho do conversations.json ou do .zip exportado
+        db: Instância do Database
+        project_id: ID do projeto para vincular (opcional)
+        source: 'chatgpt' ou 'claude' (None para detectar automaticamente)
+
+    Returns:
+        Estatísticas da importação, com o formato em `source`
+    """
+    # Iniciado antes da primeira leitura; o importador o encerra e registra no log.
+    # O `with` o encerra também se a leitura ou a detecção do formato falhar
+    with Profiler("import_conversations.py") as profiler:
+        conversations = iter_conversations(path)
+        if source is None:
+            first = next(conversations, None)
+            if first is None:
+                return {
+                    'source': None,
+                    'conversations_imported': 0,
+                    'messages_imported': 0,
+                    'conversations_skipped': 0,
+                    'attachments_imported': 0,
+                    'attachments_missing': 0
+                }
+            try:
+                source = detect_export_format(first)
+            except ValueError:
+                conversations.close()
+                raise
+            conversations = chain([first], conversations)
+
+        if source == 'chatgpt':
+            from import_chatgpt import import_chatgpt_conversations as importer
+        elif source == 'claude':
+            from import_claude import import_claude_conversations as importer
+        else:
+            conversations.close()
+            raise ValueError(f"Origem desconhecida: {source}")
+
+        stats = dict(importer(json_path=path, db=db, project_id=project_id,
+                              conversations=conversations, profiler=profiler))
+    stats['source'] = source
+    return stats
@@ -2,14 +2,11 @@
 Importador de conversas do ChatGPT para o NextMind.
 Lê o arquivo conversations.json exportado do ChatGPT e insere no banco de dados.
 """
-import json
-import uuid
-import time
 from datetime import datetime
-from pathlib import Path
-from typing import Dict, List, Any
-from database import Database, Conversation, Message
-from logger import get_execution_logger
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+from database import Database
+from import_archive import ImportSession, run_import
+from profiling import Profiler, phase
 
 
 def parse_chatgpt_timestamp(timestamp: float) -> str:
@@ -25,13 +22,61 @@ def parse_chatgpt_timestamp(timestamp: float) -> str:
     return datetime.utcfromtimestamp(timestamp).isoformat() + 'Z'
 
 
-def linearize_conversation(mapping: Dict[str, Any]) -> List[Dict[str, Any]]:
+def extract_attachments(message_data: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Extrai referências a arquivos de uma mensagem do ChatGPT.
+    Imagens aparecem como partes com `asset_pointer`; uploads em
+    `metadata.attachments`; imagens geradas por código em `metadata.aggregate_result`.
+    
+    Args:
+        message_data: Mensagem do ChatGPT
+        
+    Returns:
+        Lista de dicts com 'file_id', 'kind', 'name' e 'mime_type'
+    """
+    refs: Dict[str, Dict[str, Any]] = {}
+    
+    for part in message_data['content'].get('parts', []):
+        if isinstance(part, dict) and part.get('asset_pointer'):
+            file_id = part['asset_pointer'].split('://', 1)[-1]
+            refs.setdefault(file_id, {
+                'file_id': file_id, 'kind': 'image', 'name': None, 'mime_type': None
+            })
+    
+    metadata = message_data.get('metadata') or {}
+    for attachment in metadata.get('attachments') or []:
+        if not attachment.get('id'):
+            continue
+        mime_type = attachment.get('mimeType') or attachment.get('mime_type')
+        refs[attachment['id']] = {
+            'file_id': attachment['id'],
+            'kind': 'image' if mime_type and mime_type.startswith('image/') else 'file',
+            'name': attachment.get('name'),
+            'mime_type': mime_type
+        }
+    
+    aggregate = metadata.get('aggregate_result') or {}
+    for output in aggregate.get('messages') or []:
+        if output.get('message_type') == 'image' and output.get('image_url'):
+            file_id = output['image_url'].split('://', 1)[-1]
+            refs.setdefault(file_id, {
+                'file_id': file_id, 'kind': 'code_output', 'name': None, 'mime_type': None
+            })
+    
+    return list(refs.values())
+
+
+def linearize_conversation(
+    mapping: Dict[str, Any],
+    orphaned: Optional[List[Dict[str, Any]]] = None
+) -> List[Dict[str, Any]]:
     """
     Lineariza a estrutura em árvore do ChatGPT em uma lista ordenada.
     Segue o caminho principal (primeiro filho) ignorando branches.
     
     Args:
         mapping: Dicionário de nós do ChatGPT
+        orphaned: Recebe os anexos de ferramentas sem mensagem anterior (opcional)
         
     Returns:
         Lista de mensagens ordenadas cronologicamente
@@ -57,12 +102,32 @@ def linearize_conversation(mapping: Dict[str, Any]) -> List[Dict[str, Any]]:
         
         message_data = node.get('message')
         if message_data and message_data.get('content'):
-            content_parts = message_data['content'].get('parts', [])
-            if content_parts:
+            content = message_data['content']
+            content_parts = content.get('parts', [])
+            attachments = extract_attachments(message_data)
+            
+            if message_data['author']['role'] == 'tool':
+                # Saídas de ferramentas (ex: code interpreter) viram anexos da mensagem anterior
+                output = content.get('text') or '\n'.join(
+                    p for p in content_parts if isinstance(p, str)
+                )
+                if output:
+                    attachments.append({
+                        'kind': 'code_output',
+                        'text': output,
+                        'name': 'output.txt',
+                        'mime_type': 'text/plain'
+                    })
+                if messages:
+                    messages[-1]['attachments'].extend(attachments)
+                elif orphaned is not None:
+                    orphaned.extend(attachments)
+            elif content_parts:
                 messages.append({
                     'role': message_data['author']['role'],
-                    'content': '\n'.join(content_parts),
-                    'timestamp': message_data.get('create_time', 0)
+                    'content': '\n'.join(p for p in content_parts if isinstance(p, str)),
+                    'timestamp': message_data.get('create_time', 0),
+                    'attachments': attachments
                 })
         
         # Seguir para o primeiro filho
@@ -72,10 +137,54 @@ def linearize_conversation(mapping: Dict[str, Any]) -> List[Dict[str, Any]]:
     return messages
 
 
+def import_chat(chat: Dict[str, Any], session: ImportSession) -> Optional[Tuple[str, str, List[str]]]:
+    """
+    Importa uma conversa do ChatGPT (árvore `mapping`).
+    
+    Returns:
+        (conversation_id, título, textos das mensagens), ou None se não há mensagens
+    """
+    title = chat.get('title', 'Sem título')
+    
+    # Linearizar mensagens
+    orphaned: List[Dict[str, Any]] = []
+    with phase('linearize'):
+        messages = linearize_conversation(chat.get('mapping', {}), orphaned)
+    # Saídas de ferramenta antes da primeira mensagem não têm onde ficar
+    session.stats['attachments_missing'] += len(orphaned)
+    
+    if not messages:
+        return None
+    
+    with phase('write'):
+        conv_id = session.conversations.create(
+            provider='openai',
+            model='gpt-4',  # Assumindo GPT-4, pode ser refinado
+            title=title,
+            project_id=session.project_id
+        )
+        
+        for msg in messages:
+            message_id = session.messages.create(
+                conversation_id=conv_id,
+                role=msg['role'],
+                content=msg['content'],
+                meta_info=None,
+                timestamp=parse_chatgpt_timestamp(msg['timestamp']) if msg['timestamp'] else None
+            )
+            session.stats['messages_imported'] += 1
+            # Anexos: conteúdo vai para o blob store (deduplicado por hash)
+            session.save_attachments(message_id, msg['attachments'])
+    
+    return conv_id, title, [m['content'] for m in messages]
+
+
 def import_chatgpt_conversations(
     json_path: str,
     db: Database,
-    project_id: str = None
+    project_id: str = None,
+    conversations: Optional[Iterable[Dict[str, Any]]] = None,
+    profiler: Optional[Profiler] = None
 ) -> Dict[str, int]:
     """
     Importa conversas do arquivo JSON do ChatGPT.
@@ -84,94 +193,16 @@ def import_chatgpt_conversations(
         json_path: Caminho para conversations.json
         db: Instância do Database
         project_id: ID do projeto para vincular (opcional)
+        conversations: Conversas já abertas por `import_archive` (opcional)
+        profiler: Profiler já iniciado por `import_archive` (opcional)
         
     Returns:
         Estatísticas da importação
     """
-    logger = get_execution_logger()
-    start_time = time.time()
-    
-    print(f"Importando conversas do ChatGPT de: {json_path}\n")
-    
-    try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    except Exception as e:
-        duration = time.time() - start_time
-        logger.log(
-            script_name="import_chatgpt.py",
-            inputs={"json_path": json_path, "project_id": project_id},
-            outputs={},
-            duration_seconds=duration,
-            status="error",
-            error=f"Failed to read JSON file: {str(e)}"
-        )
-        raise
-    
-    conversation_model = Conversation(db)
-    message_model = Message(db)
-    
-    stats = {
-        'conversations_imported': 0,
-        'messages_imported': 0,
-        'conversations_skipped': 0
-    }
-    
-    for chat in data:
-        try:
-            # Extrair informações básicas
-            title = chat.get('title', 'Sem título')
-            mapping = chat.get('mapping', {})
-            
-            # Linearizar mensagens
-            messages = linearize_conversation(mapping)
-            
-            if not messages:
-                stats['conversations_skipped'] += 1
-                continue
-            
-            # Criar conversa
-            conv_id = conversation_model.create(
-                provider='openai',
-                model='gpt-4',  # Assumindo GPT-4, pode ser refinado
-                title=title,
-                project_id=project_id
-            )
-            
-            # Inserir mensagens
-            for msg in messages:
-                message_model.create(
-                    conversation_id=conv_id,
-                    role=msg['role'],
-                    content=msg['content'],
-                    meta_info=None
-                )
-                stats['messages_imported'] += 1
-            
-            stats['conversations_imported'] += 1
-            print(f"✓ Importada: {title} ({len(messages)} mensagens)")
-            
-        except Exception as e:
-            print(f"✗ Erro ao importar conversa: {e}")
-            stats['conversations_skipped'] += 1
-    
-    duration = time.time() - start_time
-    
-    print(f"\n=== Importação Concluída ===")
-    print(f"Conversas importadas: {stats['conversations_imported']}")
-    print(f"Mensagens importadas: {stats['messages_imported']}")
-    print(f"Conversas ignoradas: {stats['conversations_skipped']}")
-    
-    # Log execution
-    logger.log(
-        script_name="import_chatgpt.py",
-        inputs={"json_path": json_path, "project_id": project_id},
-        outputs=stats,
-        duration_seconds=duration,
-        status="success"
+    return run_import(
+        "import_chatgpt.py", "ChatGPT", import_chat, json_path, db,
+        project_id=project_id, conversations=conversations, profiler=profiler
     )
-    
-    return stats
 
 
 if __name__ == "__main__":
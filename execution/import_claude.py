@@ -2,19 +2,18 @@
 Importador de conversas do Claude para o NextMind.
 Lê o arquivo conversations.json exportado do Claude e insere no banco de dados.
 """
-import json
-import time
-from datetime import datetime
-from pathlib import Path
-from typing import Dict, List, Any
-from database import Database, Conversation, Message
-from logger import get_execution_logger
+from datetime import datetime, timezone
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+from database import Database
+from import_archive import ImportSession, run_import
+from profiling import Profiler, phase
 
 
 def parse_claude_timestamp(timestamp_str: str) -> str:
     """
     Converte timestamp do Claude para ISO 8601.
-    Claude já usa ISO 8601, então apenas valida.
+    Claude já usa ISO 8601, então apenas valida e normaliza para UTC
+    (o dia em `usage_daily` é o prefixo da string).
     
     Args:
         timestamp_str: String de timestamp do Claude
@@ -24,15 +23,88 @@ def parse_claude_timestamp(timestamp_str: str) -> str:
     """
     try:
         dt = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-        return dt.isoformat().replace('+00:00', 'Z')
+        if dt.tzinfo is not None:
+            dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+        return dt.isoformat() + 'Z'
     except:
         return datetime.utcnow().isoformat() + 'Z'
 
 
+def extract_attachments(msg: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Extrai os anexos de uma mensagem do Claude.
+    A exportação inclui apenas o texto extraído (`extracted_content`) dos uploads.
+    
+    Args:
+        msg: Mensagem do Claude
+        
+    Returns:
+        Lista de dicts com 'text', 'kind', 'name' e 'mime_type'
+    """
+    refs = []
+    for attachment in msg.get('attachments') or []:
+        if attachment.get('extracted_content'):
+            refs.append({
+                'kind': 'file',
+                'text': attachment['extracted_content'],
+                'name': attachment.get('file_name'),
+                'mime_type': attachment.get('file_type')
+            })
+    return refs
+
+
+def import_chat(chat: Dict[str, Any], session: ImportSession) -> Optional[Tuple[str, str, List[str]]]:
+    """
+    Importa uma conversa do Claude (lista `chat_messages`).
+    
+    Returns:
+        (conversation_id, título, textos das mensagens), ou None se não há mensagens
+    """
+    title = chat.get('name', 'Sem título')
+    messages_data = chat.get('chat_messages', [])
+    
+    if not messages_data:
+        return None
+    
+    with phase('write'):
+        conv_id = session.conversations.create(
+            provider='anthropic',
+            model='claude-3-opus',  # Assumindo Opus, pode ser refinado
+            title=title,
+            project_id=session.project_id
+        )
+        
+        for msg in messages_data:
+            sender = msg.get('sender', 'unknown')
+            
+            # Mapear sender do Claude para role padrão
+            if sender == 'human':
+                role = 'user'
+            elif sender == 'assistant':
+                role = 'assistant'
+            else:
+                role = 'system'
+            
+            message_id = session.messages.create(
+                conversation_id=conv_id,
+                role=role,
+                content=msg.get('text', ''),
+                meta_info=None,
+                timestamp=parse_claude_timestamp(msg.get('created_at', ''))
+            )
+            session.stats['messages_imported'] += 1
+            # Anexos: o Claude exporta apenas o texto extraído dos arquivos
+            session.save_attachments(message_id, extract_attachments(msg))
+    
+    return conv_id, title, [m.get('text', '') for m in messages_data]
+
+
 def import_claude_conversations(
     json_path: str,
     db: Database,
-    project_id: str = None
+    project_id: str = None,
+    conversations: Optional[Iterable[Dict[str, Any]]] = None,
+    profiler: Optional[Profiler] = None
 ) -> Dict[str, int]:
     """
     Importa conversas do arquivo JSON do Claude.
@@ -41,104 +113,16 @@ def import_claude_conversations(
         json_path: Caminho para conversations.json do Claude
         db: Instância do Database
         project_id: ID do projeto para vincular (opcional)
+        conversations: Conversas já abertas por `import_archive` (opcional)
+        profiler: Profiler já iniciado por `import_archive` (opcional)
         
     Returns:
         Estatísticas da importação
     """
-    logger = get_execution_logger()
-    start_time = time.time()
-    
-    print(f"Importando conversas do Claude de: {json_path}\n")
-    
-    try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-    except Exception as e:
-        duration = time.time() - start_time
-        logger.log(
-            script_name="import_claude.py",
-            inputs={"json_path": json_path, "project_id": project_id},
-            outputs={},
-            duration_seconds=duration,
-            status="error",
-            error=f"Failed to read JSON file: {str(e)}"
-        )
-        raise
-    
-    conversation_model = Conversation(db)
-    message_model = Message(db)
-    
-    stats = {
-        'conversations_imported': 0,
-        'messages_imported': 0,
-        'conversations_skipped': 0
-    }
-    
-    for chat in data:
-        try:
-            # Extrair informações básicas
-            title = chat.get('name', 'Sem título')
-            messages_data = chat.get('chat_messages', [])
-            
-            if not messages_data:
-                stats['conversations_skipped'] += 1
-                continue
-            
-            # Criar conversa
-            conv_id = conversation_model.create(
-                provider='anthropic',
-                model='claude-3-opus',  # Assumindo Opus, pode ser refinado
-                title=title,
-                project_id=project_id
-            )
-            
-            # Inserir mensagens
-            for msg in messages_data:
-                sender = msg.get('sender', 'unknown')
-                
-                # Mapear sender do Claude para role padrão
-                if sender == 'human':
-                    role = 'user'
-                elif sender == 'assistant':
-                    role = 'assistant'
-                else:
-                    role = 'system'
-                
-                content = msg.get('text', '')
-                timestamp = parse_claude_timestamp(msg.get('created_at', ''))
-                
-                message_model.create(
-                    conversation_id=conv_id,
-                    role=role,
-                    content=content,
-                    meta_info=None
-                )
-                stats['messages_imported'] += 1
-            
-            stats['conversations_imported'] += 1
-            print(f"✓ Importada: {title} ({len(messages_data)} mensagens)")
-            
-        except Exception as e:
-            print(f"✗ Erro ao importar conversa: {e}")
-            stats['conversations_skipped'] += 1
-    
-    duration = time.time() - start_time
-    
-    print(f"\n=== Importação Concluída ===")
-    print(f"Conversas importadas: {stats['conversations_imported']}")
-    print(f"Mensagens importadas: {stats['messages_imported']}")
-    print(f"Conversas ignoradas: {stats['conversations_skipped']}")
-    
-    # Log execution
-    logger.log(
-        script_name="import_claude.py",
-        inputs={"json_path": json_path, "project_id": project_id},
-        outputs=stats,
-        duration_seconds=duration,
-        status="success"
+    return run_import(
+        "import_claude.py", "Claude", import_chat, json_path, db,
+        project_id=project_id, conversations=conversations, profiler=profiler
     )
-    
-    return stats
 
 
 if __name__ == "__main__":
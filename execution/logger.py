@@ -30,6 +30,7 @@ class ExecutionLogger:
     - duration_seconds: Execution time
     - status: 'success' or 'error'
     - error: Error message if status is 'error'
+    - profile: Profiling summary (only when profiling is enabled, see profiling.py)
     """
     
     def __init__(self, log_dir: str = ".tmp/logs"):
@@ -53,7 +54,8 @@ class ExecutionLogger:
         outputs: Optional[Dict[str, Any]] = None,
         duration_seconds: Optional[float] = None,
         status: str = "success",
-        error: Optional[str] = None
+        error: Optional[str] = None,
+        profile: Optional[Dict[str, Any]] = None
     ):
         """
         Log an execution entry.
@@ -65,6 +67,7 @@ class ExecutionLogger:
             duration_seconds: Execution time
             status: 'success' or 'error'
             error: Error message if applicable
+            profile: Profiling summary (phases, memory, cProfile), if collected
         """
         entry = {
             "timestamp": datetime.utcnow().isoformat() + 'Z',
@@ -75,6 +78,8 @@ class ExecutionLogger:
             "status": status,
             "error": error
         }
+        if profile is not None:
+            entry["profile"] = profile
         
         with open(self.log_file, 'a', encoding='utf-8') as f:
             f.write(json.dumps(entry, ensure_ascii=False) + '\n')
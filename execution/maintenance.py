@@ -0,0 +1,200 @@
+"""
+Manutenção do banco de dados NextMind: ANALYZE / PRAGMA optimize e incremental vacuum.
+Executada automaticamente após operações em massa (importações, arquivamento) ou
+quando o intervalo configurado expira. Cada execução é registrada no ExecutionLogger.
+"""
+import json
+import time
+from typing import Optional, Dict, Any
+from database import Database
+from logger import ExecutionLogger, get_execution_logger
+
+
+# Chave em `settings` com o estado da manutenção: {"last_run": ..., "pending_changes": ...}
+SETTINGS_KEY = 'maintenance'
+
+# Valor de PRAGMA auto_vacuum para o modo incremental
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+class MaintenanceScheduler:
+    """Agenda e executa a manutenção do banco em passos limitados."""
+
+    def __init__(
+        self,
+        db: Database,
+        logger: Optional[ExecutionLogger] = None,
+        bulk_threshold: int = 1000,
+        interval_seconds: float = 24 * 3600,
+        vacuum_step_pages: int = 256,
+        vacuum_budget_seconds: float = 0.1,
+        change_retention_days: Optional[float] = 30
+    ):
+        """
+        Args:
+            db: Instância do Database
+            logger: ExecutionLogger (padrão: logger de execução do dia)
+            bulk_threshold: Linhas alteradas que disparam manutenção automática
+            interval_seconds: Intervalo máximo entre execuções agendadas
+            vacuum_step_pages: Páginas liberadas por passo de incremental vacuum
+            vacuum_budget_seconds: Tempo máximo gasto em vacuum por execução
+            change_retention_days: Idade máxima das entradas do change feed (None: sem limite)
+        """
+        self.db = db
+        self.logger = logger
+        self.bulk_threshold = bulk_threshold
+        self.interval_seconds = interval_seconds
+        self.vacuum_step_pages = vacuum_step_pages
+        self.vacuum_budget_seconds = vacuum_budget_seconds
+        self.change_retention_days = change_retention_days
+
+    def _state(self) -> Dict[str, Any]:
+        row = self.db.connect().execute(
+            "SELECT value FROM settings WHERE key = ?", (SETTINGS_KEY,)
+        ).fetchone()
+        state = json.loads(row['value']) if row else {}
+        state.setdefault('last_run', 0)
+        state.setdefault('pending_changes', 0)
+        return state
+
+    def _save_state(self, state: Dict[str, Any]):
+        self.db.write(
+            """
+            INSERT INTO settings (key, value, updated_at) VALUES (?, ?, datetime('now'))
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+            """,
+            (SETTINGS_KEY, json.dumps(state))
+        )
+
+    def _pragma(self, name: str) -> int:
+        return self.db.connect().execute(f"PRAGMA {name}").fetchone()[0]
+
+    def enable_incremental_vacuum(self) -> bool:
+        """
+        Converte o banco para auto_vacuum=INCREMENTAL (exige um VACUUM completo, uma vez).
+        Bancos novos já são criados nesse modo por `initialize_schema`.
+
+        Returns:
+            True se a conversão foi necessária
+        """
+        if self._pragma("auto_vacuum") == AUTO_VACUUM_INCREMENTAL:
+            return False
+        conn = self.db.connect()
+        conn.execute(f"PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}")
+        conn.execute("VACUUM")
+        return True
+
+    def record_changes(self, changed_rows: int) -> Optional[Dict[str, Any]]:
+        """
+        Registra uma operação em massa; dispara a manutenção ao atingir `bulk_threshold`.
+        O contador é persistido, então importações em processos distintos se acumulam.
+
+        Args:
+            changed_rows: Linhas inseridas/removidas pela operação
+
+        Returns:
+            Estatísticas da execução, ou None se a manutenção não foi disparada
+        """
+        # Incremento atômico no próprio UPDATE: importações concorrentes não perdem contagens
+        self.db.write(
+            """
+            INSERT INTO settings (key, value, updated_at)
+            VALUES (?, json_object('last_run', 0, 'pending_changes', ?), datetime('now'))
+            ON CONFLICT(key) DO UPDATE SET
+                value = json_set(
+                    value, '$.pending_changes',
+                    COALESCE(json_extract(value, '$.pending_changes'), 0) + ?
+                ),
+                updated_at = excluded.updated_at
+            """,
+            (SETTINGS_KEY, changed_rows, changed_rows)
+        )
+        if self._state()['pending_changes'] >= self.bulk_threshold:
+            return self.run(reason='bulk')
+        return None
+
+    def run_if_due(self) -> Optional[Dict[str, Any]]:
+        """Executa a manutenção se o intervalo desde a última execução expirou."""
+        if time.time() - self._state()['last_run'] >= self.interval_seconds:
+            return self.run(reason='schedule')
+        return None
+
+    def run(self, reason: str = 'manual') -> Dict[str, Any]:
+        """
+        Executa otimização de estatísticas, compactação do change feed e
+        incremental vacuum limitado.
+
+        Args:
+            reason: Motivo registrado no log ('manual', 'bulk', 'schedule')
+
+        Returns:
+            Estatísticas: durações, páginas livres e bytes recuperados
+        """
+        logger = self.logger or get_execution_logger()
+        conn = self.db.connect()
+        start_time = time.time()
+        page_size = self._pragma("page_size")
+        pages_before = self._pragma("page_count")
+        free_before = self._pragma("freelist_count")
+
+        try:
+            # Primeira execução: ANALYZE completo; depois, PRAGMA optimize decide o necessário
+            has_stats = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+            ).fetchone()
+            phase_start = time.time()
+            if has_stats:
+                conn.execute("PRAGMA analysis_limit = 1000")
+                conn.execute("PRAGMA optimize")
+            else:
+                conn.execute("ANALYZE")
+            conn.commit()
+            analyze_seconds = time.time() - phase_start
+
+            # Compactação do change feed antes do vacuum (as páginas liberadas entram nele)
+            from change_feed import ChangeFeed  # só quando a manutenção roda (cold start da CLI)
+            compacted = ChangeFeed(self.db).compact(self.change_retention_days)
+
+            # Incremental vacuum em passos pequenos, dentro do orçamento de tempo
+            phase_start = time.time()
+            vacuum_steps = 0
+            if self._pragma("auto_vacuum") == AUTO_VACUUM_INCREMENTAL:
+                while (self._pragma("freelist_count") > 0
+                       and time.time() - phase_start < self.vacuum_budget_seconds):
+                    conn.execute(f"PRAGMA incremental_vacuum({self.vacuum_step_pages})").fetchall()
+                    conn.commit()
+                    vacuum_steps += 1
+            vacuum_seconds = time.time() - phase_start
+        except Exception as e:
+            logger.log(
+                script_name="maintenance.py",
+                inputs={"db_path": str(self.db.db_path), "reason": reason},
+                outputs={},
+                duration_seconds=time.time() - start_time,
+                status="error",
+                error=str(e)
+            )
+            raise
+
+        pages_after = self._pragma("page_count")
+        stats = {
+            'reason': reason,
+            'analyze_seconds': round(analyze_seconds, 4),
+            'vacuum_seconds': round(vacuum_seconds, 4),
+            'vacuum_steps': vacuum_steps,
+            'changes_compacted': compacted['collapsed'] + compacted['expired'],
+            'freelist_pages_before': free_before,
+            'freelist_pages_after': self._pragma("freelist_count"),
+            'reclaimed_bytes': (pages_before - pages_after) * page_size,
+            'db_size_bytes': pages_after * page_size,
+        }
+        self._save_state({'last_run': time.time(), 'pending_changes': 0})
+
+        logger.log(
+            script_name="maintenance.py",
+            inputs={"db_path": str(self.db.db_path), "reason": reason},
+            outputs=stats,
+            duration_seconds=time.time() - start_time,
+            status="success"
+        )
+        return stats
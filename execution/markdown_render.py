@@ -0,0 +1,303 @@
+"""
+Renderizador de Markdown do NextMind (somente biblioteca padrão).
+
+Converte o conteúdo das mensagens em HTML sanitizado para a UI exibir sem
+parsing por mensagem:
+- Todo texto é escapado; HTML bruto do conteúdo nunca é repassado
+- Links só com http(s)/mailto
+- Blocos de código com realce por tokens (classes `tok-*`)
+- LaTeX não é renderizado aqui: vira `<span class="math-inline">` /
+  `<div class="math-display">` com a fonte em `data-tex`, prontos para o KaTeX
+
+Qualquer mudança na saída deve incrementar RENDERER_VERSION (invalida o cache).
+"""
+import html
+import re
+from typing import List, Tuple, Optional
+
+
+RENDERER_VERSION = 2
+
+_FENCE_RE = re.compile(r'^ {0,3}(`{3,}|~{3,})\s*([\w+#.-]*)')
+_HEADING_RE = re.compile(r'^ {0,3}(#{1,6})\s+(.*?)\s*#*\s*$')
+_HR_RE = re.compile(r'^ {0,3}([-*_])(\s*\1){2,}\s*$')
+_LIST_RE = re.compile(r'^(\s*)([-*+]|\d{1,9}[.)])\s+(.*)$')
+_QUOTE_RE = re.compile(r'^ {0,3}>\s?(.*)$')
+
+# Realce de código: famílias de linguagem -> (comentário de linha, palavras-chave)
+_C_LIKE_KEYWORDS = {
+    'break', 'case', 'catch', 'class', 'const', 'continue', 'default', 'do', 'else',
+    'enum', 'export', 'extends', 'false', 'finally', 'for', 'function', 'if', 'import',
+    'in', 'instanceof', 'interface', 'let', 'new', 'null', 'private', 'protected',
+    'public', 'return', 'static', 'struct', 'switch', 'this', 'throw', 'true', 'try',
+    'type', 'typeof', 'var', 'void', 'while', 'async', 'await', 'from', 'fn', 'func',
+    'go', 'impl', 'match', 'mut', 'package', 'pub', 'use', 'int', 'char', 'float',
+    'double', 'long', 'bool', 'string', 'undefined', 'yield',
+}
+_PYTHON_KEYWORDS = {
+    'and', 'as', 'assert', 'async', 'await', 'break', 'class', 'continue', 'def', 'del',
+    'elif', 'else', 'except', 'False', 'finally', 'for', 'from', 'global', 'if', 'import',
+    'in', 'is', 'lambda', 'None', 'nonlocal', 'not', 'or', 'pass', 'raise', 'return',
+    'True', 'try', 'while', 'with', 'yield',
+}
+_SHELL_KEYWORDS = {
+    'if', 'then', 'else', 'elif', 'fi', 'for', 'while', 'do', 'done', 'case', 'esac',
+    'function', 'in', 'export', 'local', 'return', 'echo', 'cd', 'sudo',
+}
+_SQL_KEYWORDS = {
+    'select', 'from', 'where', 'insert', 'into', 'values', 'update', 'set', 'delete',
+    'create', 'table', 'index', 'on', 'join', 'left', 'inner', 'group', 'by', 'order',
+    'having', 'limit', 'and', 'or', 'not', 'null', 'as', 'distinct', 'union', 'all',
+    'primary', 'key', 'begin', 'commit', 'trigger', 'with',
+}
+_LANGUAGES = {
+    'python': ('#', _PYTHON_KEYWORDS), 'py': ('#', _PYTHON_KEYWORDS),
+    'bash': ('#', _SHELL_KEYWORDS), 'sh': ('#', _SHELL_KEYWORDS),
+    'shell': ('#', _SHELL_KEYWORDS), 'zsh': ('#', _SHELL_KEYWORDS),
+    'sql': ('--', _SQL_KEYWORDS),
+    'json': (None, {'true', 'false', 'null'}),
+}
+for _name in ('javascript', 'js', 'jsx', 'typescript', 'ts', 'tsx', 'java', 'c', 'cpp',
+              'c++', 'cs', 'csharp', 'go', 'rust', 'rs', 'kotlin', 'swift', 'php'):
+    _LANGUAGES[_name] = ('//', _C_LIKE_KEYWORDS)
+
+_TOKEN_RES = {}
+
+
+def _token_re(line_comment: Optional[str]) -> 're.Pattern':
+    if line_comment not in _TOKEN_RES:
+        comments = r'/\*[\s\S]*?\*/'
+        if line_comment:
+            comments = re.escape(line_comment) + r'[^\n]*|' + comments
+        _TOKEN_RES[line_comment] = re.compile(
+            rf'(?P<comment>{comments})'
+            r'|(?P<string>"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|`(?:\\.|[^`\\])*`)'
+            r'|(?P<number>\b\d+(?:\.\d+)?\b)'
+            r'|(?P<word>\b[A-Za-z_][A-Za-z0-9_]*\b)'
+        )
+    return _TOKEN_RES[line_comment]
+
+
+def highlight(code: str, language: str) -> str:
+    """
+    Realce de sintaxe simples por tokens (comentários, strings, números, palavras-chave).
+
+    Returns:
+        HTML escapado; linguagens desconhecidas saem apenas escapadas
+    """
+    spec = _LANGUAGES.get(language.lower())
+    if spec is None:
+        return html.escape(code)
+    line_comment, keywords = spec
+    case_insensitive = keywords is _SQL_KEYWORDS
+    out = []
+    pos = 0
+    for match in _token_re(line_comment).finditer(code):
+        kind = match.lastgroup
+        text = match.group()
+        if kind == 'word':
+            if (text.lower() if case_insensitive else text) not in keywords:
+                continue
+            kind = 'keyword'
+        out.append(html.escape(code[pos:match.start()]))
+        out.append(f'<span class="tok-{kind}">{html.escape(text)}</span>')
+        pos = match.end()
+    out.append(html.escape(code[pos:]))
+    return ''.join(out)
+
+
+def _safe_url(url: str) -> Optional[str]:
+    url = url.strip()
+    if re.match(r'^(https?:|mailto:)', url, re.IGNORECASE):
+        return url
+    return None
+
+
+_INLINE_PROTECT_RE = re.compile(
+    r'(?P<code>`+)(?P<code_body>.+?)(?P=code)'
+    r'|\$\$(?P<display>.+?)\$\$'
+    r'|(?<![\\$\w])\$(?P<math>[^\s$](?:[^$\n]*?[^\s$])?)\$(?![\w$])'
+    r'|\\\((?P<paren_math>.+?)\\\)'
+    # URL com parênteses balanceados (um nível), como nos links da Wikipédia
+    r'|\[(?P<link_text>[^\]\n]+)\]\((?P<link_url>(?:[^()\s]|\([^()\s]*\))+)\)'
+)
+_EMPHASIS_RULES: List[Tuple['re.Pattern', str]] = [
+    # Como em `_`, `*` só marca ênfase em fronteira de palavra (`2*3*4` fica literal)
+    (re.compile(r'(?<!\w)\*\*(?=\S)(.+?)(?<=\S)\*\*(?!\w)'), r'<strong>\1</strong>'),
+    (re.compile(r'(?<!\w)__(?=\S)(.+?)(?<=\S)__(?!\w)'), r'<strong>\1</strong>'),
+    (re.compile(r'(?<!\w)\*(?=\S)(.+?)(?<=\S)\*(?!\w)'), r'<em>\1</em>'),
+    (re.compile(r'(?<!\w)_(?=\S)(.+?)(?<=\S)_(?!\w)'), r'<em>\1</em>'),
+    (re.compile(r'~~(?=\S)(.+?)(?<=\S)~~'), r'<del>\1</del>'),
+]
+
+
+def render_inline(text: str) -> str:
+    """Renderiza a marcação inline (código, LaTeX, links e ênfase) de um trecho."""
+    placeholders: List[str] = []
+
+    def protect(match: 're.Match') -> str:
+        if match.group('code') is not None:
+            rendered = f'<code>{html.escape(match.group("code_body").strip())}</code>'
+        elif match.group('display') is not None:
+            tex = html.escape(match.group('display').strip())
+            rendered = f'<span class="math-display" data-tex="{tex}">{tex}</span>'
+        elif match.group('link_text') is not None:
+            url = _safe_url(match.group('link_url'))
+            label = _emphasis(html.escape(match.group('link_text')))
+            if url is None:
+                rendered = label
+            else:
+                rendered = (f'<a href="{html.escape(url)}" rel="noopener noreferrer" '
+                            f'target="_blank">{label}</a>')
+        else:
+            tex = html.escape(match.group('math') or match.group('paren_math'))
+            rendered = f'<span class="math-inline" data-tex="{tex}">{tex}</span>'
+        placeholders.append(rendered)
+        return f'\x00{len(placeholders) - 1}\x00'
+
+    protected = _INLINE_PROTECT_RE.sub(protect, text.replace('\x00', ''))
+    rendered = _emphasis(html.escape(protected))
+    return re.sub(r'\x00(\d+)\x00', lambda m: placeholders[int(m.group(1))], rendered)
+
+
+def _emphasis(escaped: str) -> str:
+    for pattern, replacement in _EMPHASIS_RULES:
+        escaped = pattern.sub(replacement, escaped)
+    return escaped
+
+
+def render_markdown(text: str) -> str:
+    """
+    Converte Markdown em HTML sanitizado.
+
+    Args:
+        text: Conteúdo da mensagem
+
+    Returns:
+        Fragmento HTML (sem <html>/<body>)
+    """
+    return ''.join(_render_blocks(text.replace('\r\n', '\n').replace('\r', '\n').split('\n')))
+
+
+def _indent(line: str) -> int:
+    """Largura da indentação (tab = 4 colunas)."""
+    expanded = line.expandtabs(4)
+    return len(expanded) - len(expanded.lstrip(' '))
+
+
+def _dedent(line: str, width: int) -> str:
+    """Remove até `width` colunas de indentação."""
+    expanded = line.expandtabs(4)
+    return expanded[min(width, _indent(expanded)):]
+
+
+def _render_blocks(lines: List[str]) -> List[str]:
+    out: List[str] = []
+    paragraph: List[str] = []
+
+    def flush_paragraph():
+        if paragraph:
+            out.append('<p>' + '<br>'.join(render_inline(line.strip()) for line in paragraph) + '</p>')
+            paragraph.clear()
+
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+
+        fence = _FENCE_RE.match(line)
+        if fence:
+            flush_paragraph()
+            marker, language = fence.group(1), fence.group(2)
+            body = []
+            i += 1
+            while i < len(lines) and not lines[i].strip().startswith(marker):
+                body.append(lines[i])
+                i += 1
+            i += 1  # fence de fechamento (ou fim do texto)
+            css = f' class="language-{html.escape(language.lower())}"' if language else ''
+            out.append(f'<pre><code{css}>{highlight(chr(10).join(body), language)}</code></pre>')
+            continue
+
+        stripped = line.strip()
+        if stripped.startswith('$$') and '$$' not in stripped[2:]:
+            # Bloco LaTeX de várias linhas ($$ em uma linha só é tratado como inline)
+            flush_paragraph()
+            body = [stripped[2:]]
+            i += 1
+            while i < len(lines) and '$$' not in lines[i]:
+                body.append(lines[i])
+                i += 1
+            if i < len(lines):
+                body.append(lines[i].split('$$', 1)[0])
+            i += 1
+            tex = html.escape('\n'.join(body).strip())
+            out.append(f'<div class="math-display" data-tex="{tex}">{tex}</div>')
+            continue
+
+        heading = _HEADING_RE.match(line)
+        if heading:
+            flush_paragraph()
+            level = len(heading.group(1))
+            out.append(f'<h{level}>{render_inline(heading.group(2))}</h{level}>')
+            i += 1
+            continue
+
+        if _HR_RE.match(line):
+            flush_paragraph()
+            out.append('<hr>')
+            i += 1
+            continue
+
+        if _QUOTE_RE.match(line):
+            flush_paragraph()
+            quoted = []
+            while i < len(lines) and _QUOTE_RE.match(lines[i]):
+                quoted.append(_QUOTE_RE.match(lines[i]).group(1))
+                i += 1
+            out.append('<blockquote>' + ''.join(_render_blocks(quoted)) + '</blockquote>')
+            continue
+
+        item = _LIST_RE.match(line)
+        ordered = bool(item) and item.group(2)[0].isdigit()
+        start = int(item.group(2)[:-1]) if ordered else 1
+        # Como no CommonMark, só "1." interrompe um parágrafo (evita "2024. Foi...")
+        if item and (not paragraph or start == 1):
+            flush_paragraph()
+            tag = 'ol' if ordered else 'ul'
+            # Nível da lista: a indentação da primeira linha (sempre consumida)
+            level = _indent(line)
+            items: List[List[str]] = [[item.group(3)]]
+            i += 1
+            while i < len(lines):
+                current = _LIST_RE.match(lines[i])
+                if not lines[i].strip():
+                    break
+                indent = _indent(lines[i])
+                if current and indent <= level:
+                    if current.group(2)[0].isdigit() != ordered:
+                        break
+                    items.append([current.group(3)])
+                elif indent > level:
+                    # Continuação ou sublista: renderizada dentro do item, relativa ao nível
+                    items[-1].append(_dedent(lines[i], level + 2) if current else lines[i].strip())
+                else:
+                    break
+                i += 1
+            attrs = f' start="{start}"' if ordered and start != 1 else ''
+            rendered_items = []
+            for parts in items:
+                if len(parts) == 1:
+                    rendered_items.append(f'<li>{render_inline(parts[0])}</li>')
+                else:
+                    rendered_items.append('<li>' + ''.join(_render_blocks(parts)) + '</li>')
+            out.append(f'<{tag}{attrs}>' + ''.join(rendered_items) + f'</{tag}>')
+            continue
+
+        if not line.strip():
+            flush_paragraph()
+        else:
+            paragraph.append(line)
+        i += 1
+
+    flush_paragraph()
+    return out
@@ -0,0 +1,203 @@
+"""
+CLI unificada do NextMind (ponto de entrada chamado pela UI Electron).
+
+Uso:
+    python execution/nextmind.py [--db PATH] <comando> [args]
+
+Comandos: import, export, search, messages, attachment, stats, changes, duplicates,
+maintenance.
+Cada subcomando importa seus módulos apenas quando executado, para que os
+comandos curtos disparados pela UI iniciem rápido. O resultado é impresso em
+JSON na última linha do stdout; progresso e logs vão para o stderr.
+"""
+import argparse
+import json
+import os
+import sys
+from contextlib import redirect_stdout
+
+
+DEFAULT_DB_PATH = ".tmp/data/nextmind.db"
+
+
+def open_database(args):
+    """Abre o banco aplicando o schema somente se ele mudou."""
+    from database import Database
+    db = Database(args.db)
+    db.ensure_schema()
+    return db
+
+
+def cmd_import(args, db):
+    from import_archive import import_conversations
+    # Os importadores imprimem progresso; mantém o stdout só para o JSON final
+    with redirect_stdout(sys.stderr):
+        return import_conversations(args.path, db, project_id=args.project_id, source=args.source)
+
+
+def cmd_export(args, db):
+    from export_conversations import export_conversations
+    return export_conversations(db, args.output, project_id=args.project_id)
+
+
+def cmd_search(args, db):
+    from database import Message
+    return Message(db).search(args.query, limit=args.limit)
+
+
+def cmd_messages(args, db):
+    from render_cache import RenderCache
+    return RenderCache(db).page_by_conversation(args.conversation_id, offset=args.offset,
+                                                limit=args.limit)
+
+
+def cmd_attachment(args, db):
+    from blob_store import BlobStore
+    # Envia o blob cru para o stdout (sendfile, sem cópia); sem JSON de saída
+    sys.stdout.flush()
+    BlobStore.for_database(db).sendfile(args.hash, sys.stdout.fileno())
+    return None
+
+
+def cmd_stats(args, db):
+    from usage_stats import UsageStats
+    group_by = tuple(d for d in args.group_by.split(',') if d)
+    return UsageStats(db).query(args.start, args.end, group_by=group_by,
+                                provider=args.provider, model=args.model)
+
+
+def cmd_changes(args, db):
+    from change_feed import ChangeFeed
+    feed = ChangeFeed(db)
+    if args.wait:
+        return feed.wait(args.since, timeout=args.wait, limit=args.limit)
+    return feed.changes_since(args.since, limit=args.limit)
+
+
+def cmd_duplicates(args, db):
+    from dedup import DuplicateIndex
+    index = DuplicateIndex(db, threshold=args.threshold)
+    indexed = index.index_missing() if args.reindex else 0
+    if args.merge:
+        return dict(index.merge_all(), indexed=indexed)
+    return {'indexed': indexed, 'clusters': index.clusters()}
+
+
+def cmd_maintenance(args, db):
+    if args.action == 'optimize':
+        return db.maintenance.run()
+    if args.action == 'scheduled':
+        return db.maintenance.run_if_due() or {'skipped': True}
+    if args.action == 'enable-incremental-vacuum':
+        return {'converted': db.maintenance.enable_incremental_vacuum()}
+    if args.action == 'backfill-usage':
+        from usage_stats import backfill_usage
+        return backfill_usage(db)
+    if args.action == 'archive':
+        from archive import Archiver
+        return Archiver(db).archive_older_than(args.months)
+    if args.action == 'render':
+        from render_cache import RenderCache
+        return RenderCache(db).fill_pending(budget_seconds=args.budget)
+    if args.action == 'recover-streams':
+        from database import Message
+        return {'recovered': Message(db).recover_streams(stale_after=args.stale_after)}
+    rows = db.connect().execute("PRAGMA integrity_check").fetchall()
+    return {'integrity': [row[0] for row in rows]}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="nextmind", description="NextMind CLI")
+    parser.add_argument(
+        "--db", default=os.environ.get("DATABASE_PATH", DEFAULT_DB_PATH),
+        help="Caminho do banco SQLite (padrão: $DATABASE_PATH)"
+    )
+    parser.add_argument("--profile", action="store_true",
+                        help="Registra tempos por fase e memória (NEXTMIND_PROFILE=1)")
+    parser.add_argument("--cprofile", action="store_true",
+                        help="Como --profile, incluindo estatísticas do cProfile")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("import", help="Importa conversas exportadas")
+    p.add_argument("path", help="conversations.json ou .zip da exportação")
+    p.add_argument("--source", choices=["chatgpt", "claude"], default=None,
+                   help="Origem (padrão: detectar automaticamente)")
+    p.add_argument("--project-id", default=None)
+    p.set_defaults(handler=cmd_import)
+
+    p = sub.add_parser("export", help="Exporta conversas para JSON")
+    p.add_argument("output", help="Arquivo JSON de saída")
+    p.add_argument("--project-id", default=None)
+    p.set_defaults(handler=cmd_export)
+
+    p = sub.add_parser("search", help="Busca texto nas mensagens")
+    p.add_argument("query")
+    p.add_argument("--limit", type=int, default=50)
+    p.set_defaults(handler=cmd_search)
+
+    p = sub.add_parser("messages", help="Página de mensagens com HTML pré-renderizado")
+    p.add_argument("conversation_id")
+    p.add_argument("--offset", type=int, default=0)
+    p.add_argument("--limit", type=int, default=100)
+    p.set_defaults(handler=cmd_messages)
+
+    p = sub.add_parser("attachment", help="Escreve o conteúdo de um anexo no stdout")
+    p.add_argument("hash", help="SHA-256 do blob")
+    p.set_defaults(handler=cmd_attachment)
+
+    p = sub.add_parser("stats", help="Estatísticas de uso (rollups)")
+    p.add_argument("--start", default=None, help="Dia inicial (YYYY-MM-DD)")
+    p.add_argument("--end", default=None, help="Dia final (YYYY-MM-DD)")
+    p.add_argument("--group-by", default="day", help="Ex: day,provider,model | month | year")
+    p.add_argument("--provider", default=None)
+    p.add_argument("--model", default=None)
+    p.set_defaults(handler=cmd_stats)
+
+    p = sub.add_parser("changes", help="Alterações desde um seq (change feed)")
+    p.add_argument("--since", type=int, default=0, help="Último seq já processado")
+    p.add_argument("--limit", type=int, default=500)
+    p.add_argument("--wait", type=float, default=0,
+                   help="Aguarda até N segundos por novas alterações (long polling)")
+    p.set_defaults(handler=cmd_changes)
+
+    p = sub.add_parser("duplicates", help="Lista (ou mescla) conversas quase-duplicadas")
+    p.add_argument("--threshold", type=float, default=0.8, help="Similaridade mínima (0-1)")
+    p.add_argument("--reindex", action="store_true", help="Indexa conversas sem assinatura")
+    p.add_argument("--merge", action="store_true", help="Mantém uma conversa por cluster")
+    p.set_defaults(handler=cmd_duplicates)
+
+    p = sub.add_parser("maintenance", help="Tarefas de manutenção do banco")
+    p.add_argument("action", choices=[
+        "optimize", "scheduled", "enable-incremental-vacuum",
+        "integrity-check", "backfill-usage", "recover-streams", "archive", "render",
+    ])
+    p.add_argument("--months", type=int, default=12,
+                   help="archive: meses sem atividade para arquivar uma conversa")
+    p.add_argument("--budget", type=float, default=None,
+                   help="render: tempo máximo em segundos (padrão: até terminar)")
+    p.add_argument("--stale-after", type=float, default=300.0,
+                   help="recover-streams: segundos sem heartbeat para finalizar um stream")
+    p.set_defaults(handler=cmd_maintenance)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.profile or args.cprofile:
+        os.environ["NEXTMIND_PROFILE"] = "cprofile" if args.cprofile else "1"
+    db = open_database(args)
+    try:
+        result = args.handler(args, db)
+    except Exception as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+    finally:
+        db.close()
+    if result is not None:
+        print(json.dumps(result, ensure_ascii=False, default=str))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,207 @@
+"""
+Profiling opcional dos scripts de execução do NextMind.
+
+Ativado por `NEXTMIND_PROFILE=1` (ou `cprofile` para incluir o cProfile) ou pela
+flag `--profile` / `--cprofile` da CLI. Desativado, `phase()` é um context
+manager nulo e o custo da instrumentação é desprezível.
+
+Coleta:
+- Tempo por fase ('read', 'parse', 'linearize', 'write', ...)
+- Pico de RSS do processo e pico do tracemalloc, com as maiores alocações
+- Estatísticas do cProfile (opcional), também salvas em `.prof`
+
+O resumo vai para a entrada do ExecutionLogger (`profile`) e para um artefato
+JSON em `.tmp/profiles/`.
+"""
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+
+
+# Variável de ambiente que liga o profiling: '1' / 'true' ou 'cprofile'
+PROFILE_ENV = 'NEXTMIND_PROFILE'
+
+_NULL_PHASE = nullcontext()
+
+# Profiler ativo no processo (fases registradas por `phase()` vão para ele)
+_active: Optional['Profiler'] = None
+
+
+def phase(name: str):
+    """
+    Context manager que cronometra uma fase no profiler ativo (no-op se não houver).
+
+    Args:
+        name: Nome da fase ('read', 'parse', 'linearize', 'write', ...)
+    """
+    if _active is None:
+        return _NULL_PHASE
+    return _active.phase(name)
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """Pico de memória residente do processo (None se indisponível, ex: Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta em KiB; macOS, em bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Profiler:
+    """Coleta tempos por fase, memória e (opcionalmente) cProfile de uma execução."""
+
+    def __init__(
+        self,
+        script_name: str,
+        enabled: Optional[bool] = None,
+        cprofile: Optional[bool] = None,
+        top_allocations: int = 10,
+        artifact_dir: str = ".tmp/profiles"
+    ):
+        """
+        Args:
+            script_name: Nome do script (usado no artefato e no log)
+            enabled: Liga o profiling (padrão: variável NEXTMIND_PROFILE)
+            cprofile: Inclui o cProfile (padrão: NEXTMIND_PROFILE=cprofile)
+            top_allocations: Quantidade de maiores alocações do tracemalloc
+            artifact_dir: Diretório dos artefatos de profiling
+        """
+        mode = os.environ.get(PROFILE_ENV, '').strip().lower()
+        self.script_name = script_name
+        self.cprofile = cprofile if cprofile is not None else mode == 'cprofile'
+        self.enabled = (enabled if enabled is not None
+                        else mode in ('1', 'true', 'cprofile')) or self.cprofile
+        self.top_allocations = top_allocations
+        self.artifact_dir = Path(artifact_dir)
+
+        self.phases: Dict[str, Dict[str, float]] = {}
+        self._previous: Optional['Profiler'] = None
+        self._started_tracemalloc = False
+        self._profile = None
+        self._start = 0.0
+        self._results: Optional[Dict[str, Any]] = None
+
+    @contextmanager
+    def phase(self, name: str):
+        """Acumula o tempo gasto no bloco na fase `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry = self.phases.setdefault(name, {'seconds': 0.0, 'calls': 0})
+            entry['seconds'] += time.perf_counter() - start
+            entry['calls'] += 1
+
+    def start(self) -> 'Profiler':
+        """Inicia a coleta e torna este profiler o ativo do processo (idempotente)."""
+        global _active
+        if not self.enabled or self._start:
+            return self
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        tracemalloc.reset_peak()
+        if self.cprofile:
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        self._previous = _active
+        _active = self
+        self._start = time.perf_counter()
+        return self
+
+    def stop(self) -> Optional[Dict[str, Any]]:
+        """
+        Encerra a coleta e grava o artefato.
+
+        Returns:
+            Resumo do profiling (None se desativado)
+        """
+        global _active
+        if not self.enabled or self._results is not None:
+            return self._results
+        total = time.perf_counter() - self._start
+        if self._profile is not None:
+            self._profile.disable()
+        _active = self._previous
+
+        import tracemalloc
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+        _, traced_peak = tracemalloc.get_traced_memory()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+
+        self._results = {
+            'total_seconds': round(total, 4),
+            'phases': {
+                name: {'seconds': round(entry['seconds'], 4), 'calls': entry['calls']}
+                for name, entry in self.phases.items()
+            },
+            'peak_rss_bytes': peak_rss_bytes(),
+            'tracemalloc_peak_bytes': traced_peak,
+            'top_allocations': [
+                {
+                    'location': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                    'size_bytes': stat.size,
+                    'count': stat.count
+                }
+                for stat in snapshot.statistics('lineno')[:self.top_allocations]
+            ],
+        }
+        if self._profile is not None:
+            self._results['cprofile_top'] = self._cprofile_top()
+        self._results['artifact'] = str(self._write_artifact())
+        return self._results
+
+    def _cprofile_top(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Funções com maior tempo cumulativo."""
+        import pstats
+        stats = pstats.Stats(self._profile)
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)
+        return [
+            {
+                'function': f"{filename}:{lineno}({name})",
+                'calls': calls,
+                'total_seconds': round(total, 6),
+                'cumulative_seconds': round(cumulative, 6)
+            }
+            for (filename, lineno, name), (_, calls, total, cumulative, _) in rows[:limit]
+        ]
+
+    def _write_artifact(self) -> Path:
+        """Grava o resumo em JSON (e o `.prof` do cProfile, se houver)."""
+        self.artifact_dir.mkdir(parents=True, exist_ok=True)
+        stem = f"{Path(self.script_name).stem}_{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+        artifact = self.artifact_dir / f"{stem}.json"
+        if self._profile is not None:
+            prof_path = self.artifact_dir / f"{stem}.prof"
+            self._profile.dump_stats(str(prof_path))
+            self._results['cprofile_stats'] = str(prof_path)
+        with open(artifact, 'w', encoding='utf-8') as f:
+            json.dump(dict(self._results, script_name=self.script_name), f,
+                      ensure_ascii=False, indent=2)
+        return artifact
+
+    def results(self) -> Optional[Dict[str, Any]]:
+        """Resumo da última coleta (None se desativado ou ainda em andamento)."""
+        return self._results
+
+    def __enter__(self) -> 'Profiler':
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+        return False
@@ -0,0 +1,508 @@
+"""
+Gateway de provedores LLM do NextMind.
+Mantém conexões HTTP persistentes (keep-alive) em pool por provedor e permite
+requisições concorrentes via asyncio, com limite de concorrência e timeout por provedor.
+Usa apenas a biblioteca padrão (http.client).
+"""
+import asyncio
+import http.client
+import json
+import os
+import select
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict, Any, Tuple
+from urllib.parse import urlsplit, quote
+
+
+# Padrões por provedor: URL base, variável de ambiente da chave e formato da API
+PROVIDER_DEFAULTS: Dict[str, Dict[str, Any]] = {
+    'openai': {
+        'base_url': 'https://api.openai.com',
+        'api_key_env': 'OPENAI_API_KEY',
+        'style': 'openai',
+    },
+    'anthropic': {
+        'base_url': 'https://api.anthropic.com',
+        'api_key_env': 'ANTHROPIC_API_KEY',
+        'style': 'anthropic',
+    },
+    'google': {
+        'base_url': 'https://generativelanguage.googleapis.com',
+        'api_key_env': 'GOOGLE_API_KEY',
+        'style': 'google',
+    },
+    'openrouter': {
+        'base_url': 'https://openrouter.ai/api',
+        'api_key_env': 'OPENROUTER_API_KEY',
+        'style': 'openai',
+    },
+    'ollama': {
+        'base_url': 'http://localhost:11434',
+        'base_url_env': 'OLLAMA_BASE_URL',
+        'style': 'ollama',
+    },
+    'lmstudio': {
+        'base_url': 'http://localhost:1234',
+        'base_url_env': 'LMSTUDIO_BASE_URL',
+        'style': 'openai',
+    },
+}
+
+# 'local' (settings.providers) é um alias para o Ollama
+PROVIDER_ALIASES = {'local': 'ollama'}
+
+
+class ProviderError(Exception):
+    """Erro retornado por um provedor (HTTP != 2xx ou resposta inválida)."""
+
+    def __init__(self, provider: str, message: str, status: Optional[int] = None):
+        super().__init__(f"[{provider}] {message}")
+        self.provider = provider
+        self.status = status
+
+
+class ProviderTimeoutError(ProviderError):
+    """A requisição excedeu o timeout configurado para o provedor."""
+
+
+class ProviderConfig:
+    """Configuração de conexão de um provedor."""
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        style: str,
+        api_key: Optional[str] = None,
+        max_concurrency: int = 4,
+        timeout: float = 60.0
+    ):
+        """
+        Args:
+            name: Nome do provedor ('openai', 'anthropic', ...)
+            base_url: URL base da API (ex: 'https://api.openai.com')
+            style: Formato da API ('openai', 'anthropic', 'google', 'ollama')
+            api_key: Chave de API (BYOK), None para provedores locais
+            max_concurrency: Máximo de requisições simultâneas (e conexões no pool)
+            timeout: Timeout em segundos por requisição
+        """
+        self.name = name
+        self.base_url = base_url.rstrip('/')
+        self.style = style
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+
+    @classmethod
+    def from_env(cls, name: str, **overrides) -> 'ProviderConfig':
+        """Cria a configuração a partir dos padrões e variáveis do `.env`."""
+        defaults = PROVIDER_DEFAULTS[name]
+        base_url = os.environ.get(defaults.get('base_url_env', ''), defaults['base_url'])
+        api_key = os.environ.get(defaults['api_key_env']) if 'api_key_env' in defaults else None
+        params = {'base_url': base_url, 'style': defaults['style'], 'api_key': api_key}
+        params.update(overrides)
+        return cls(name, **params)
+
+
+class ConnectionPool:
+    """Pool thread-safe de conexões HTTP keep-alive para um host."""
+
+    def __init__(self, base_url: str, timeout: float):
+        parts = urlsplit(base_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path_prefix = parts.path.rstrip('/')
+        self.timeout = timeout
+        self.connections_created = 0
+        self._idle: List[http.client.HTTPConnection] = []
+        self._lock = threading.Lock()
+
+    def acquire(self) -> Tuple[http.client.HTTPConnection, bool]:
+        """
+        Obtém uma conexão ociosa ou cria uma nova.
+
+        Returns:
+            Tupla (conexão, reutilizada)
+        """
+        with self._lock:
+            while self._idle:
+                conn = self._idle.pop()
+                if not self._dropped(conn):
+                    return conn, True
+                conn.close()
+            self.connections_created += 1
+        if self.scheme == 'https':
+            conn = http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout)
+        else:
+            conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        return conn, False
+
+    @staticmethod
+    def _dropped(conn: http.client.HTTPConnection) -> bool:
+        """Conexão ociosa encerrada pelo servidor (socket legível sem requisição pendente)."""
+        if conn.sock is None:
+            return True
+        try:
+            readable, _, _ = select.select([conn.sock], [], [], 0)
+        except (OSError, ValueError):
+            return True
+        return bool(readable)
+
+    def release(self, conn: http.client.HTTPConnection):
+        """Devolve uma conexão saudável ao pool."""
+        with self._lock:
+            self._idle.append(conn)
+
+    def close(self):
+        """Fecha todas as conexões ociosas."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+def _build_request(
+    config: ProviderConfig,
+    model: str,
+    messages: List[Dict[str, str]],
+    params: Dict[str, Any]
+) -> Tuple[str, Dict[str, Any], Dict[str, str]]:
+    """Monta (path, body, headers) no formato da API do provedor."""
+    headers = {'Content-Type': 'application/json'}
+
+    if config.style == 'openai':
+        if config.api_key:
+            headers['Authorization'] = f"Bearer {config.api_key}"
+        body = {'model': model, 'messages': messages}
+        body.update(params)
+        return '/v1/chat/completions', body, headers
+
+    if config.style == 'anthropic':
+        headers['x-api-key'] = config.api_key or ''
+        headers['anthropic-version'] = '2023-06-01'
+        system = '\n'.join(m['content'] for m in messages if m['role'] == 'system')
+        body = {
+            'model': model,
+            'messages': [m for m in messages if m['role'] != 'system'],
+            'max_tokens': 1024,
+        }
+        if system:
+            body['system'] = system
+        body.update(params)
+        return '/v1/messages', body, headers
+
+    if config.style == 'google':
+        headers['x-goog-api-key'] = config.api_key or ''
+        system = '\n'.join(m['content'] for m in messages if m['role'] == 'system')
+        body = {
+            'contents': [
+                {
+                    'role': 'model' if m['role'] == 'assistant' else 'user',
+                    'parts': [{'text': m['content']}],
+                }
+                for m in messages if m['role'] != 'system'
+            ]
+        }
+        if system:
+            body['systemInstruction'] = {'parts': [{'text': system}]}
+        if params:
+            body['generationConfig'] = params
+        return f"/v1beta/models/{quote(model, safe='')}:generateContent", body, headers
+
+    if config.style == 'ollama':
+        body = {'model': model, 'messages': messages, 'stream': False}
+        if params:
+            body['options'] = params
+        return '/api/chat', body, headers
+
+    raise ValueError(f"Formato de API desconhecido: {config.style}")
+
+
+def _parse_response(config: ProviderConfig, data: Dict[str, Any]) -> Tuple[str, Optional[int]]:
+    """Extrai (conteúdo, tokens) da resposta do provedor."""
+    if config.style == 'openai':
+        content = data['choices'][0]['message']['content']
+        tokens = data.get('usage', {}).get('total_tokens')
+    elif config.style == 'anthropic':
+        content = ''.join(b.get('text', '') for b in data['content'] if b.get('type') == 'text')
+        usage = data.get('usage', {})
+        tokens = usage.get('input_tokens', 0) + usage.get('output_tokens', 0) if usage else None
+    elif config.style == 'google':
+        parts = data['candidates'][0]['content']['parts']
+        content = ''.join(p.get('text', '') for p in parts)
+        tokens = data.get('usageMetadata', {}).get('totalTokenCount')
+    else:
+        content = data['message']['content']
+        if 'eval_count' in data:
+            tokens = data.get('prompt_eval_count', 0) + data['eval_count']
+        else:
+            tokens = None
+    return content, tokens
+
+
+def _build_embed_request(
+    config: ProviderConfig,
+    model: str,
+    inputs: List[str]
+) -> Tuple[str, Dict[str, Any], Dict[str, str]]:
+    """Monta (path, body, headers) de uma requisição de embeddings em lote."""
+    headers = {'Content-Type': 'application/json'}
+
+    if config.style == 'openai':
+        if config.api_key:
+            headers['Authorization'] = f"Bearer {config.api_key}"
+        return '/v1/embeddings', {'model': model, 'input': inputs}, headers
+
+    if config.style == 'google':
+        headers['x-goog-api-key'] = config.api_key or ''
+        body = {
+            'requests': [
+                {'model': f'models/{model}', 'content': {'parts': [{'text': text}]}}
+                for text in inputs
+            ]
+        }
+        return f"/v1beta/models/{quote(model, safe='')}:batchEmbedContents", body, headers
+
+    if config.style == 'ollama':
+        return '/api/embed', {'model': model, 'input': inputs}, headers
+
+    raise ProviderError(config.name, "Provedor não oferece embeddings")
+
+
+def _parse_embeddings(config: ProviderConfig, data: Dict[str, Any]) -> Tuple[List[List[float]], Optional[int]]:
+    """Extrai (vetores na ordem das entradas, tokens) da resposta de embeddings."""
+    if config.style == 'openai':
+        items = sorted(data['data'], key=lambda item: item.get('index', 0))
+        return [item['embedding'] for item in items], data.get('usage', {}).get('total_tokens')
+    if config.style == 'google':
+        return [item['values'] for item in data['embeddings']], None
+    return data['embeddings'], data.get('prompt_eval_count')
+
+
+def _release_after(future: 'asyncio.Future', semaphore: asyncio.Semaphore):
+    """Libera a vaga de uma requisição abandonada (timeout/cancelamento) quando a thread retorna."""
+    if not future.cancelled():
+        future.exception()  # Consome o erro: ninguém mais aguarda este future
+    semaphore.release()
+
+
+class ProviderGateway:
+    """
+    Cliente unificado para os provedores LLM.
+
+    Cada provedor tem um pool de conexões keep-alive e um semáforo asyncio que
+    limita as requisições simultâneas. As chamadas HTTP bloqueantes rodam num
+    ThreadPoolExecutor compartilhado, permitindo fan-out concorrente com asyncio.
+    """
+
+    def __init__(self, configs: List[ProviderConfig], cache: Optional[Any] = None):
+        """
+        Args:
+            configs: Configurações dos provedores habilitados
+            cache: ResponseCache opcional consultado antes de cada requisição
+        """
+        self.cache = cache
+        self.configs: Dict[str, ProviderConfig] = {c.name: c for c in configs}
+        self.pools: Dict[str, ConnectionPool] = {
+            c.name: ConnectionPool(c.base_url, c.timeout) for c in configs
+        }
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, sum(c.max_concurrency for c in configs)),
+            thread_name_prefix="nextmind-provider"
+        )
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @classmethod
+    def from_env(cls, providers: Optional[List[str]] = None) -> 'ProviderGateway':
+        """
+        Cria o gateway a partir do `.env`.
+
+        Args:
+            providers: Provedores a habilitar (padrão: todos os conhecidos)
+        """
+        names = providers or list(PROVIDER_DEFAULTS)
+        return cls([ProviderConfig.from_env(PROVIDER_ALIASES.get(n, n)) for n in names])
+
+    def _config(self, provider: str) -> ProviderConfig:
+        name = PROVIDER_ALIASES.get(provider, provider)
+        if name not in self.configs:
+            raise ProviderError(provider, "Provedor não configurado")
+        return self.configs[name]
+
+    def _semaphore(self, config: ProviderConfig) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Semáforos pertencem a um event loop; recria ao trocar de loop
+            self._loop = loop
+            self._semaphores = {}
+        if config.name not in self._semaphores:
+            self._semaphores[config.name] = asyncio.Semaphore(config.max_concurrency)
+        return self._semaphores[config.name]
+
+    def _post(self, config: ProviderConfig, path: str, body: Dict[str, Any],
+              headers: Dict[str, str]) -> Dict[str, Any]:
+        """Executa um POST JSON (bloqueante) reutilizando conexões do pool."""
+        pool = self.pools[config.name]
+        payload = json.dumps(body).encode('utf-8')
+
+        while True:
+            conn, reused = pool.acquire()
+            sent = False
+            try:
+                conn.request('POST', pool.path_prefix + path, body=payload, headers=headers)
+                sent = True
+                response = conn.getresponse()
+                raw = response.read()
+            except socket.timeout as e:
+                conn.close()
+                raise ProviderTimeoutError(config.name, f"Timeout de rede: {e}")
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                if reused and not sent:
+                    # Conexão keep-alive encerrada pelo servidor antes do envio: tenta com
+                    # uma nova. Depois do envio não repete (o POST pode ter sido processado)
+                    continue
+                raise ProviderError(config.name, f"Falha de conexão: {e}")
+            break
+
+        if response.will_close:
+            conn.close()
+        else:
+            pool.release(conn)
+
+        if not 200 <= response.status < 300:
+            raise ProviderError(
+                config.name, raw.decode('utf-8', errors='replace')[:500], response.status
+            )
+        try:
+            return json.loads(raw)
+        except ValueError:
+            raise ProviderError(config.name, "Resposta não é JSON válido", response.status)
+
+    async def _request(self, config: ProviderConfig, path: str, body: Dict[str, Any],
+                       headers: Dict[str, str]) -> Tuple[Dict[str, Any], float]:
+        """Executa o POST no executor, respeitando concorrência e timeout do provedor."""
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphore(config)
+        await semaphore.acquire()
+        start = time.perf_counter()
+        future = loop.run_in_executor(self._executor, self._post, config, path, body, headers)
+        try:
+            data = await asyncio.wait_for(asyncio.shield(future), timeout=config.timeout)
+        except asyncio.TimeoutError:
+            raise ProviderTimeoutError(config.name, f"Timeout após {config.timeout}s")
+        finally:
+            if future.done():
+                semaphore.release()
+            else:
+                # A thread segue até o timeout do socket: a vaga só é liberada quando
+                # ela retorna, então o provedor nunca recebe mais que max_concurrency
+                future.add_done_callback(lambda f: _release_after(f, semaphore))
+        return data, round((time.perf_counter() - start) * 1000, 1)
+
+    async def complete(
+        self,
+        provider: str,
+        model: str,
+        messages: List[Dict[str, str]],
+        use_cache: bool = True,
+        **params
+    ) -> Dict[str, Any]:
+        """
+        Envia uma conversa ao provedor e aguarda a resposta completa.
+
+        Args:
+            provider: Nome do provedor
+            model: Nome do modelo
+            messages: Lista de {'role', 'content'}
+            use_cache: Consulta/alimenta o ResponseCache (se configurado)
+            **params: Parâmetros de geração (temperature, max_tokens, ...)
+
+        Returns:
+            Dict com provider, model, content, tokens e latency_ms
+            (`cached: True` quando servido pelo cache)
+        """
+        if self.cache is not None and use_cache:
+            cached = self.cache.get(provider, model, messages, params)
+            if cached is not None:
+                cached['cached'] = True
+                return cached
+
+        config = self._config(provider)
+        path, body, headers = _build_request(config, model, messages, params)
+        data, latency_ms = await self._request(config, path, body, headers)
+
+        try:
+            content, tokens = _parse_response(config, data)
+        except (KeyError, IndexError, TypeError) as e:
+            raise ProviderError(config.name, f"Formato de resposta inesperado: {e}")
+        result = {
+            'provider': provider,
+            'model': model,
+            'content': content,
+            'tokens': tokens,
+            'latency_ms': latency_ms,
+        }
+        if self.cache is not None and use_cache:
+            self.cache.put(provider, model, messages, params, result)
+        return result
+
+    async def embed(self, provider: str, model: str, inputs: List[str]) -> Dict[str, Any]:
+        """
+        Gera embeddings de vários textos numa única requisição.
+
+        Args:
+            provider: Nome do provedor (formatos openai, google e ollama)
+            model: Modelo de embeddings
+            inputs: Textos a vetorizar
+
+        Returns:
+            Dict com provider, model, embeddings (na ordem de `inputs`), tokens e latency_ms
+        """
+        config = self._config(provider)
+        path, body, headers = _build_embed_request(config, model, inputs)
+        data, latency_ms = await self._request(config, path, body, headers)
+        try:
+            embeddings, tokens = _parse_embeddings(config, data)
+        except (KeyError, IndexError, TypeError) as e:
+            raise ProviderError(config.name, f"Formato de resposta inesperado: {e}")
+        if len(embeddings) != len(inputs):
+            raise ProviderError(
+                config.name, f"{len(embeddings)} embeddings para {len(inputs)} entradas"
+            )
+        return {
+            'provider': provider,
+            'model': model,
+            'embeddings': embeddings,
+            'tokens': tokens,
+            'latency_ms': latency_ms,
+        }
+
+    async def fan_out(self, requests: List[Dict[str, Any]]) -> List[Any]:
+        """
+        Executa várias requisições concorrentemente (ex: mesmo prompt em vários modelos).
+
+        Args:
+            requests: Lista de dicts com 'provider', 'model', 'messages' e 'params' opcional
+
+        Returns:
+            Resultados na mesma ordem; falhas retornam a exceção em vez do dict
+        """
+        return await asyncio.gather(
+            *(
+                self.complete(r['provider'], r['model'], r['messages'], **r.get('params', {}))
+                for r in requests
+            ),
+            return_exceptions=True
+        )
+
+    def close(self):
+        """Fecha as conexões e o executor."""
+        self._executor.shutdown(wait=True)
+        for pool in self.pools.values():
+            pool.close()
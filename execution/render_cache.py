@@ -0,0 +1,192 @@
+"""
+Cache de mensagens renderizadas do NextMind.
+
+O HTML sanitizado de cada mensagem (markdown_render) fica na tabela
+`rendered_messages`, chaveado pelo SHA-256 do conteúdo e pela versão do
+renderizador: conteúdos idênticos (reimportações, duplicatas) são renderizados
+uma única vez e uma nova versão do renderizador invalida tudo sem migração.
+
+O cache é preenchido sob demanda (`page_by_conversation`) ou em segundo plano
+depois da importação (`fill_pending`, retomável e limitado por tempo).
+"""
+import hashlib
+import json
+import time
+from typing import Optional, List, Dict, Any, Iterable
+from database import Database
+from markdown_render import render_markdown, RENDERER_VERSION
+
+
+# Chave em `settings` com o progresso do preenchimento: {"version": ..., "last_rowid": ...}
+SETTINGS_KEY = 'render_cache'
+
+
+def content_hash(content: str) -> str:
+    """SHA-256 hex do conteúdo da mensagem."""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class RenderCache:
+    """HTML pré-renderizado das mensagens, paginado junto com a conversa."""
+
+    def __init__(self, db: Database, version: int = RENDERER_VERSION):
+        """
+        Args:
+            db: Instância do Database
+            version: Versão do renderizador (entradas de outras versões são ignoradas)
+        """
+        self.db = db
+        self.version = version
+        self.stats = {'hits': 0, 'rendered': 0}
+
+    def get_many(self, hashes: Iterable[str]) -> Dict[str, str]:
+        """HTML em cache para os hashes pedidos (ausentes ficam de fora)."""
+        hashes = list(set(hashes))
+        found: Dict[str, str] = {}
+        conn = self.db.connect()
+        # Lotes abaixo do limite de parâmetros do SQLite
+        for start in range(0, len(hashes), 500):
+            batch = hashes[start:start + 500]
+            rows = conn.execute(
+                f"""
+                SELECT content_hash, html FROM rendered_messages
+                WHERE renderer_version = ? AND content_hash IN ({', '.join('?' * len(batch))})
+                """,
+                [self.version] + batch
+            ).fetchall()
+            found.update((row['content_hash'], row['html']) for row in rows)
+        return found
+
+    def render_many(self, contents: Iterable[str]) -> List[str]:
+        """
+        HTML de cada conteúdo, na mesma ordem: lê do cache e renderiza (e grava)
+        apenas o que falta.
+        """
+        contents = list(contents)
+        hashes = [content_hash(c) for c in contents]
+        cached = self.get_many(hashes)
+        self.stats['hits'] += sum(1 for h in hashes if h in cached)
+
+        missing: Dict[str, str] = {}
+        for content, h in zip(contents, hashes):
+            if h not in cached and h not in missing:
+                missing[h] = render_markdown(content)
+        if missing:
+            self.db.write_many([
+                (
+                    """
+                    INSERT OR IGNORE INTO rendered_messages (content_hash, renderer_version, html)
+                    VALUES (?, ?, ?)
+                    """,
+                    (h, self.version, rendered)
+                )
+                for h, rendered in missing.items()
+            ])
+            self.stats['rendered'] += len(missing)
+            cached.update(missing)
+        return [cached[h] for h in hashes]
+
+    def render(self, content: str) -> str:
+        """HTML de um único conteúdo (via cache)."""
+        return self.render_many([content])[0]
+
+    def page_by_conversation(
+        self,
+        conversation_id: str,
+        offset: int = 0,
+        limit: int = 100
+    ) -> Dict[str, Any]:
+        """
+        Página de mensagens de uma conversa com o HTML pronto em `html`.
+
+        Args:
+            conversation_id: ID da conversa
+            offset: Mensagens a pular (ordem por timestamp)
+            limit: Tamanho da página
+
+        Returns:
+            Dict com `messages`, `offset`, `next_offset` (None no fim) e `renderer_version`
+        """
+        conn = self.db.connect()
+        schemas = self.db.schemas()
+        sql = " UNION ALL ".join(
+            f"SELECT {self.db.select_list(schema, 'messages')} "
+            f"FROM {schema}.messages WHERE conversation_id = ?"
+            for schema in schemas
+        )
+        rows = conn.execute(
+            sql + " ORDER BY timestamp ASC LIMIT ? OFFSET ?",
+            [conversation_id] * len(schemas) + [limit + 1, offset]
+        ).fetchall()
+        messages = [dict(row) for row in rows[:limit]]
+        for message, rendered in zip(messages, self.render_many(m['content'] for m in messages)):
+            message['html'] = rendered
+        return {
+            'messages': messages,
+            'offset': offset,
+            'next_offset': offset + limit if len(rows) > limit else None,
+            'renderer_version': self.version,
+        }
+
+    def _progress(self) -> int:
+        row = self.db.connect().execute(
+            "SELECT value FROM settings WHERE key = ?", (SETTINGS_KEY,)
+        ).fetchone()
+        state = json.loads(row['value']) if row else {}
+        # Nova versão do renderizador: recomeça do início
+        return state.get('last_rowid', 0) if state.get('version') == self.version else 0
+
+    def fill_pending(self, batch_size: int = 200, budget_seconds: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Pré-renderiza mensagens novas do banco principal em segundo plano.
+        O progresso (último rowid) é persistido: cada chamada continua de onde parou.
+        Mensagens que escaparem (ex: rowids renumerados por um VACUUM completo)
+        são renderizadas sob demanda por `page_by_conversation`.
+
+        Args:
+            batch_size: Mensagens por lote
+            budget_seconds: Tempo máximo da chamada (None até terminar)
+
+        Returns:
+            Mensagens examinadas, renderizadas e se ainda há pendências
+        """
+        start_time = time.time()
+        conn = self.db.connect()
+        last_rowid = self._progress()
+        rendered_before = self.stats['rendered']
+        scanned = 0
+        done = False
+        while budget_seconds is None or time.time() - start_time < budget_seconds:
+            rows = conn.execute(
+                "SELECT rowid, content FROM main.messages WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                (last_rowid, batch_size)
+            ).fetchall()
+            if not rows:
+                done = True
+                break
+            self.render_many(row['content'] for row in rows)
+            last_rowid = rows[-1]['rowid']
+            scanned += len(rows)
+            self.db.write(
+                """
+                INSERT INTO settings (key, value, updated_at) VALUES (?, ?, datetime('now'))
+                ON CONFLICT(key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+                """,
+                (SETTINGS_KEY, json.dumps({'version': self.version, 'last_rowid': last_rowid}))
+            )
+        return {
+            'scanned': scanned,
+            'rendered': self.stats['rendered'] - rendered_before,
+            'pending': not done,
+        }
+
+    def prune(self) -> int:
+        """
+        Remove entradas de outras versões do renderizador.
+
+        Returns:
+            Linhas removidas
+        """
+        return self.db.write(
+            "DELETE FROM rendered_messages WHERE renderer_version != ?", (self.version,)
+        )
@@ -0,0 +1,253 @@
+"""
+Cache de respostas LLM do NextMind.
+Camada em memória (LRU) na frente de uma tabela SQLite (`response_cache`) com TTL
+e limite de tamanho por LRU. Evita repetir a chamada ao provedor para prompts idênticos.
+
+Leituras não escrevem: os acessos (memória e disco) são acumulados e o `last_access`
+é gravado em lote — pela fila de escrita quando ativa (sem bloquear o event loop do
+gateway) e sempre antes de uma eviction, para o LRU do disco refletir os acessos reais.
+Se a gravação assíncrona falhar, o erro vai para o log de execução e os acessos voltam
+para a fila pendente (reenviados no próximo flush).
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, List, Dict, Any, Callable, Tuple
+from database import Database
+from logger import get_execution_logger
+
+
+class ResponseCache:
+    """Cache de respostas em dois níveis (memória + SQLite)."""
+
+    def __init__(
+        self,
+        db: Database,
+        ttl_seconds: float = 7 * 24 * 3600,
+        max_entries: int = 10000,
+        memory_entries: int = 256,
+        access_batch: int = 64,
+        clock: Callable[[], float] = time.time
+    ):
+        """
+        Args:
+            db: Instância do Database
+            ttl_seconds: Tempo de vida de cada resposta
+            max_entries: Máximo de respostas persistidas (excedente removido por LRU)
+            memory_entries: Máximo de respostas na camada em memória
+            access_batch: Acessos acumulados antes de gravar `last_access`
+            clock: Fonte de tempo (Unix timestamp), substituível em testes
+        """
+        self.db = db
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.access_batch = access_batch
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+        self._clock = clock
+        self._memory: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._puts = 0
+        # Acessos ainda não gravados: chave -> último acesso
+        self._accessed: Dict[str, float] = {}
+        # O callback da fila de escrita devolve acessos a partir da thread do escritor
+        self._accessed_lock = threading.Lock()
+
+    @staticmethod
+    def make_key(
+        provider: str,
+        model: str,
+        messages: List[Dict[str, Any]],
+        params: Optional[Dict[str, Any]] = None
+    ) -> str:
+        """Gera a chave do cache (SHA-256 do JSON canônico da requisição)."""
+        canonical = json.dumps(
+            [provider, model, messages, params or {}],
+            sort_keys=True, ensure_ascii=False, separators=(',', ':')
+        )
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    def _remember(self, key: str, expires_at: float, response: Dict[str, Any]):
+        self._memory[key] = (expires_at, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _touch(self, key: str, now: float):
+        with self._accessed_lock:
+            self._accessed[key] = now
+            due = len(self._accessed) >= self.access_batch
+        if due:
+            self.flush_access(wait=False)
+
+    def _requeue(self, accessed: Dict[str, float]):
+        """Devolve acessos não gravados à fila pendente (mantém o mais recente)."""
+        with self._accessed_lock:
+            for key, accessed_at in accessed.items():
+                self._accessed[key] = max(accessed_at, self._accessed.get(key, accessed_at))
+
+    def _access_written(self, accessed: Dict[str, float], future):
+        """Callback do flush assíncrono: registra a falha e reenfileira os acessos."""
+        error = future.exception()
+        if error is None:
+            return
+        self._requeue(accessed)
+        get_execution_logger().log(
+            script_name="response_cache.py",
+            inputs={"operation": "flush_access", "accesses": len(accessed)},
+            status="error",
+            error=f"Failed to write last_access: {error}"
+        )
+
+    def flush_access(self, wait: bool = True) -> int:
+        """
+        Grava os `last_access` acumulados numa única transação.
+
+        Args:
+            wait: Aguarda o commit; com False e a fila de escrita ativa, apenas
+                enfileira (não bloqueia o chamador, ex: o event loop do gateway)
+
+        Returns:
+            Acessos enviados
+        """
+        with self._accessed_lock:
+            if not self._accessed:
+                return 0
+            accessed, self._accessed = self._accessed, {}
+        statements = [
+            ("UPDATE response_cache SET last_access = MAX(last_access, ?) WHERE cache_key = ?",
+             (accessed_at, key))
+            for key, accessed_at in accessed.items()
+        ]
+        if not wait and self.db.write_queue is not None:
+            future = self.db.write_queue.submit(statements)
+            future.add_done_callback(lambda done: self._access_written(accessed, done))
+        else:
+            try:
+                self.db.write_many(statements)
+            except Exception:
+                self._requeue(accessed)
+                raise
+        return len(statements)
+
+    def get(
+        self,
+        provider: str,
+        model: str,
+        messages: List[Dict[str, Any]],
+        params: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Busca uma resposta em cache.
+
+        Returns:
+            Cópia da resposta ou None se ausente/expirada
+        """
+        key = self.make_key(provider, model, messages, params)
+        now = self._clock()
+
+        entry = self._memory.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self._memory.move_to_end(key)
+                self._touch(key, now)
+                self.stats['memory_hits'] += 1
+                return dict(entry[1])
+            del self._memory[key]
+
+        conn = self.db.connect()
+        row = conn.execute(
+            "SELECT response, expires_at FROM response_cache WHERE cache_key = ?", (key,)
+        ).fetchone()
+        if row is None or row['expires_at'] <= now:
+            self.stats['misses'] += 1
+            return None
+
+        self._touch(key, now)
+        response = json.loads(row['response'])
+        self._remember(key, row['expires_at'], response)
+        self.stats['disk_hits'] += 1
+        return dict(response)
+
+    def put(
+        self,
+        provider: str,
+        model: str,
+        messages: List[Dict[str, Any]],
+        params: Optional[Dict[str, Any]],
+        response: Dict[str, Any]
+    ):
+        """Armazena uma resposta nas duas camadas."""
+        key = self.make_key(provider, model, messages, params)
+        now = self._clock()
+        expires_at = now + self.ttl_seconds
+        self.db.write(
+            """
+            INSERT OR REPLACE INTO response_cache
+                (cache_key, provider, model, response, created_at, expires_at, last_access)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """,
+            (key, provider, model, json.dumps(response, ensure_ascii=False), now, expires_at, now)
+        )
+        self._remember(key, expires_at, dict(response))
+
+        # Eviction amortizada: a cada 64 inserções (e sempre que o limite é pequeno)
+        self._puts += 1
+        if self._puts % 64 == 0 or self.max_entries < 64:
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        Remove respostas expiradas e o excedente menos usado recentemente
+        (também da camada em memória).
+
+        Returns:
+            Número de respostas removidas
+        """
+        self.flush_access()
+        removed = self.db.write_many([
+            ("DELETE FROM response_cache WHERE expires_at <= ?", (self._clock(),)),
+            (
+                """
+                DELETE FROM response_cache WHERE cache_key IN (
+                    SELECT cache_key FROM response_cache
+                    ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+                """,
+                (self.max_entries,)
+            ),
+        ])
+        self.stats['evictions'] += removed
+        if removed and self._memory:
+            self._forget_evicted()
+        return removed
+
+    def _forget_evicted(self):
+        """Descarta da memória as chaves que não estão mais no disco."""
+        keys = list(self._memory)
+        alive = set()
+        conn = self.db.connect()
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            alive.update(
+                row['cache_key'] for row in conn.execute(
+                    f"SELECT cache_key FROM response_cache WHERE cache_key IN ({', '.join('?' * len(batch))})",
+                    batch
+                )
+            )
+        for key in keys:
+            if key not in alive:
+                del self._memory[key]
+
+    def clear(self):
+        """Esvazia o cache (memória e disco)."""
+        self._memory.clear()
+        self._accessed.clear()
+        self.db.write("DELETE FROM response_cache")
+
+    def hit_rate(self) -> float:
+        """Fração de consultas atendidas pelo cache (memória ou disco)."""
+        hits = self.stats['memory_hits'] + self.stats['disk_hits']
+        total = hits + self.stats['misses']
+        return hits / total if total else 0.0
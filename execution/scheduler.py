@@ -0,0 +1,335 @@
+"""
+Escalonador de requisições a modelos do NextMind.
+
+Tarefas em segundo plano (geração de títulos, embeddings, resumos em massa de
+conversas importadas) disputam com o chat interativo o mesmo endpoint local
+(`OLLAMA_BASE_URL` / `LMSTUDIO_BASE_URL`) e as cotas dos provedores. O
+`RequestScheduler` fica na frente do `ProviderGateway` e:
+
+- Enfileira as requisições por prioridade (`INTERACTIVE` sempre antes de `BACKGROUND`)
+- Limita a concorrência por endpoint, reservando vagas que só o chat pode ocupar
+- Limita tokens por minuto por endpoint (token bucket, corrigido pelo consumo real)
+- Agrupa embeddings pendentes do mesmo modelo numa única requisição em lote
+
+Requisições já enviadas não são interrompidas: a preempção acontece na fila e
+pelas vagas reservadas, então o chat nunca espera o segundo plano liberar o endpoint.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Optional, List, Dict, Any
+
+from providers import ProviderGateway
+
+
+# Prioridades (menor = mais urgente)
+INTERACTIVE = 0
+BACKGROUND = 10
+
+# Estimativa de custo antes da resposta do provedor
+CHARS_PER_TOKEN = 4
+DEFAULT_COMPLETION_TOKENS = 256
+
+
+class EndpointLimits:
+    """Limites de um endpoint (provedor) no escalonador."""
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        reserved_interactive: int = 1,
+        tokens_per_minute: Optional[int] = None,
+        max_batch: int = 32
+    ):
+        """
+        Args:
+            max_concurrency: Máximo de requisições simultâneas no endpoint
+            reserved_interactive: Vagas que o segundo plano nunca ocupa (com
+                `max_concurrency=1` não há reserva: o segundo plano precisa de uma vaga)
+            tokens_per_minute: Cota de tokens por minuto (None = sem limite)
+            max_batch: Máximo de textos por requisição de embeddings
+        """
+        self.max_concurrency = max_concurrency
+        self.reserved_interactive = max(0, min(reserved_interactive, max_concurrency - 1))
+        self.tokens_per_minute = tokens_per_minute
+        self.max_batch = max_batch
+
+
+class TokenBucket:
+    """Token bucket com capacidade de um minuto de cota."""
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def available(self) -> float:
+        """Tokens disponíveis agora."""
+        self._refill()
+        return self.tokens
+
+    def wait_time(self, cost: int) -> float:
+        """Segundos até haver `cost` tokens (0 se já houver)."""
+        missing = min(cost, self.capacity) - self.available()
+        return max(0.0, missing / self.rate)
+
+    def consume(self, cost: int):
+        self._refill()
+        self.tokens -= cost
+
+    def adjust(self, delta: int):
+        """Corrige a estimativa com o consumo real (delta negativo devolve tokens)."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+
+class _Job:
+    """Requisição enfileirada."""
+
+    __slots__ = ('kind', 'provider', 'model', 'payload', 'params', 'use_cache', 'cost',
+                 'future', 'submitted')
+
+    def __init__(self, kind: str, provider: str, model: str, payload: List[Any],
+                 params: Dict[str, Any], use_cache: bool, cost: int):
+        self.kind = kind
+        self.provider = provider
+        self.model = model
+        self.payload = payload
+        self.params = params
+        self.use_cache = use_cache
+        self.cost = cost
+        self.future: Optional[asyncio.Future] = None
+        self.submitted = time.perf_counter()
+
+
+class _Endpoint:
+    """Fila e ocupação de um endpoint."""
+
+    def __init__(self, limits: EndpointLimits, bucket: Optional[TokenBucket]):
+        self.limits = limits
+        self.bucket = bucket
+        self.queue: List[Any] = []
+        self.in_flight = 0
+        self.background_in_flight = 0
+        self.dispatch_pending = False
+        self.wakeup: Optional[asyncio.TimerHandle] = None
+
+
+class RequestScheduler:
+    """
+    Fila de prioridades na frente do ProviderGateway.
+
+    Cada endpoint tem um heap (prioridade, ordem de chegada). O despacho libera o
+    topo do heap enquanto houver vaga e tokens; requisições de segundo plano não
+    ocupam as vagas reservadas, e embeddings do mesmo modelo saem em lote.
+    """
+
+    def __init__(self, gateway: ProviderGateway, limits: Optional[Dict[str, EndpointLimits]] = None):
+        """
+        Args:
+            gateway: Gateway usado para as chamadas
+            limits: Limites por provedor (padrão: `max_concurrency` do gateway,
+                uma vaga reservada ao chat e sem cota de tokens)
+        """
+        self.gateway = gateway
+        self.limits: Dict[str, EndpointLimits] = {
+            name: EndpointLimits(config.max_concurrency) for name, config in gateway.configs.items()
+        }
+        for provider, endpoint_limits in (limits or {}).items():
+            self.limits[gateway._config(provider).name] = endpoint_limits
+        self.stats = {'interactive': 0, 'background': 0, 'batches': 0, 'rate_limited': 0}
+        # Buckets sobrevivem à troca de event loop: a cota é do provedor, não do loop
+        self._buckets: Dict[str, TokenBucket] = {
+            name: TokenBucket(l.tokens_per_minute)
+            for name, l in self.limits.items() if l.tokens_per_minute
+        }
+        self._endpoints: Dict[str, _Endpoint] = {}
+        self._order = itertools.count()
+        self._tasks = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _endpoint(self, provider: str) -> _Endpoint:
+        name = self.gateway._config(provider).name
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # Futures e timers pertencem a um event loop; recria as filas ao trocar de loop
+            self._loop = loop
+            self._endpoints = {}
+        if name not in self._endpoints:
+            limits = self.limits.setdefault(name, EndpointLimits(self.gateway.configs[name].max_concurrency))
+            self._endpoints[name] = _Endpoint(limits, self._buckets.get(name))
+        return self._endpoints[name]
+
+    async def complete(
+        self,
+        provider: str,
+        model: str,
+        messages: List[Dict[str, str]],
+        priority: int = INTERACTIVE,
+        use_cache: bool = True,
+        **params
+    ) -> Dict[str, Any]:
+        """
+        Enfileira uma chamada de chat (mesmos argumentos de `ProviderGateway.complete`).
+
+        Args:
+            priority: `INTERACTIVE` (chat) ou `BACKGROUND` (títulos, resumos, ...)
+
+        Returns:
+            Resposta do gateway, com `queued_ms` (tempo de espera na fila)
+        """
+        chars = sum(len(m.get('content', '')) for m in messages)
+        cost = chars // CHARS_PER_TOKEN + params.get('max_tokens', DEFAULT_COMPLETION_TOKENS)
+        job = _Job('complete', provider, model, messages, params, use_cache, cost)
+        return await self._submit(job, priority)
+
+    async def embed(
+        self,
+        provider: str,
+        model: str,
+        texts: List[str],
+        priority: int = BACKGROUND
+    ) -> List[List[float]]:
+        """
+        Enfileira textos para embeddings. Pedidos pendentes do mesmo modelo são
+        enviados juntos (até `max_batch` textos por requisição).
+
+        Returns:
+            Um vetor por texto, na ordem de `texts`
+        """
+        cost = sum(len(t) for t in texts) // CHARS_PER_TOKEN + len(texts)
+        job = _Job('embed', provider, model, list(texts), {}, False, cost)
+        return await self._submit(job, priority)
+
+    def pending(self) -> int:
+        """Requisições aguardando na fila (todos os endpoints)."""
+        return sum(
+            1 for endpoint in self._endpoints.values()
+            for _, _, job in endpoint.queue if not job.future.done()
+        )
+
+    async def _submit(self, job: _Job, priority: int) -> Any:
+        endpoint = self._endpoint(job.provider)
+        job.future = asyncio.get_running_loop().create_future()
+        heapq.heappush(endpoint.queue, (priority, next(self._order), job))
+        self._schedule(endpoint)
+        return await job.future
+
+    def _schedule(self, endpoint: _Endpoint):
+        """Agenda um despacho para o próximo ciclo do loop (agrupa submissões simultâneas)."""
+        if not endpoint.dispatch_pending:
+            endpoint.dispatch_pending = True
+            asyncio.get_running_loop().call_soon(self._dispatch, endpoint)
+
+    def _dispatch(self, endpoint: _Endpoint):
+        """Inicia as requisições do topo da fila enquanto houver vaga e tokens."""
+        endpoint.dispatch_pending = False
+        if endpoint.wakeup is not None:
+            endpoint.wakeup.cancel()
+            endpoint.wakeup = None
+        limits = endpoint.limits
+
+        while endpoint.queue:
+            priority, _, job = endpoint.queue[0]
+            if job.future.done():
+                # Cancelada pelo chamador enquanto esperava
+                heapq.heappop(endpoint.queue)
+                continue
+            interactive = priority <= INTERACTIVE
+            if endpoint.in_flight >= limits.max_concurrency:
+                break
+            if not interactive and endpoint.background_in_flight >= limits.max_concurrency - limits.reserved_interactive:
+                break
+            if endpoint.bucket is not None:
+                wait = endpoint.bucket.wait_time(job.cost)
+                if wait > 0:
+                    self.stats['rate_limited'] += 1
+                    endpoint.wakeup = asyncio.get_running_loop().call_later(
+                        wait, self._schedule, endpoint
+                    )
+                    break
+
+            heapq.heappop(endpoint.queue)
+            jobs = [job]
+            if job.kind == 'embed':
+                jobs += self._take_batch(endpoint, job)
+            cost = sum(j.cost for j in jobs)
+            if endpoint.bucket is not None:
+                endpoint.bucket.consume(cost)
+
+            endpoint.in_flight += 1
+            if not interactive:
+                endpoint.background_in_flight += 1
+            self.stats['interactive' if interactive else 'background'] += 1
+            task = asyncio.ensure_future(self._run(endpoint, jobs, interactive, cost))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _take_batch(self, endpoint: _Endpoint, first: _Job) -> List[_Job]:
+        """Retira da fila embeddings do mesmo provedor e modelo que cabem no lote."""
+        size = len(first.payload)
+        budget = endpoint.bucket.available() - first.cost if endpoint.bucket is not None else None
+        taken = []
+        for _, _, job in sorted(endpoint.queue):
+            if job.kind != 'embed' or job.future.done():
+                continue
+            if job.provider != first.provider or job.model != first.model:
+                continue
+            if size + len(job.payload) > endpoint.limits.max_batch:
+                break
+            if budget is not None:
+                if job.cost > budget:
+                    break
+                budget -= job.cost
+            size += len(job.payload)
+            taken.append(job)
+        if taken:
+            ids = {id(job) for job in taken}
+            endpoint.queue = [entry for entry in endpoint.queue if id(entry[2]) not in ids]
+            heapq.heapify(endpoint.queue)
+        return taken
+
+    async def _run(self, endpoint: _Endpoint, jobs: List[_Job], interactive: bool, cost: int):
+        """Executa uma requisição (ou lote) e entrega o resultado a cada chamador."""
+        first = jobs[0]
+        queued_ms = round((time.perf_counter() - first.submitted) * 1000, 1)
+        used = None
+        try:
+            if first.kind == 'complete':
+                result = await self.gateway.complete(
+                    first.provider, first.model, first.payload,
+                    use_cache=first.use_cache, **first.params
+                )
+                used = 0 if result.get('cached') else result.get('tokens')
+                results = [dict(result, queued_ms=queued_ms)]
+            else:
+                inputs = [text for job in jobs for text in job.payload]
+                result = await self.gateway.embed(first.provider, first.model, inputs)
+                used = result.get('tokens')
+                if len(jobs) > 1:
+                    self.stats['batches'] += 1
+                results, start = [], 0
+                for job in jobs:
+                    results.append(result['embeddings'][start:start + len(job.payload)])
+                    start += len(job.payload)
+            for job, job_result in zip(jobs, results):
+                if not job.future.done():
+                    job.future.set_result(job_result)
+        except Exception as e:
+            for job in jobs:
+                if not job.future.done():
+                    job.future.set_exception(e)
+        finally:
+            endpoint.in_flight -= 1
+            if not interactive:
+                endpoint.background_in_flight -= 1
+            if endpoint.bucket is not None and used is not None:
+                endpoint.bucket.adjust(used - cost)
+            self._schedule(endpoint)
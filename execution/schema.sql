@@ -15,7 +15,7 @@ CREATE TABLE IF NOT EXISTS projects (
     updated_at TEXT NOT NULL DEFAULT (datetime('now'))
 );
 
-CREATE INDEX idx_projects_created_at ON projects(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_projects_created_at ON projects(created_at DESC);
 
 -- ============================================
 -- TABLE: conversations
@@ -32,9 +32,9 @@ CREATE TABLE IF NOT EXISTS conversations (
     FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE SET NULL
 );
 
-CREATE INDEX idx_conversations_project_id ON conversations(project_id);
-CREATE INDEX idx_conversations_updated_at ON conversations(updated_at DESC);
-CREATE INDEX idx_conversations_created_at ON conversations(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_conversations_project_id ON conversations(project_id);
+CREATE INDEX IF NOT EXISTS idx_conversations_updated_at ON conversations(updated_at DESC);
+CREATE INDEX IF NOT EXISTS idx_conversations_created_at ON conversations(created_at DESC);
 
 -- ============================================
 -- TABLE: messages
@@ -50,8 +50,64 @@ CREATE TABLE IF NOT EXISTS messages (
     FOREIGN KEY (conversation_id) REFERENCES conversations(id) ON DELETE CASCADE
 );
 
-CREATE INDEX idx_messages_conversation_id ON messages(conversation_id);
-CREATE INDEX idx_messages_timestamp ON messages(timestamp ASC);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation_id ON messages(conversation_id);
+CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp ASC);
+
+-- ============================================
+-- TABLE: blobs
+-- Descrição: Conteúdo binário (imagens, arquivos, saídas de código) guardado fora
+-- do banco, num blob store endereçado por conteúdo (.tmp/data/blobs/ab/cd/<hash>).
+-- ============================================
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,  -- SHA-256 hex do conteúdo
+    size INTEGER NOT NULL,  -- Tamanho em bytes
+    created_at TEXT NOT NULL DEFAULT (datetime('now'))
+) WITHOUT ROWID;
+
+-- ============================================
+-- TABLE: message_attachments
+-- Descrição: Anexos de mensagens; vários anexos podem apontar para o mesmo blob (deduplicação)
+-- ============================================
+CREATE TABLE IF NOT EXISTS message_attachments (
+    id TEXT PRIMARY KEY,  -- UUID v4
+    message_id TEXT NOT NULL,
+    blob_hash TEXT NOT NULL,
+    filename TEXT,
+    mime_type TEXT,
+    kind TEXT NOT NULL DEFAULT 'file' CHECK(kind IN ('image', 'file', 'code_output')),
+    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+    FOREIGN KEY (message_id) REFERENCES messages(id) ON DELETE CASCADE,
+    FOREIGN KEY (blob_hash) REFERENCES blobs(hash)
+);
+
+CREATE INDEX IF NOT EXISTS idx_message_attachments_message_id ON message_attachments(message_id);
+CREATE INDEX IF NOT EXISTS idx_message_attachments_blob_hash ON message_attachments(blob_hash);
+
+-- ============================================
+-- TABLE: message_chunks
+-- Descrição: Checkpoints de respostas em streaming ainda não finalizadas.
+-- Cada checkpoint anexa apenas o trecho novo; as linhas são removidas na finalização.
+-- ============================================
+CREATE TABLE IF NOT EXISTS message_chunks (
+    message_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,  -- Ordem do checkpoint (1, 2, ...)
+    content TEXT NOT NULL,
+    PRIMARY KEY (message_id, seq),
+    FOREIGN KEY (message_id) REFERENCES messages(id) ON DELETE CASCADE
+) WITHOUT ROWID;
+
+-- ============================================
+-- TABLE: message_streams
+-- Descrição: Streams em andamento (uma linha por mensagem não finalizada).
+-- O heartbeat é renovado a cada checkpoint; `recover_streams` só finaliza streams
+-- sem heartbeat recente (podem estar vivos em outro processo).
+-- ============================================
+CREATE TABLE IF NOT EXISTS message_streams (
+    message_id TEXT PRIMARY KEY,
+    started_at TEXT NOT NULL DEFAULT (datetime('now')),
+    last_heartbeat_at TEXT NOT NULL DEFAULT (datetime('now')),
+    FOREIGN KEY (message_id) REFERENCES messages(id) ON DELETE CASCADE
+) WITHOUT ROWID;
 
 -- ============================================
 -- TABLE: settings (Key-Value store para configurações)
@@ -70,6 +126,100 @@ INSERT OR IGNORE INTO settings (key, value) VALUES
 INSERT OR IGNORE INTO settings (key, value) VALUES 
 ('theme', '"dark"');
 
+-- ============================================
+-- TABLE: response_cache (Cache persistente de respostas LLM)
+-- Descrição: Chave = hash de provedor, modelo, mensagens e parâmetros.
+-- Expira por TTL (expires_at) e é limitado por LRU (last_access).
+-- ============================================
+CREATE TABLE IF NOT EXISTS response_cache (
+    cache_key TEXT PRIMARY KEY,  -- SHA-256 hex
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    response TEXT NOT NULL,  -- JSON serializado
+    created_at REAL NOT NULL,  -- Unix timestamp
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_response_cache_last_access ON response_cache(last_access);
+
+-- ============================================
+-- TABLE: usage_daily (Rollup de uso por dia/provedor/modelo)
+-- Descrição: Contadores mantidos incrementalmente por trigger a cada nova mensagem.
+-- Consultas de estatísticas leem apenas esta tabela (nunca varrem `messages`).
+-- ============================================
+CREATE TABLE IF NOT EXISTS usage_daily (
+    day TEXT NOT NULL,  -- 'YYYY-MM-DD' (derivado de messages.timestamp)
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    token_count INTEGER NOT NULL DEFAULT 0,  -- Soma de meta_info.tokens
+    PRIMARY KEY (day, provider, model)
+) WITHOUT ROWID;
+
+-- ============================================
+-- TABLE: conversation_signatures (MinHash por conversa)
+-- Descrição: Assinatura MinHash do texto da conversa, calculada na importação.
+-- ============================================
+CREATE TABLE IF NOT EXISTS conversation_signatures (
+    conversation_id TEXT PRIMARY KEY,
+    signature BLOB NOT NULL,  -- NUM_PERM inteiros uint64 little-endian
+    shingle_count INTEGER NOT NULL,
+    created_at TEXT NOT NULL DEFAULT (datetime('now'))
+) WITHOUT ROWID;
+
+-- ============================================
+-- TABLE: lsh_buckets (Índice LSH por bandas)
+-- Descrição: Conversas com o mesmo bucket numa banda são candidatas a quase-duplicatas.
+-- ============================================
+CREATE TABLE IF NOT EXISTS lsh_buckets (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,  -- Hash de 64 bits das linhas da banda
+    conversation_id TEXT NOT NULL,
+    PRIMARY KEY (band, bucket, conversation_id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_lsh_buckets_conversation_id ON lsh_buckets(conversation_id);
+
+-- Mensagem nova invalida a assinatura da conversa; `DuplicateIndex.index_missing`
+-- (chamado por `clusters()`) recalcula sob demanda
+CREATE TRIGGER IF NOT EXISTS invalidate_signature_on_message_insert
+AFTER INSERT ON messages
+BEGIN
+    DELETE FROM lsh_buckets WHERE conversation_id = NEW.conversation_id;
+    DELETE FROM conversation_signatures WHERE conversation_id = NEW.conversation_id;
+END;
+
+-- ============================================
+-- TABLE: rendered_messages (Cache de mensagens renderizadas)
+-- Descrição: HTML sanitizado do conteúdo (Markdown, código, LaTeX) pronto para a UI.
+-- Chave = hash do conteúdo + versão do renderizador (conteúdos iguais compartilham a linha).
+-- ============================================
+CREATE TABLE IF NOT EXISTS rendered_messages (
+    content_hash TEXT NOT NULL,  -- SHA-256 hex de messages.content
+    renderer_version INTEGER NOT NULL,
+    html TEXT NOT NULL,
+    created_at TEXT NOT NULL DEFAULT (datetime('now')),
+    PRIMARY KEY (content_hash, renderer_version)
+) WITHOUT ROWID;
+
+-- ============================================
+-- TABLE: changes (Change feed)
+-- Descrição: Log append-only de alterações em projects, conversations e messages,
+-- preenchido por trigger. A UI consulta apenas o que mudou desde o último `seq`.
+-- ============================================
+CREATE TABLE IF NOT EXISTS changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,  -- Monotônico, nunca reutilizado
+    entity TEXT NOT NULL CHECK(entity IN ('project', 'conversation', 'message')),
+    entity_id TEXT NOT NULL,
+    op TEXT NOT NULL CHECK(op IN ('insert', 'update', 'delete')),
+    parent_id TEXT,  -- conversation_id (mensagens) ou project_id (conversas)
+    changed_at TEXT NOT NULL DEFAULT (datetime('now'))
+);
+
+-- Compactação: MAX(seq) por entidade lido direto do índice, sem ordenar a tabela
+CREATE INDEX IF NOT EXISTS idx_changes_entity ON changes(entity, entity_id, seq);
+
 -- ============================================
 -- TRIGGERS: Auto-update timestamps
 -- ============================================
@@ -79,8 +229,12 @@ BEGIN
     UPDATE projects SET updated_at = datetime('now') WHERE id = NEW.id;
 END;
 
-CREATE TRIGGER IF NOT EXISTS update_conversations_timestamp 
+-- Não sobrescreve um updated_at gravado explicitamente (ex: horário original de
+-- mensagens importadas). DROP: bancos existentes recebem a nova condição
+DROP TRIGGER IF EXISTS update_conversations_timestamp;
+CREATE TRIGGER update_conversations_timestamp
 AFTER UPDATE ON conversations
+WHEN NEW.updated_at IS OLD.updated_at
 BEGIN
     UPDATE conversations SET updated_at = datetime('now') WHERE id = NEW.id;
 END;
@@ -91,3 +245,146 @@ AFTER INSERT ON messages
 BEGIN
     UPDATE conversations SET updated_at = NEW.timestamp WHERE id = NEW.conversation_id;
 END;
+
+-- Trigger para manter o rollup de uso (usage_daily) a cada nova mensagem
+CREATE TRIGGER IF NOT EXISTS update_usage_on_new_message
+AFTER INSERT ON messages
+BEGIN
+    INSERT INTO usage_daily (day, provider, model, message_count, token_count)
+    SELECT
+        substr(NEW.timestamp, 1, 10),
+        c.provider,
+        c.model,
+        1,
+        CASE WHEN json_valid(NEW.meta_info)
+             THEN CAST(COALESCE(json_extract(NEW.meta_info, '$.tokens'), 0) AS INTEGER)
+             ELSE 0 END
+    FROM conversations c
+    WHERE c.id = NEW.conversation_id
+    ON CONFLICT(day, provider, model) DO UPDATE SET
+        message_count = message_count + excluded.message_count,
+        token_count = token_count + excluded.token_count;
+END;
+
+-- Trigger para ajustar tokens do rollup quando meta_info muda (ex: finalização de streaming)
+CREATE TRIGGER IF NOT EXISTS update_usage_on_message_meta_change
+AFTER UPDATE OF meta_info ON messages
+BEGIN
+    UPDATE usage_daily SET token_count = token_count
+        + (CASE WHEN json_valid(NEW.meta_info)
+                THEN CAST(COALESCE(json_extract(NEW.meta_info, '$.tokens'), 0) AS INTEGER)
+                ELSE 0 END)
+        - (CASE WHEN json_valid(OLD.meta_info)
+                THEN CAST(COALESCE(json_extract(OLD.meta_info, '$.tokens'), 0) AS INTEGER)
+                ELSE 0 END)
+    WHERE day = substr(NEW.timestamp, 1, 10)
+      AND (provider, model) = (SELECT provider, model FROM conversations WHERE id = NEW.conversation_id);
+END;
+
+-- Triggers para descontar do rollup mensagens e conversas removidas (ex: merge de duplicatas).
+-- O arquivamento repõe o rollup dos dias afetados na própria transação (Archiver._move).
+-- DROP: bancos existentes perdem a condição antiga (marcador `archive_move` em settings)
+DROP TRIGGER IF EXISTS update_usage_on_message_delete;
+CREATE TRIGGER update_usage_on_message_delete
+AFTER DELETE ON messages
+BEGIN
+    UPDATE usage_daily SET
+        message_count = message_count - 1,
+        token_count = token_count
+            - (CASE WHEN json_valid(OLD.meta_info)
+                    THEN CAST(COALESCE(json_extract(OLD.meta_info, '$.tokens'), 0) AS INTEGER)
+                    ELSE 0 END)
+    WHERE day = substr(OLD.timestamp, 1, 10)
+      AND (provider, model) = (SELECT provider, model FROM conversations WHERE id = OLD.conversation_id);
+END;
+
+-- No ON DELETE CASCADE a conversa já não existe quando as mensagens são apagadas:
+-- desconta as mensagens restantes antes de remover a conversa
+DROP TRIGGER IF EXISTS update_usage_on_conversation_delete;
+CREATE TRIGGER update_usage_on_conversation_delete
+BEFORE DELETE ON conversations
+BEGIN
+    UPDATE usage_daily SET
+        message_count = message_count - (
+            SELECT COUNT(*) FROM messages m
+            WHERE m.conversation_id = OLD.id AND substr(m.timestamp, 1, 10) = usage_daily.day
+        ),
+        token_count = token_count - (
+            SELECT COALESCE(SUM(CASE WHEN json_valid(m.meta_info)
+                    THEN CAST(COALESCE(json_extract(m.meta_info, '$.tokens'), 0) AS INTEGER)
+                    ELSE 0 END), 0)
+            FROM messages m
+            WHERE m.conversation_id = OLD.id AND substr(m.timestamp, 1, 10) = usage_daily.day
+        )
+    WHERE provider = OLD.provider AND model = OLD.model
+      AND day IN (SELECT substr(timestamp, 1, 10) FROM messages WHERE conversation_id = OLD.id);
+END;
+
+-- ============================================
+-- TRIGGERS: Change feed (tabela `changes`)
+-- Em projects/conversations, só colunas visíveis geram 'update': os triggers
+-- de updated_at não duplicam entradas (uma nova mensagem já registra o
+-- conversation_id em parent_id).
+-- ============================================
+CREATE TRIGGER IF NOT EXISTS changes_projects_insert
+AFTER INSERT ON projects
+BEGIN
+    INSERT INTO changes (entity, entity_id, op, parent_id)
+    VALUES ('project', NEW.id, 'insert', NULL);
+END;
+
+CREATE TRIGGER IF NOT EXISTS changes_projects_update
+AFTER UPDATE OF name, description, global_instructions ON projects
+BEGIN
+    INSERT INTO changes (entity, entity_id, op, parent_id)
+    VALUES ('project', NEW.id, 'update', NULL);
+END;
+
+CREATE TRIGGER IF NOT EXISTS changes_projects_delete
+AFTER DELETE ON projects
+BEGIN
+    INSERT INTO changes (entity, entity_id, op, parent_id)
+    VALUES ('project', OLD.id, 'delete', NULL);
+END;
+
+CREATE TRIGGER IF NOT EXISTS changes_conversations_insert
+AFTER INSERT ON conversations
+BEGIN
+    INSERT INTO changes (entity, entity_id, op, parent_id)
+    VALUES ('conversation', NEW.id, 'insert', NEW.project_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS changes_conversations_update
+AFTER UPDATE OF project_id, provider, model, title ON conversations
+BEGIN
+    INSERT INTO changes (entity, entity_id, op, parent_id)
+    VALUES ('conversation', NEW.id, 'update', NEW.project_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS changes_conversations_delete
+AFTER DELETE ON conversations
+BEGIN
+    INSERT INTO changes (entity, entity_id, op, parent_id)
+    VALUES ('conversation', OLD.id, 'delete', OLD.project_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS changes_messages_insert
+AFTER INSERT ON messages
+BEGIN
+    INSERT INTO changes (entity, entity_id, op, parent_id)
+    VALUES ('message', NEW.id, 'insert', NEW.conversation_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS changes_messages_update
+AFTER UPDATE ON messages
+BEGIN
+    INSERT INTO changes (entity, entity_id, op, parent_id)
+    VALUES ('message', NEW.id, 'update', NEW.conversation_id);
+END;
+
+CREATE TRIGGER IF NOT EXISTS changes_messages_delete
+AFTER DELETE ON messages
+BEGIN
+    INSERT INTO changes (entity, entity_id, op, parent_id)
+    VALUES ('message', OLD.id, 'delete', OLD.conversation_id);
+END;
@@ -8,9 +8,36 @@ import shutil
 from pathlib import Path
 from datetime import datetime
 import json
+import threading
+import sqlite3
+import asyncio
+import time
+import io
+import os
+import subprocess
+import sys
+import zipfile
+from contextlib import redirect_stdout
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 from database import Database, Project, Conversation, Message
 from logger import ExecutionLogger, DecisionLogger
+from usage_stats import UsageStats
+from providers import ProviderConfig, ProviderGateway, ProviderError, ProviderTimeoutError, _build_request
+from response_cache import ResponseCache
+from scheduler import RequestScheduler, EndpointLimits, INTERACTIVE, BACKGROUND
+import nextmind
+from import_archive import iter_json_array, import_conversations, open_conversations_file, ExportFiles
+from import_chatgpt import import_chatgpt_conversations
+from blob_store import BlobStore, Attachment
+from maintenance import MaintenanceScheduler
+from archive import Archiver
+from dedup import DuplicateIndex, shingles, minhash, similarity
+from profiling import Profiler, phase, PROFILE_ENV
+from change_feed import ChangeFeed
+from markdown_render import render_markdown
+from render_cache import RenderCache
 
 
 class TestDatabase(unittest.TestCase):
@@ -114,6 +141,1827 @@ class TestDatabase(unittest.TestCase):
         self.assertEqual(len(conversations), 1)
         self.assertEqual(conversations[0]['project_id'], project_id)
 
+    def test_iter_variants_stream_projected_records(self):
+        """Test iter_* variants yield compact records in list_* order."""
+        project_id = Project(self.db).create(name="Iter Project")
+        conv = Conversation(self.db)
+        conv_id = conv.create(provider="openai", model="gpt-4", title="Iter", project_id=project_id)
+        msg = Message(self.db)
+        for i in range(7):
+            msg.create(conversation_id=conv_id, role="user", content=f"message {i}",
+                       meta_info={"i": i})
+
+        records = list(msg.iter_by_conversation(conv_id, exclude=('content', 'meta_info'),
+                                                batch_size=3))
+        expected = msg.list_by_conversation(conv_id)
+        self.assertEqual([r.id for r in records], [m['id'] for m in expected])
+        self.assertFalse(hasattr(records[0], 'content'))
+        self.assertFalse(hasattr(records[0], '__dict__'))
+
+        contents = [r.content for r in msg.iter_by_conversation(conv_id, columns=('content',))]
+        self.assertEqual(contents, [m['content'] for m in expected])
+        self.assertEqual([r.title for r in conv.iter_by_project(project_id, columns=('title',))],
+                         ["Iter"])
+        self.assertEqual([p.name for p in Project(self.db).iter_all()], ["Iter Project"])
+
+        with self.assertRaises(ValueError):
+            msg.iter_by_conversation(conv_id, columns=('content; DROP TABLE messages',))
+
+
+class TestWriteQueue(unittest.TestCase):
+    """Test the coalescing single-writer queue."""
+
+    def setUp(self):
+        """Create a temporary database with the write queue enabled."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.db = Database(str(Path(self.temp_dir) / "test.db"))
+        self.db.initialize_schema()
+        self.conv_id = Conversation(self.db).create(
+            provider="openai", model="gpt-4", title="Concurrent"
+        )
+        self.db.enable_write_queue()
+
+    def tearDown(self):
+        """Clean up temporary database."""
+        self.db.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_concurrent_creates_are_group_committed(self):
+        """Test concurrent Message.create callers share transactions."""
+        msg = Message(self.db)
+        errors = []
+
+        def writer():
+            try:
+                for i in range(50):
+                    msg.create(conversation_id=self.conv_id, role="user", content=f"m{i}")
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=writer) for _ in range(16)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(msg.list_by_conversation(self.conv_id)), 800)
+        stats = self.db.write_queue.stats
+        self.assertEqual(stats['writes'], 800)
+        self.assertLess(stats['transactions'], stats['writes'])
+
+    def test_failed_request_is_isolated(self):
+        """Test a failing write only fails its own caller."""
+        msg = Message(self.db)
+        with self.assertRaises(sqlite3.IntegrityError):
+            msg.create(conversation_id=self.conv_id, role="robot", content="x")
+        msg.create(conversation_id=self.conv_id, role="user", content="ok")
+        self.assertEqual(len(msg.list_by_conversation(self.conv_id)), 1)
+
+    def test_writer_survives_batch_failure(self):
+        """Test an error outside the per-request savepoint fails the batch, not the writer."""
+        queue = self.db.write_queue
+        # Liberar o savepoint do próprio pedido faz o ROLLBACK TO falhar fora do try
+        broken = queue.submit([("RELEASE write_request", ()), ("SELECT * FROM missing_table", ())])
+        with self.assertRaises(sqlite3.Error):
+            broken.result(timeout=5)
+
+        msg = Message(self.db)
+        msg.create(conversation_id=self.conv_id, role="user", content="still writing")
+        self.assertEqual(len(msg.list_by_conversation(self.conv_id)), 1)
+        self.assertGreaterEqual(queue.stats['errors'], 1)
+
+
+class TestMessageStream(unittest.TestCase):
+    """Test streaming message persistence."""
+
+    def setUp(self):
+        """Create a temporary database with a conversation."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.db = Database(str(Path(self.temp_dir) / "test.db"))
+        self.db.initialize_schema()
+        self.conv_id = Conversation(self.db).create(
+            provider="openai", model="gpt-4", title="Streaming"
+        )
+        self.msg = Message(self.db)
+
+    def tearDown(self):
+        """Clean up temporary database."""
+        self.db.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_stream_checkpoints_and_finalize(self):
+        """Test chunks are checkpointed in bounded batches and finalized."""
+        stream = self.msg.begin_stream(
+            self.conv_id, checkpoint_interval=60, checkpoint_chars=10
+        )
+        for _ in range(20):
+            stream.append("abcd")
+
+        # 80 caracteres em checkpoints de 12 (3 chunks); 8 ainda em buffer
+        self.assertEqual(stream.checkpoints, 6)
+        chunks = self.db.connect().execute(
+            "SELECT content FROM message_chunks WHERE message_id = ? ORDER BY seq",
+            (stream.message_id,)
+        ).fetchall()
+        self.assertEqual(''.join(c['content'] for c in chunks), "abcd" * 18)
+
+        stream.finalize({"tokens": 20})
+        messages = self.msg.list_by_conversation(self.conv_id)
+        self.assertEqual(messages[0]['content'], "abcd" * 20)
+        meta = json.loads(messages[0]['meta_info'])
+        self.assertEqual(meta['chunks'], 20)
+        self.assertIn('first_token_ms', meta)
+        self.assertIn('latency_ms', meta)
+        self.assertNotIn('streaming', meta)
+        self.assertEqual(UsageStats(self.db).totals()['tokens'], 20)
+
+        remaining = self.db.connect().execute(
+            "SELECT COUNT(*) FROM message_chunks"
+        ).fetchone()[0]
+        self.assertEqual(remaining, 0)
+
+    def test_recover_interrupted_stream(self):
+        """Test checkpointed content survives an interrupted stream."""
+        stream = self.msg.begin_stream(self.conv_id, checkpoint_chars=1)
+        stream.append("partial ")
+        stream.append("reply")
+
+        # Heartbeat recente: o stream pode estar vivo em outro processo
+        self.assertEqual(self.msg.recover_streams(), [])
+        conn = self.db.connect()
+        with conn:
+            conn.execute("UPDATE message_streams SET last_heartbeat_at = datetime('now', '-10 minutes')")
+        recovered = self.msg.recover_streams()
+        self.assertEqual(recovered, [stream.message_id])
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM message_streams").fetchone()[0], 0)
+        message = self.msg.list_by_conversation(self.conv_id)[0]
+        self.assertEqual(message['content'], "partial reply")
+        self.assertTrue(json.loads(message['meta_info'])['interrupted'])
+
+    def test_stalled_stream_flushed_by_time(self):
+        """Test buffered chunks are checkpointed after the interval even without new appends."""
+        self.db.enable_write_queue()
+        stream = self.msg.begin_stream(self.conv_id, checkpoint_interval=0.05, checkpoint_chars=1000)
+        stream.append("waiting for the next token")
+        self.assertEqual(stream.checkpoints, 0)
+
+        deadline = time.monotonic() + 5
+        while stream.checkpoints == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        saved = self.db.connect().execute(
+            "SELECT content FROM message_chunks WHERE message_id = ?", (stream.message_id,)
+        ).fetchall()
+        self.assertEqual([row['content'] for row in saved], ["waiting for the next token"])
+        stream.finalize()
+        self.assertFalse(stream.flush_if_due())
+
+    def test_streams_share_one_flush_thread(self):
+        """Test open streams are flushed by a single thread that exits once all are finalized."""
+        self.db.enable_write_queue()
+        before = set(threading.enumerate())
+        streams = [
+            self.msg.begin_stream(self.conv_id, checkpoint_interval=0.05, checkpoint_chars=1000)
+            for _ in range(5)
+        ]
+        for i, stream in enumerate(streams):
+            stream.append(f"token {i}")
+        flushers = [t for t in set(threading.enumerate()) - before if t.name == "nextmind-stream-flush"]
+        self.assertEqual(len(flushers), 1)
+
+        deadline = time.monotonic() + 5
+        while any(s.checkpoints == 0 for s in streams) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual([s.checkpoints for s in streams], [1] * 5)
+        heartbeats = self.db.connect().execute(
+            "SELECT COUNT(*) FROM message_streams WHERE last_heartbeat_at IS NOT NULL"
+        ).fetchone()[0]
+        self.assertEqual(heartbeats, 5)
+
+        for stream in streams:
+            stream.finalize()
+        self.assertEqual(self.db.stream_flusher.active, 0)
+        flushers[0].join(timeout=5)
+        self.assertFalse(flushers[0].is_alive())
+
+
+class StubProviderServer:
+    """Local OpenAI-compatible HTTP server used to test provider clients."""
+
+    def __init__(self, delay: float = 0.0, parallel: int = None):
+        """`parallel` caps requests processed at once, like Ollama's NUM_PARALLEL (None: no cap)."""
+        self.delay = delay
+        self.connections = 0
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.events = []
+        lock = threading.Lock()
+        slots = threading.Semaphore(parallel) if parallel else None
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                with lock:
+                    stub.connections += 1
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                if slots is not None:
+                    # Backend serial: as demais requisições esperam na fila do servidor
+                    slots.acquire()
+                try:
+                    self.process(body)
+                finally:
+                    if slots is not None:
+                        slots.release()
+
+            def process(self, body):
+                with lock:
+                    stub.requests.append((self.path, body))
+                    stub.events.append(('start', body.get('model')))
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                time.sleep(body.get('delay', stub.delay))
+                with lock:
+                    stub.in_flight -= 1
+                if body.get('model') == 'broken':
+                    payload = b'{"error": "boom"}'
+                    self.send_response(500)
+                elif self.path.endswith('/embeddings'):
+                    payload = json.dumps({
+                        "data": [
+                            {"index": i, "embedding": [float(len(text)), float(i)]}
+                            for i, text in enumerate(body['input'])
+                        ],
+                        "usage": {"total_tokens": len(body['input'])},
+                    }).encode('utf-8')
+                    self.send_response(200)
+                else:
+                    payload = json.dumps({
+                        "choices": [{"message": {"content": f"echo:{body['messages'][-1]['content']}"}}],
+                        "usage": {"total_tokens": 7},
+                    }).encode('utf-8')
+                    self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                # trickle: corpo enviado em partes espaçadas (cada leitura cabe no timeout do socket)
+                chunks = body.get('trickle', 1)
+                step = -(-len(payload) // chunks)
+                for i in range(0, len(payload), step):
+                    if i:
+                        time.sleep(body.get('trickle_delay', 0))
+                    self.wfile.write(payload[i:i + step])
+                    self.wfile.flush()
+                with lock:
+                    stub.events.append(('done', body.get('model')))
+                # drop: encerra a conexão keep-alive sem avisar o cliente
+                if body.get('drop'):
+                    self.close_connection = True
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        # Clientes que desistem por timeout fecham a conexão antes da resposta
+        self.server.handle_error = lambda request, client_address: None
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TestProviderGateway(unittest.TestCase):
+    """Test the pooled provider gateway against a local stub server."""
+
+    def setUp(self):
+        """Start the stub server and a gateway pointing to it."""
+        self.stub = StubProviderServer()
+        self.gateway = ProviderGateway([
+            ProviderConfig("lmstudio", self.stub.url, "openai", max_concurrency=2, timeout=0.5)
+        ])
+
+    def tearDown(self):
+        """Stop the gateway and the stub server."""
+        self.gateway.close()
+        self.stub.close()
+
+    def test_keep_alive_connection_reuse(self):
+        """Test sequential requests reuse one pooled connection."""
+        async def run():
+            for i in range(5):
+                result = await self.gateway.complete(
+                    "lmstudio", "local-model", [{"role": "user", "content": str(i)}]
+                )
+                self.assertEqual(result['content'], f"echo:{i}")
+                self.assertEqual(result['tokens'], 7)
+
+        asyncio.run(run())
+        self.assertEqual(self.stub.connections, 1)
+        self.assertEqual(self.stub.requests[0][0], "/v1/chat/completions")
+
+    def test_fan_out_respects_concurrency_limit(self):
+        """Test concurrent fan-out is capped by the provider limit."""
+        self.stub.delay = 0.05
+        requests = [
+            {"provider": "lmstudio", "model": f"m{i}", "messages": [{"role": "user", "content": "hi"}]}
+            for i in range(6)
+        ] + [{"provider": "lmstudio", "model": "broken", "messages": [{"role": "user", "content": "hi"}]}]
+
+        results = asyncio.run(self.gateway.fan_out(requests))
+
+        self.assertEqual([r['model'] for r in results[:6]], [f"m{i}" for i in range(6)])
+        self.assertIsInstance(results[6], ProviderError)
+        self.assertEqual(results[6].status, 500)
+        self.assertEqual(self.stub.max_in_flight, 2)
+        self.assertLessEqual(self.stub.connections, 2)
+
+    def test_timeout(self):
+        """Test slow providers raise ProviderTimeoutError."""
+        with self.assertRaises(ProviderTimeoutError):
+            asyncio.run(self.gateway.complete(
+                "lmstudio", "slow", [{"role": "user", "content": "hi"}], delay=1.0
+            ))
+
+    def test_timed_out_request_holds_its_slot(self):
+        """Test a timed-out call keeps its concurrency slot until the worker thread returns."""
+        gateway = ProviderGateway([
+            ProviderConfig("lmstudio", self.stub.url, "openai", max_concurrency=1, timeout=0.5)
+        ])
+
+        async def run():
+            with self.assertRaises(ProviderTimeoutError):
+                await gateway.complete("lmstudio", "slow", [{"role": "user", "content": "hi"}],
+                                       use_cache=False, trickle=5, trickle_delay=0.3)
+            return await gateway.complete("lmstudio", "next", [{"role": "user", "content": "hi"}])
+
+        try:
+            self.assertEqual(asyncio.run(run())['content'], "echo:hi")
+        finally:
+            gateway.close()
+        # A próxima requisição só começa depois que a abandonada terminou
+        self.assertLess(self.stub.events.index(('done', 'slow')), self.stub.events.index(('start', 'next')))
+
+    def test_network_errors_and_dropped_connections(self):
+        """Test only socket timeouts map to ProviderTimeoutError and dropped idle connections are replaced."""
+        gateway = ProviderGateway([ProviderConfig("lmstudio", "http://nextmind-test.invalid", "openai")])
+        try:
+            with self.assertRaises(ProviderError) as ctx:
+                asyncio.run(gateway.complete("lmstudio", "m", [{"role": "user", "content": "hi"}]))
+        finally:
+            gateway.close()
+        self.assertNotIsInstance(ctx.exception, ProviderTimeoutError)
+
+        async def run():
+            for i in range(2):
+                await self.gateway.complete("lmstudio", "m", [{"role": "user", "content": str(i)}],
+                                            drop=True)
+
+        asyncio.run(run())
+        # Conexão fechada pelo servidor é descartada antes do envio: nenhum POST repetido
+        self.assertEqual(len(self.stub.requests), 2)
+        self.assertEqual(self.stub.connections, 2)
+
+    def test_google_model_is_quoted(self):
+        """Test model names are escaped in the Google request path."""
+        config = ProviderConfig("google", "https://example.invalid", "google", api_key="k")
+        path, _, _ = _build_request(config, "../evil?x=1", [{"role": "user", "content": "hi"}], {})
+        self.assertEqual(path, "/v1beta/models/..%2Fevil%3Fx%3D1:generateContent")
+
+    def test_embed_batch(self):
+        """Test embeddings for several inputs come back in one request, in order."""
+        result = asyncio.run(self.gateway.embed("lmstudio", "embedder", ["a", "bbb"]))
+        self.assertEqual(result['embeddings'], [[1.0, 0.0], [3.0, 1.0]])
+        self.assertEqual(self.stub.requests, [("/v1/embeddings", {"model": "embedder", "input": ["a", "bbb"]})])
+
+
+class TestRequestScheduler(unittest.TestCase):
+    """Test priority scheduling of model calls against a local stub server."""
+
+    def setUp(self):
+        """Start the stub server and a gateway with three slots."""
+        self.stub = StubProviderServer()
+        self.gateway = ProviderGateway([
+            ProviderConfig("lmstudio", self.stub.url, "openai", max_concurrency=3, timeout=10)
+        ])
+
+    def tearDown(self):
+        """Stop the gateway and the stub server."""
+        self.gateway.close()
+        self.stub.close()
+
+    def _call(self, caller, content, delay, priority=INTERACTIVE):
+        """Chat call through the scheduler, or straight to the gateway (no priority)."""
+        extra = {'priority': priority} if isinstance(caller, RequestScheduler) else {}
+        return caller.complete("lmstudio", "local-model", [{"role": "user", "content": content}],
+                               use_cache=False, delay=delay, **extra)
+
+    def test_interactive_preempts_queued_background(self):
+        """Test a chat request jumps ahead of background work already queued."""
+        scheduler = RequestScheduler(self.gateway, {"lmstudio": EndpointLimits(1)})
+
+        async def run():
+            background = [
+                asyncio.ensure_future(self._call(scheduler, f"bg{i}", 0.05, BACKGROUND))
+                for i in range(3)
+            ]
+            await asyncio.sleep(0.02)
+            await self._call(scheduler, "chat", 0)
+            await asyncio.gather(*background)
+
+        asyncio.run(run())
+        order = [body['messages'][0]['content'] for _, body in self.stub.requests]
+        self.assertEqual(order, ["bg0", "chat", "bg1", "bg2"])
+        self.assertEqual(scheduler.stats['interactive'], 1)
+        self.assertEqual(scheduler.stats['background'], 3)
+
+    async def _worst_chat_latency(self, caller, background_count):
+        """Worst latency of 5 sequential chats while `background_count` jobs are pending.
+
+        Also returns, per chat, how many background requests the backend started
+        between the chat being issued and the chat itself starting.
+        """
+        background = [
+            asyncio.ensure_future(self._call(caller, f"bg{i}", 0.1, BACKGROUND))
+            for i in range(background_count)
+        ]
+        await asyncio.sleep(0.02)
+        latencies, overtaken = [], []
+        for i in range(5):
+            issued = len(self.stub.requests)
+            start = time.perf_counter()
+            await self._call(caller, f"chat{i}", 0.02)
+            latencies.append(time.perf_counter() - start)
+            started = [body['messages'][0]['content'] for _, body in self.stub.requests[issued:]]
+            overtaken.append(started.index(f"chat{i}"))
+        await asyncio.gather(*background)
+        return max(latencies), overtaken
+
+    def test_interactive_latency_flat_under_background_load(self):
+        """Benchmark: chat latency under background load stays close to the idle latency."""
+        scheduler = RequestScheduler(self.gateway)
+
+        idle, _ = asyncio.run(self._worst_chat_latency(scheduler, 0))
+        loaded, _ = asyncio.run(self._worst_chat_latency(scheduler, 30))
+        unscheduled, _ = asyncio.run(self._worst_chat_latency(self.gateway, 30))
+
+        self.assertLess(loaded, 2 * idle)
+        self.assertGreater(unscheduled, 5 * loaded)
+        self.assertLessEqual(self.stub.max_in_flight, 3)
+
+    def test_interactive_latency_on_serial_backend(self):
+        """Benchmark: with a one-request-at-a-time backend, chat waits for at most the running job."""
+        self.gateway.close()
+        self.stub.close()
+        self.stub = StubProviderServer(parallel=1)
+        self.gateway = ProviderGateway([
+            ProviderConfig("lmstudio", self.stub.url, "openai", max_concurrency=1, timeout=10)
+        ])
+        scheduler = RequestScheduler(self.gateway, {"lmstudio": EndpointLimits(1)})
+
+        idle, _ = asyncio.run(self._worst_chat_latency(scheduler, 0))
+        loaded, overtaken = asyncio.run(self._worst_chat_latency(scheduler, 30))
+        unscheduled, _ = asyncio.run(self._worst_chat_latency(self.gateway, 30))
+
+        # Sem vaga reservada, o chat espera só o job em andamento: nenhum job de
+        # segundo plano começa entre o pedido do chat e o próprio chat
+        self.assertEqual(overtaken, [0] * 5)
+        self.assertLess(idle, loaded)
+        self.assertGreater(unscheduled, 5 * loaded)
+        self.assertEqual(self.stub.max_in_flight, 1)
+
+    def test_embeddings_are_batched(self):
+        """Test pending embedding requests share one backend call up to max_batch."""
+        scheduler = RequestScheduler(self.gateway, {"lmstudio": EndpointLimits(3, max_batch=8)})
+
+        async def run():
+            return await asyncio.gather(*(
+                scheduler.embed("lmstudio", "embedder", ["x" * i, "y"]) for i in range(1, 6)
+            ))
+
+        results = asyncio.run(run())
+        self.assertEqual(results[2], [[3.0, 4.0], [1.0, 5.0]])
+        self.assertEqual([len(body['input']) for _, body in self.stub.requests], [8, 2])
+        self.assertEqual(scheduler.stats['batches'], 1)
+
+    def test_token_rate_limit(self):
+        """Test the token budget holds requests back until the real usage is refunded."""
+        scheduler = RequestScheduler(
+            self.gateway, {"lmstudio": EndpointLimits(3, tokens_per_minute=600)}
+        )
+
+        async def run():
+            return await asyncio.gather(*(
+                scheduler.complete("lmstudio", "local-model", [{"role": "user", "content": str(i)}],
+                                   use_cache=False, max_tokens=500, delay=0.05)
+                for i in range(2)
+            ))
+
+        results = asyncio.run(run())
+        self.assertEqual([r['content'] for r in results], ["echo:0", "echo:1"])
+        self.assertEqual(self.stub.max_in_flight, 1)
+        self.assertGreaterEqual(scheduler.stats['rate_limited'], 1)
+        self.assertGreater(results[1]['queued_ms'], 40)
+
+
+class TestResponseCache(unittest.TestCase):
+    """Test the two-tier LLM response cache."""
+
+    MESSAGES = [{"role": "user", "content": "Resuma isto"}]
+
+    def setUp(self):
+        """Create a temporary database and a cache with a fake clock."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.db = Database(str(Path(self.temp_dir) / "test.db"))
+        self.db.initialize_schema()
+        self.now = 1000.0
+        self.cache = ResponseCache(
+            self.db, ttl_seconds=60, max_entries=2, memory_entries=1, clock=lambda: self.now
+        )
+
+    def tearDown(self):
+        """Clean up temporary database."""
+        self.db.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_memory_and_disk_tiers(self):
+        """Test hits are served from memory first, then SQLite."""
+        self.assertIsNone(self.cache.get("openai", "gpt-4", self.MESSAGES))
+        self.cache.put("openai", "gpt-4", self.MESSAGES, None, {"content": "A"})
+        self.cache.put("openai", "gpt-4", self.MESSAGES, {"temperature": 0}, {"content": "B"})
+
+        # Parâmetros fazem parte da chave; a camada em memória guarda só 1 entrada
+        self.assertEqual(self.cache.get("openai", "gpt-4", self.MESSAGES, {"temperature": 0})["content"], "B")
+        self.assertEqual(self.cache.get("openai", "gpt-4", self.MESSAGES)["content"], "A")
+        self.assertEqual(self.cache.stats['memory_hits'], 1)
+        self.assertEqual(self.cache.stats['disk_hits'], 1)
+        self.assertAlmostEqual(self.cache.hit_rate(), 2 / 3)
+
+    def test_ttl_and_lru_eviction(self):
+        """Test expired entries miss and excess entries are evicted by LRU."""
+        for i in range(3):
+            self.now += 1
+            self.cache.put("openai", "gpt-4", [{"role": "user", "content": str(i)}], None, {"content": str(i)})
+
+        count = self.db.connect().execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+        self.assertEqual(count, 2)
+        self.assertIsNone(self.cache.get("openai", "gpt-4", [{"role": "user", "content": "0"}]))
+
+        self.now += 120
+        self.assertIsNone(self.cache.get("openai", "gpt-4", [{"role": "user", "content": "2"}]))
+
+    def test_reads_batch_access_and_eviction_purges_memory(self):
+        """Test memory hits count for LRU, reads never write and evicted keys leave memory."""
+        cache = ResponseCache(self.db, ttl_seconds=60, max_entries=2, memory_entries=3,
+                              clock=lambda: self.now)
+        first, second = [{"role": "user", "content": "A"}], [{"role": "user", "content": "B"}]
+        for messages in (first, second):
+            self.now += 1
+            cache.put("openai", "gpt-4", messages, None, {"content": messages[0]["content"]})
+
+        conn = self.db.connect()
+        writes_before = conn.total_changes
+        self.now += 1
+        self.assertEqual(cache.get("openai", "gpt-4", first)["content"], "A")
+        self.assertEqual(cache.stats['memory_hits'], 1)
+        self.assertEqual(conn.total_changes, writes_before)
+
+        # A eviction grava os acessos antes: sai B (menos recente), não A
+        self.now += 1
+        cache.put("openai", "gpt-4", [{"role": "user", "content": "C"}], None, {"content": "C"})
+        keys = {row[0] for row in conn.execute("SELECT cache_key FROM response_cache")}
+        self.assertIn(cache.make_key("openai", "gpt-4", first), keys)
+        self.assertNotIn(cache.make_key("openai", "gpt-4", second), keys)
+        self.assertIsNone(cache.get("openai", "gpt-4", second))
+
+    def test_failed_async_access_flush_is_logged_and_requeued(self):
+        """Test a failed write-queue flush logs the error and keeps the accesses for the next flush."""
+        self.cache.put("openai", "gpt-4", self.MESSAGES, None, {"content": "A"})
+        key = self.cache.make_key("openai", "gpt-4", self.MESSAGES)
+        conn = self.db.connect()
+        conn.execute(
+            "CREATE TRIGGER fail_access BEFORE UPDATE OF last_access ON response_cache "
+            "BEGIN SELECT RAISE(ABORT, 'disk full'); END"
+        )
+        conn.commit()
+        self.db.enable_write_queue()
+
+        self.now += 5
+        self.cache._touch(key, self.now)
+        with mock.patch('response_cache.get_execution_logger') as get_logger:
+            self.assertEqual(self.cache.flush_access(wait=False), 1)
+            self.db.write_job(lambda c: None)  # barreira: a fila resolve em ordem
+        entry = get_logger.return_value.log.call_args.kwargs
+        self.assertEqual(entry['status'], 'error')
+        self.assertIn("disk full", entry['error'])
+        self.assertEqual(self.cache._accessed, {key: self.now})
+
+        conn.execute("DROP TRIGGER fail_access")
+        conn.commit()
+        self.assertEqual(self.cache.flush_access(), 1)
+        last_access = conn.execute(
+            "SELECT last_access FROM response_cache WHERE cache_key = ?", (key,)
+        ).fetchone()[0]
+        self.assertEqual(last_access, self.now)
+
+    def test_gateway_uses_cache(self):
+        """Test repeated gateway requests skip the provider round-trip."""
+        stub = StubProviderServer()
+        gateway = ProviderGateway(
+            [ProviderConfig("lmstudio", stub.url, "openai")], cache=self.cache
+        )
+        try:
+            first = asyncio.run(gateway.complete("lmstudio", "m", self.MESSAGES))
+            second = asyncio.run(gateway.complete("lmstudio", "m", self.MESSAGES))
+        finally:
+            gateway.close()
+            stub.close()
+
+        self.assertEqual(len(stub.requests), 1)
+        self.assertEqual(second['content'], first['content'])
+        self.assertTrue(second['cached'])
+
+
+class TestUsageStats(unittest.TestCase):
+    """Test usage rollups and stats queries."""
+
+    def setUp(self):
+        """Create a temporary database with a few messages."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.db = Database(str(Path(self.temp_dir) / "test.db"))
+        self.db.initialize_schema()
+
+        conv = Conversation(self.db)
+        msg = Message(self.db)
+        gpt_id = conv.create(provider="openai", model="gpt-4", title="GPT")
+        claude_id = conv.create(provider="anthropic", model="claude-3-opus", title="Claude")
+        msg.create(conversation_id=gpt_id, role="user", content="Oi")
+        msg.create(conversation_id=gpt_id, role="assistant", content="Olá", meta_info={"tokens": 10})
+        msg.create(conversation_id=claude_id, role="assistant", content="Olá", meta_info={"tokens": 5})
+
+    def tearDown(self):
+        """Clean up temporary database."""
+        self.db.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_rollups_maintained_on_write(self):
+        """Test message inserts update the rollup table."""
+        rows = UsageStats(self.db).query(group_by=('provider',))
+        by_provider = {row['provider']: row for row in rows}
+        self.assertEqual(by_provider['openai']['messages'], 2)
+        self.assertEqual(by_provider['openai']['tokens'], 10)
+        self.assertEqual(by_provider['anthropic']['messages'], 1)
+        self.assertEqual(by_provider['anthropic']['tokens'], 5)
+
+    def test_query_range_and_invalid_group(self):
+        """Test time range filtering and group_by validation."""
+        stats = UsageStats(self.db)
+        today = datetime.utcnow().strftime("%Y-%m-%d")
+        self.assertEqual(stats.totals(today, today), {'messages': 3, 'tokens': 15})
+        self.assertEqual(stats.totals("1999-01-01", "1999-12-31"), {'messages': 0, 'tokens': 0})
+        with self.assertRaises(ValueError):
+            stats.query(group_by=('messages; DROP TABLE usage_daily',))
+
+    def test_rollups_decremented_on_delete(self):
+        """Test deleting messages or whole conversations removes them from the rollups."""
+        stats = UsageStats(self.db)
+        conn = self.db.connect()
+        with conn:
+            conn.execute("DELETE FROM messages WHERE content = 'Oi'")
+        by_provider = {row['provider']: row for row in stats.query(group_by=('provider',))}
+        self.assertEqual((by_provider['openai']['messages'], by_provider['openai']['tokens']), (1, 10))
+
+        # Com ON DELETE CASCADE (foreign_keys ativo em toda conexão) a conversa some antes das mensagens
+        self.assertEqual(conn.execute("PRAGMA foreign_keys").fetchone()[0], 1)
+        with conn:
+            conn.execute("DELETE FROM conversations WHERE provider = 'anthropic'")
+        self.assertEqual(stats.totals(), {'messages': 1, 'tokens': 10})
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0], 1)
+
+    def test_backfill_rebuilds_rollups(self):
+        """Test backfill recomputes rollups from existing messages."""
+        stats = UsageStats(self.db)
+        before = stats.query(group_by=('day', 'provider', 'model'))
+        self.db.connect().execute("DELETE FROM usage_daily")
+
+        result = stats.backfill()
+        self.assertEqual(result['messages'], 3)
+        self.assertEqual(stats.query(group_by=('day', 'provider', 'model')), before)
+
+
+class TestCLI(unittest.TestCase):
+    """Test the unified nextmind CLI."""
+
+    # Módulos do projeto que `stats` (comando curto chamado pela UI) precisa carregar
+    STATS_MODULES = {'database', 'logger', 'usage_stats'}
+    # Teto folgado para o tempo total de import da CLI (~60 ms medidos): mede import,
+    # não a partida do interpretador, e pega regressões grandes sem oscilar com a máquina
+    IMPORT_BUDGET_SECONDS = 0.25
+    # Módulos pesados que comandos curtos não devem carregar
+    LAZY_MODULES = ('import_chatgpt', 'import_claude', 'import_archive', 'zipfile', 'blob_store',
+                    'export_conversations', 'maintenance', 'archive', 'dedup', 'profiling', 'tracemalloc', 'change_feed',
+                    'render_cache', 'markdown_render', 'scheduler',
+                    'providers', 'asyncio', 'http.client', 'concurrent.futures')
+
+    def setUp(self):
+        """Create a temporary database with one conversation."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.temp_dir)  # ExecutionLogger grava em .tmp/logs relativo
+        self.db_path = str(Path(self.temp_dir) / "test.db")
+        db = Database(self.db_path)
+        db.initialize_schema()
+        conv_id = Conversation(db).create(provider="openai", model="gpt-4", title="CLI")
+        Message(db).create(conversation_id=conv_id, role="user", content="Olá 100% mundo")
+        db.close()
+
+    def tearDown(self):
+        """Clean up temporary database."""
+        os.chdir(self.cwd)
+        shutil.rmtree(self.temp_dir)
+
+    def run_cli(self, *argv):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            code = nextmind.main(["--db", self.db_path, *argv])
+        self.assertEqual(code, 0)
+        return json.loads(out.getvalue().strip().splitlines()[-1])
+
+    def test_subcommands(self):
+        """Test search, stats and export subcommands output JSON."""
+        results = self.run_cli("search", "100%")
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['conversation_title'], "CLI")
+        self.assertEqual(self.run_cli("search", "1_0"), [])
+
+        stats = self.run_cli("stats", "--group-by", "provider")
+        self.assertEqual(stats, [{"provider": "openai", "messages": 1, "tokens": 0}])
+
+        output = str(Path(self.temp_dir) / "export.json")
+        self.assertEqual(self.run_cli("export", output)['messages_exported'], 1)
+        with open(output, 'r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f)[0]['messages'][0]['content'], "Olá 100% mundo")
+
+    def test_schema_applied_once(self):
+        """Test ensure_schema skips re-running an unchanged schema."""
+        db = Database(self.db_path)
+        db.ensure_schema()
+        conn = db.connect()
+        conn.execute("CREATE TABLE marker (x)")
+        conn.execute("DROP INDEX idx_messages_timestamp")
+        db.ensure_schema()
+        indexes = conn.execute(
+            "SELECT name FROM sqlite_master WHERE name = 'idx_messages_timestamp'"
+        ).fetchall()
+        db.close()
+        self.assertEqual(indexes, [])
+
+    def test_cold_start_imports(self):
+        """Test short commands load only the modules they need within the import-time budget."""
+        script = Path(nextmind.__file__).resolve()
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", str(script), "--db", self.db_path, "stats"],
+            capture_output=True, text=True, cwd=self.temp_dir
+        )
+        self.assertEqual(proc.returncode, 0, proc.stderr)
+
+        # Linhas: "import time: self [us] | cumulative | imported package"
+        imports = {}
+        total_us = 0
+        for line in proc.stderr.splitlines():
+            if line.startswith("import time:") and "|" in line and "cumulative" not in line:
+                _, cumulative, name = line.split("|")
+                imports[name.strip()] = int(cumulative)
+                if not name[1:].startswith(" "):
+                    # Import de nível superior: o cumulativo já inclui os aninhados
+                    total_us += int(cumulative)
+        breakdown = ", ".join(
+            f"{name}={us / 1000:.1f}ms"
+            for name, us in sorted(imports.items(), key=lambda i: -i[1])[:10]
+        )
+
+        for module in self.LAZY_MODULES:
+            self.assertNotIn(module, imports, f"{module} carregado na partida ({breakdown})")
+        project_modules = {path.stem for path in script.parent.glob("*.py")}
+        self.assertEqual(project_modules & set(imports), self.STATS_MODULES, breakdown)
+        self.assertLess(total_us / 1e6, self.IMPORT_BUDGET_SECONDS, breakdown)
+
+
+class TestImportArchive(unittest.TestCase):
+    """Test importing exports straight from zip archives."""
+
+    CHATGPT = [{
+        "title": "GPT chat",
+        "mapping": {
+            "root": {"parent": None, "children": ["a"], "message": None},
+            "a": {"parent": "root", "children": ["b"], "message": {
+                "author": {"role": "user"}, "content": {"parts": ["Oi"]}, "create_time": 1700000000}},
+            "b": {"parent": "a", "children": [], "message": {
+                "author": {"role": "assistant"}, "content": {"parts": ["Olá!"]}, "create_time": 1700000001}},
+        },
+    }]
+    CLAUDE = [{
+        "name": "Claude chat",
+        "chat_messages": [
+            {"sender": "human", "text": "Oi", "created_at": "2024-01-01T00:00:00Z",
+             "attachments": [{"file_name": "notas.txt", "file_type": "txt", "extracted_content": "notas"}]},
+            {"sender": "assistant", "text": "Olá!", "created_at": "2024-01-01T00:00:01Z"},
+            {"sender": "human", "text": "Tudo bem?", "created_at": "2024-01-01T00:00:02Z"},
+        ],
+    }]
+
+    def setUp(self):
+        """Create a temporary database and log directory."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.temp_dir)  # ExecutionLogger grava em .tmp/logs relativo
+        self.db = Database(str(Path(self.temp_dir) / "test.db"))
+        self.db.initialize_schema()
+
+    def tearDown(self):
+        """Clean up temporary files."""
+        os.chdir(self.cwd)
+        self.db.close()
+        shutil.rmtree(self.temp_dir)
+
+    def make_zip(self, name, data, files=None):
+        path = str(Path(self.temp_dir) / name)
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("chat.html", "<html></html>")
+            zf.writestr("conversations.json", json.dumps(data, ensure_ascii=False))
+            for member, content in (files or {}).items():
+                zf.writestr(member, content)
+        return path
+
+    def test_iter_json_array_small_chunks(self):
+        """Test incremental decoding across chunk boundaries."""
+        items = [{"text": "x" * 50, "n": i} for i in range(20)]
+        decoded = list(iter_json_array(io.StringIO(json.dumps(items, indent=1)), chunk_size=7))
+        self.assertEqual(decoded, items)
+
+    def test_autodetect_from_zip(self):
+        """Test both formats import from zip through one entry point."""
+        with redirect_stdout(io.StringIO()):
+            gpt = import_conversations(self.make_zip("gpt.zip", self.CHATGPT), self.db)
+            claude = import_conversations(self.make_zip("claude.zip", self.CLAUDE), self.db)
+
+        self.assertEqual((gpt['source'], gpt['messages_imported']), ('chatgpt', 2))
+        self.assertEqual((claude['source'], claude['messages_imported']), ('claude', 3))
+        self.assertEqual(claude['attachments_imported'], 1)
+        providers = {c['provider'] for c in Conversation(self.db).list_by_project(None)}
+        self.assertEqual(providers, {'openai', 'anthropic'})
+
+    def test_imported_messages_keep_original_timestamps(self):
+        """Test imported messages roll up on their export day and age the conversation for archival."""
+        claude = json.loads(json.dumps(self.CLAUDE))
+        claude[0]['chat_messages'][2]['created_at'] = "2024-01-01T23:30:00-03:00"
+        with redirect_stdout(io.StringIO()):
+            import_conversations(self.make_zip("gpt.zip", self.CHATGPT), self.db)
+            import_conversations(self.make_zip("claude.zip", claude), self.db)
+
+        rows = UsageStats(self.db).query(group_by=('day', 'provider'))
+        by_day = {(row['day'], row['provider']): row['messages'] for row in rows}
+        self.assertEqual(by_day, {
+            ('2023-11-14', 'openai'): 2,
+            ('2024-01-01', 'anthropic'): 2,
+            ('2024-01-02', 'anthropic'): 1,
+        })
+        timestamps = [m['timestamp'] for m in Message(self.db).search("Olá")]
+        self.assertIn('2023-11-14T22:13:21Z', timestamps)
+
+        stats = Archiver(self.db).archive_older_than(months=6, now='2025-01-01')
+        self.assertEqual(stats['conversations_archived'], 2)
+
+    def test_truncated_json_logged_as_read_error(self):
+        """Test a decode error mid-stream keeps the read-error log entry and is re-raised."""
+        path = Path(self.temp_dir) / "conversations.json"
+        path.write_text(json.dumps(self.CHATGPT * 2)[:-40], encoding='utf-8')
+        with redirect_stdout(io.StringIO()), self.assertRaises(ValueError):
+            import_chatgpt_conversations(str(path), self.db)
+
+        log_file = ExecutionLogger().log_file
+        entries = [json.loads(line) for line in log_file.read_text(encoding='utf-8').splitlines()]
+        self.assertEqual(entries[-1]['status'], 'error')
+        self.assertIn("Failed to read JSON file", entries[-1]['error'])
+        self.assertEqual(len(Conversation(self.db).list_by_project(None)), 1)
+
+    def test_read_error_closes_export_files(self):
+        """Test a non-ValueError read error (corrupt zip entry) closes the zip, is logged and stops the profiler."""
+        import profiling
+        path = Path(self.temp_dir) / "bad.zip"
+        with zipfile.ZipFile(path, 'w') as zf:
+            zf.writestr("conversations.json", '[{"title": "AAAA", "mapping": {}}]')
+        # Corrompe o conteúdo armazenado: a leitura falha com BadZipFile (CRC), não ValueError
+        path.write_bytes(path.read_bytes().replace(b'AAAA', b'BBBB'))
+        opened = []
+
+        def open_export(export_path):
+            opened.append(ExportFiles(zipfile.ZipFile(export_path)))
+            return opened[-1]
+
+        with mock.patch.object(ExportFiles, 'open', side_effect=open_export):
+            with redirect_stdout(io.StringIO()), self.assertRaises(zipfile.BadZipFile):
+                import_chatgpt_conversations(str(path), self.db, profiler=Profiler("t", enabled=True))
+
+        self.assertEqual(len(opened), 1)
+        self.assertIsNone(opened[0].archive.fp)
+        self.assertIsNone(profiling._active)
+        log_file = ExecutionLogger().log_file
+        entries = [json.loads(line) for line in log_file.read_text(encoding='utf-8').splitlines()]
+        self.assertEqual(entries[-1]['status'], 'error')
+        self.assertIn("Failed to read JSON file", entries[-1]['error'])
+        self.assertIsNotNone(entries[-1]['profile'])
+
+    def test_maintenance_failure_keeps_import_result(self):
+        """Test a failing post-import maintenance run is logged without failing the import."""
+        self.db._maintenance = MaintenanceScheduler(self.db, bulk_threshold=1)
+        path = Path(self.temp_dir) / "conversations.json"
+        path.write_text(json.dumps(self.CHATGPT), encoding='utf-8')
+        with mock.patch.object(MaintenanceScheduler, 'run', side_effect=sqlite3.OperationalError("disk I/O error")):
+            with redirect_stdout(io.StringIO()):
+                stats = import_conversations(str(path), self.db)
+
+        self.assertEqual(stats['conversations_imported'], 1)
+        log_file = ExecutionLogger().log_file
+        entries = [json.loads(line) for line in log_file.read_text(encoding='utf-8').splitlines()]
+        self.assertEqual([e['status'] for e in entries[-2:]], ['error', 'success'])
+        self.assertIn("Post-import maintenance failed", entries[-2]['error'])
+
+    def test_conversations_file_owns_the_zip(self):
+        """Test closing the conversations stream also closes the zip it came from."""
+        with open_conversations_file(self.make_zip("gpt.zip", self.CHATGPT)) as fp:
+            self.assertEqual(list(iter_json_array(fp)), self.CHATGPT)
+        self.assertIsNone(fp.archive.fp)
+
+
+class TestBlobStore(unittest.TestCase):
+    """Test the content-addressed blob store and attachments."""
+
+    def setUp(self):
+        """Create a temporary database and blob store."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.temp_dir)
+        self.db = Database(str(Path(self.temp_dir) / "test.db"))
+        self.db.initialize_schema()
+        self.store = BlobStore.for_database(self.db)
+
+    def tearDown(self):
+        """Clean up temporary files."""
+        os.chdir(self.cwd)
+        self.db.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_streaming_put_dedup_and_zero_copy_reads(self):
+        """Test chunked writes, sharded layout, dedup, mmap and sendfile."""
+        store = BlobStore(self.store.root, chunk_size=4)
+        data = b"imagem" * 100
+        blob_hash, size = store.put_stream(io.BytesIO(data))
+        self.assertEqual(store.put_bytes(data), (blob_hash, size))
+        self.assertEqual(store.path_for(blob_hash).relative_to(store.root).parts,
+                         (blob_hash[:2], blob_hash[2:4], blob_hash))
+        self.assertEqual(len(list(store.root.rglob("*"))), 3)  # 2 shards + 1 arquivo
+
+        view = store.open_mmap(blob_hash)
+        self.assertEqual(view[:6], b"imagem")
+        view.close()
+
+        read_fd, write_fd = os.pipe()
+        try:
+            self.assertEqual(store.sendfile(blob_hash, write_fd, offset=6, count=12), 12)
+            self.assertEqual(os.read(read_fd, 100), b"imagemimagem")
+        finally:
+            os.close(read_fd)
+            os.close(write_fd)
+
+    def test_chatgpt_zip_attachments(self):
+        """Test importer streams zip attachments into the store, deduplicated."""
+        def chat(title):
+            return {
+                "title": title,
+                "mapping": {
+                    "root": {"parent": None, "children": ["a"], "message": None},
+                    "a": {"parent": "root", "children": ["b"], "message": {
+                        "author": {"role": "user"},
+                        "content": {"parts": [
+                            {"content_type": "image_asset_pointer", "asset_pointer": "file-service://file-Img1"},
+                            "Veja a imagem",
+                        ]}}},
+                    "b": {"parent": "a", "children": ["c"], "message": {
+                        "author": {"role": "assistant"}, "content": {"parts": ["Rodando código"]}}},
+                    "c": {"parent": "b", "children": [], "message": {
+                        "author": {"role": "tool"},
+                        "content": {"content_type": "execution_output", "text": "42"}}},
+                },
+            }
+
+        path = str(Path(self.temp_dir) / "gpt.zip")
+        with zipfile.ZipFile(path, 'w') as zf:
+            zf.writestr("conversations.json", json.dumps([chat("A"), chat("B")]))
+            zf.writestr("file-Img1-photo.png", b"\x89PNG fake")
+
+        with redirect_stdout(io.StringIO()):
+            stats = import_conversations(path, self.db)
+
+        self.assertEqual(stats['messages_imported'], 4)
+        self.assertEqual(stats['attachments_imported'], 4)
+        self.assertEqual(stats['attachments_missing'], 0)
+
+        attachments = Attachment(self.db, self.store)
+        conv = Conversation(self.db).list_by_project(None)[0]
+        user_msg, assistant_msg = Message(self.db).list_by_conversation(conv['id'])
+        self.assertEqual(user_msg['content'], "Veja a imagem")
+        image = attachments.list_by_message(user_msg['id'])[0]
+        self.assertEqual((image['kind'], image['filename']), ('image', "file-Img1-photo.png"))
+        output = attachments.list_by_message(assistant_msg['id'])[0]
+        self.assertEqual(output['kind'], 'code_output')
+
+        # Mesma imagem e mesma saída nas duas conversas: 2 blobs para 4 anexos
+        blob_count = self.db.connect().execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+        self.assertEqual(blob_count, 2)
+        with open(self.store.path_for(image['blob_hash']), 'rb') as f:
+            self.assertEqual(f.read(), b"\x89PNG fake")
+
+    def test_tool_output_without_previous_message_reported_missing(self):
+        """Test a tool output at the start of a conversation counts as a missing attachment."""
+        chat = [{
+            "title": "Tool first",
+            "mapping": {
+                "root": {"parent": None, "children": ["t"], "message": None},
+                "t": {"parent": "root", "children": ["a"], "message": {
+                    "author": {"role": "tool"},
+                    "content": {"content_type": "execution_output", "text": "42"}}},
+                "a": {"parent": "t", "children": [], "message": {
+                    "author": {"role": "user"}, "content": {"parts": ["Oi"]}}},
+            },
+        }]
+        path = Path(self.temp_dir) / "conversations.json"
+        path.write_text(json.dumps(chat), encoding='utf-8')
+        with redirect_stdout(io.StringIO()):
+            stats = import_conversations(str(path), self.db)
+        self.assertEqual((stats['attachments_imported'], stats['attachments_missing']), (0, 1))
+
+    def test_garbage_collection_spares_recently_touched_blobs(self):
+        """Test GC removes orphans only past the grace period, and reuse refreshes it."""
+        conv_id = Conversation(self.db).create(provider="openai", model="gpt-4", title="GC")
+        message_id = Message(self.db).create(conversation_id=conv_id, role="user", content="x")
+        attachments = Attachment(self.db, self.store)
+        attachments.create_from_bytes(message_id, b"orphan")
+        blob_hash = attachments.list_by_message(message_id)[0]['blob_hash']
+        self.db.write("DELETE FROM message_attachments WHERE message_id = ?", (message_id,))
+        path = self.store.path_for(blob_hash)
+
+        self.assertEqual(attachments.collect_garbage(), 0)
+        # Um import concorrente reaproveita o blob antigo: put_* renova o mtime
+        os.utime(path, (time.time() - 3600, time.time() - 3600))
+        self.store.put_bytes(b"orphan")
+        self.assertEqual(attachments.collect_garbage(), 0)
+        self.assertTrue(path.exists())
+
+        self.assertEqual(attachments.collect_garbage(grace_seconds=0), 1)
+        self.assertFalse(path.exists())
+        self.assertEqual(self.db.connect().execute("SELECT COUNT(*) FROM blobs").fetchone()[0], 0)
+
+    def test_put_bytes_cleans_up_on_failure(self):
+        """Test a failed put_bytes leaves no temporary file behind."""
+        with mock.patch('blob_store.os.replace', side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                self.store.put_bytes(b"never stored")
+        self.assertEqual(list(self.store.root.glob(".incoming-*")), [])
+
+
+class TestMaintenance(unittest.TestCase):
+    """Test the database maintenance scheduler."""
+
+    def setUp(self):
+        """Create a temporary database and log directory."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.db = Database(str(Path(self.temp_dir) / "test.db"))
+        self.db.initialize_schema()
+        self.logger = ExecutionLogger(log_dir=str(Path(self.temp_dir) / "logs"))
+        self.scheduler = MaintenanceScheduler(
+            self.db, logger=self.logger, bulk_threshold=100, vacuum_step_pages=8
+        )
+
+    def tearDown(self):
+        """Clean up temporary files."""
+        self.db.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_incremental_vacuum_reclaims_space(self):
+        """Test new databases use incremental auto_vacuum and runs reclaim pages."""
+        conn = self.db.connect()
+        self.assertEqual(conn.execute("PRAGMA auto_vacuum").fetchone()[0], 2)
+
+        conv_id = Conversation(self.db).create(provider="openai", model="gpt-4", title="Big")
+        msg = Message(self.db)
+        for _ in range(50):
+            msg.create(conversation_id=conv_id, role="user", content="x" * 4000)
+        conn.execute("DELETE FROM messages")
+        conn.commit()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        stats = self.scheduler.run()
+        self.assertGreater(stats['freelist_pages_before'], 0)
+        self.assertEqual(stats['freelist_pages_after'], 0)
+        self.assertGreater(stats['reclaimed_bytes'], 0)
+        self.assertGreater(stats['vacuum_steps'], 1)
+        self.assertIsNotNone(conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'"
+        ).fetchone())
+
+        with open(self.logger.log_file, 'r', encoding='utf-8') as f:
+            entry = json.loads(f.readlines()[-1])
+        self.assertEqual(entry['script_name'], "maintenance.py")
+        self.assertEqual(entry['outputs']['reclaimed_bytes'], stats['reclaimed_bytes'])
+
+    def test_bulk_threshold_and_schedule(self):
+        """Test maintenance triggers after bulk changes and when due."""
+        self.assertIsNone(self.scheduler.record_changes(60))
+        self.assertEqual(self.scheduler.record_changes(60)['reason'], 'bulk')
+        self.assertIsNone(self.scheduler.run_if_due())
+
+        self.scheduler.interval_seconds = 0
+        self.assertEqual(self.scheduler.run_if_due()['reason'], 'schedule')
+
+    def test_concurrent_record_changes_are_not_lost(self):
+        """Test counters recorded from several connections add up exactly."""
+        self.scheduler.bulk_threshold = 10 ** 6
+        errors = []
+
+        def writer():
+            db = Database(str(self.db.db_path))
+            try:
+                scheduler = MaintenanceScheduler(db, logger=self.logger, bulk_threshold=10 ** 6)
+                for _ in range(25):
+                    scheduler.record_changes(1)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.close()
+
+        threads = [threading.Thread(target=writer) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(self.scheduler._state()['pending_changes'], 200)
+
+
+class TestArchive(unittest.TestCase):
+    """Test hot/cold archival of inactive conversations."""
+
+    def setUp(self):
+        """Create a database with one old and one recent conversation."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.temp_dir)  # ExecutionLogger grava em .tmp/logs relativo
+        self.db = Database(str(Path(self.temp_dir) / "test.db"))
+        self.db.initialize_schema()
+        self.conv_model = Conversation(self.db)
+        self.msg_model = Message(self.db)
+
+        self.old_id = self.conv_model.create(provider="openai", model="gpt-4", title="Old chat")
+        self.msg_model.create(conversation_id=self.old_id, role="user", content="legacy needle")
+        self.msg_model.create(conversation_id=self.old_id, role="assistant", content="old answer")
+        self.new_id = self.conv_model.create(provider="openai", model="gpt-4", title="New chat")
+        self.msg_model.create(conversation_id=self.new_id, role="user", content="fresh needle")
+
+        conn = self.db.connect()
+        conn.execute("DROP TRIGGER update_conversations_timestamp")
+        conn.execute(
+            "UPDATE conversations SET updated_at = '2022-03-01 10:00:00' WHERE id = ?", (self.old_id,)
+        )
+        conn.execute(
+            "UPDATE conversations SET updated_at = '2024-05-20 10:00:00' WHERE id = ?", (self.new_id,)
+        )
+        conn.commit()
+        self.archiver = Archiver(self.db)
+
+    def tearDown(self):
+        """Clean up temporary files."""
+        os.chdir(self.cwd)
+        self.db.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_archive_moves_old_conversations(self):
+        """Test old conversations leave the main database into the archive file."""
+        stats = self.archiver.archive_older_than(months=6, now='2024-06-01')
+        self.assertEqual(stats['cutoff'], '2023-12-01')
+        self.assertEqual(stats['conversations_archived'], 1)
+        self.assertEqual(stats['messages_archived'], 2)
+        archive_path = Path(self.temp_dir) / "archive" / "archive.db"
+        self.assertEqual(stats['archive'], str(archive_path))
+        self.assertTrue(archive_path.exists())
+
+        conn = self.db.connect()
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM main.conversations").fetchone()[0], 1)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM main.messages").fetchone()[0], 1)
+        archived = conn.execute(
+            "SELECT updated_at FROM archive.conversations WHERE id = ?", (self.old_id,)
+        ).fetchone()
+        self.assertEqual(archived['updated_at'], '2022-03-01 10:00:00')
+
+        # Executar de novo não move nada
+        self.assertEqual(
+            self.archiver.archive_older_than(months=6, now='2024-06-01')['conversations_archived'], 0
+        )
+
+    def test_listing_and_search_federate(self):
+        """Test reads span archives transparently, also from a fresh connection."""
+        self.archiver.archive_older_than(months=6, now='2024-06-01')
+        self.db.close()
+
+        db = Database(self.db.db_path)
+        conversations = Conversation(db).list_by_project()
+        self.assertEqual([c['id'] for c in conversations], [self.new_id, self.old_id])
+        self.assertEqual(
+            [c['id'] for c in Conversation(db).list_by_project(include_archived=False)],
+            [self.new_id]
+        )
+        self.assertEqual(Conversation(db).get(self.old_id)['title'], "Old chat")
+        self.assertEqual(len(Message(db).list_by_conversation(self.old_id)), 2)
+
+        results = Message(db).search("needle")
+        self.assertEqual({r['conversation_title'] for r in results}, {"Old chat", "New chat"})
+        self.assertEqual(len(Message(db).search("needle", include_archived=False)), 1)
+        db.close()
+
+    def test_federation_survives_migrations_and_open_transactions(self):
+        """Test reads list columns explicitly and never ATTACH inside a transaction."""
+        reader = Database(self.db.db_path)
+        reader_conn = reader.connect()
+        self.archiver.archive_older_than(months=6, now='2024-06-01')
+
+        # Arquivo criado por outra conexão durante uma transação aberta: lê só o principal
+        reader_conn.execute("BEGIN")
+        self.assertEqual([c['id'] for c in Conversation(reader).list_by_project()], [self.new_id])
+        reader_conn.commit()
+        self.assertEqual(len(Conversation(reader).list_by_project()), 2)
+
+        # Coluna nova só no banco principal: o arquivo antigo devolve NULL
+        reader_conn.execute("ALTER TABLE main.conversations ADD COLUMN pinned INTEGER DEFAULT 0")
+        reader_conn.commit()
+        reader.forget_columns()
+        conversations = {c['id']: c for c in Conversation(reader).list_by_project()}
+        self.assertEqual(conversations[self.new_id]['pinned'], 0)
+        self.assertIsNone(conversations[self.old_id]['pinned'])
+        self.assertEqual(len(Message(reader).search("needle")), 2)
+        reader.close()
+
+        # O próximo arquivamento acrescenta a coluna ao arquivo
+        self.db.close()
+        stats = self.archiver.archive_older_than(months=0, now='2025-01-01')
+        self.assertEqual(stats['conversations_archived'], 1)
+        columns = self.db.schema_columns('archive', 'conversations')
+        self.assertIn('pinned', columns)
+        self.assertEqual(Conversation(self.db).get(self.new_id)['pinned'], 0)
+
+    def test_archived_attachments_survive_garbage_collection(self):
+        """Test blob GC counts archived attachments and they are readable after restore."""
+        message_id = self.msg_model.list_by_conversation(self.old_id)[0]['id']
+        attachments = Attachment(self.db)
+        attachments.create_from_bytes(message_id, b"archived bytes", filename="a.txt")
+        self.archiver.archive_older_than(months=6, now='2024-06-01')
+
+        listed = attachments.list_by_message(message_id)
+        self.assertEqual([a['filename'] for a in listed], ["a.txt"])
+        self.assertEqual(attachments.collect_garbage(), 0)
+
+        self.assertTrue(self.archiver.restore_conversation(self.old_id))
+        blob_hash = attachments.list_by_message(message_id)[0]['blob_hash']
+        self.assertEqual(attachments.store.path_for(blob_hash).read_bytes(), b"archived bytes")
+
+    def test_write_to_archived_conversation_restores_it(self):
+        """Test new messages and attachments bring the archived conversation back to main."""
+        totals_before = UsageStats(self.db).totals()
+        self.archiver.archive_older_than(months=6, now='2024-06-01')
+        self.db.initialize_schema()  # recria o trigger de updated_at removido no setUp
+
+        message_id = self.msg_model.create(
+            conversation_id=self.old_id, role="assistant", content="revived",
+            meta_info={"tokens": 11}
+        )
+        conn = self.db.connect()
+        row = conn.execute(
+            "SELECT updated_at FROM main.conversations WHERE id = ?", (self.old_id,)
+        ).fetchone()
+        self.assertIsNotNone(row)
+        self.assertNotEqual(row['updated_at'], '2022-03-01 10:00:00')
+        self.assertEqual(conn.execute(
+            "SELECT COUNT(*) FROM main.messages WHERE conversation_id = ?", (self.old_id,)
+        ).fetchone()[0], 3)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM archive.messages").fetchone()[0], 0)
+        totals = UsageStats(self.db).totals()
+        self.assertEqual(totals['messages'], totals_before['messages'] + 1)
+        self.assertEqual(totals['tokens'], totals_before['tokens'] + 11)
+
+        # Anexo numa mensagem arquivada também restaura a conversa
+        self.archiver.archive_older_than(months=0, now='2099-01-01')
+        Attachment(self.db).create_from_bytes(message_id, b"late", filename="late.txt")
+        self.assertIsNotNone(conn.execute(
+            "SELECT 1 FROM main.messages WHERE id = ?", (message_id,)
+        ).fetchone())
+        self.assertEqual(conn.execute(
+            "SELECT COUNT(*) FROM main.message_attachments WHERE message_id = ?", (message_id,)
+        ).fetchone()[0], 1)
+
+    def test_writes_from_threads_restore_through_write_queue(self):
+        """Test worker threads writing to archived conversations restore them on the writer thread."""
+        archived_message = self.msg_model.list_by_conversation(self.old_id)[0]['id']
+        self.archiver.archive_older_than(months=0, now='2099-01-01')
+        self.db.enable_write_queue()
+        errors = []
+
+        def worker(i):
+            try:
+                if i == 3:
+                    Attachment(self.db).create_from_bytes(archived_message, b"late", filename="w.txt")
+                else:
+                    conversation_id = self.old_id if i % 2 else self.new_id
+                    for j in range(5):
+                        self.msg_model.create(conversation_id=conversation_id, role="user",
+                                              content=f"w{i}-{j}")
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+        conn = self.db.connect()
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM archive.conversations").fetchone()[0], 0)
+        self.assertEqual(conn.execute(
+            "SELECT COUNT(*) FROM main.messages WHERE conversation_id = ?", (self.old_id,)
+        ).fetchone()[0], 2 + 5)
+        self.assertEqual(conn.execute(
+            "SELECT COUNT(*) FROM main.messages WHERE conversation_id = ?", (self.new_id,)
+        ).fetchone()[0], 1 + 10)
+        self.assertEqual(conn.execute(
+            "SELECT COUNT(*) FROM main.message_attachments WHERE message_id = ?", (archived_message,)
+        ).fetchone()[0], 1)
+        self.assertEqual(self.db.write_queue.stats['errors'], 0)
+
+    def test_failed_archival_keeps_rollups_live(self):
+        """Test an archival that fails mid-move leaves usage rollups and later deletes untouched."""
+        usage_before = UsageStats(self.db).totals()
+        columns = Archiver._columns
+
+        def failing_columns(archiver, conn, schema, table):
+            if table == 'message_attachments':
+                raise sqlite3.OperationalError("disk I/O error")
+            return columns(archiver, conn, schema, table)
+
+        with mock.patch.object(Archiver, '_columns', failing_columns):
+            with self.assertRaises(sqlite3.OperationalError):
+                self.archiver.archive_older_than(months=6, now='2024-06-01')
+        self.assertEqual(UsageStats(self.db).totals(), usage_before)
+        conn = self.db.connect()
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM main.conversations").fetchone()[0], 2)
+        self.assertIsNone(conn.execute(
+            "SELECT 1 FROM sqlite_temp_master WHERE name = 'usage_before'"
+        ).fetchone())
+
+        self.db.write("DELETE FROM messages WHERE content = 'legacy needle'")
+        self.assertEqual(UsageStats(self.db).totals()['messages'], usage_before['messages'] - 1)
+
+    def test_restore_conversation(self):
+        """Test restoring moves the conversation back without touching usage rollups."""
+        usage_before = UsageStats(self.db).totals()
+        self.archiver.archive_older_than(months=6, now='2024-06-01')
+        self.assertEqual(UsageStats(self.db).totals(), usage_before)
+        self.assertEqual(UsageStats(self.db).backfill()['messages'], 3)
+
+        self.assertTrue(self.archiver.restore_conversation(self.old_id))
+        self.assertFalse(self.archiver.restore_conversation(self.old_id))
+        conn = self.db.connect()
+        row = conn.execute(
+            "SELECT updated_at FROM main.conversations WHERE id = ?", (self.old_id,)
+        ).fetchone()
+        self.assertEqual(row['updated_at'], '2022-03-01 10:00:00')
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM archive.messages").fetchone()[0], 0)
+        self.assertEqual(UsageStats(self.db).totals(), usage_before)
+
+
+class TestDuplicateIndex(unittest.TestCase):
+    """Test MinHash/LSH near-duplicate detection."""
+
+    BASE = (
+        "How do I configure a reverse proxy with nginx for a node application "
+        "running on port three thousand with websocket support and gzip enabled "
+        "while keeping the static assets cached for one week in the browser"
+    )
+
+    def setUp(self):
+        """Create a temporary database."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.temp_dir)  # ExecutionLogger grava em .tmp/logs relativo
+        self.db = Database(str(Path(self.temp_dir) / "test.db"))
+        self.db.initialize_schema()
+        self.index = DuplicateIndex(self.db)
+
+    def tearDown(self):
+        """Clean up temporary files."""
+        os.chdir(self.cwd)
+        self.db.close()
+        shutil.rmtree(self.temp_dir)
+
+    def create(self, title, texts):
+        conv_id = Conversation(self.db).create(provider="openai", model="gpt-4", title=title)
+        for text in texts:
+            Message(self.db).create(conversation_id=conv_id, role="user", content=text)
+        self.index.add(conv_id, texts)
+        return conv_id
+
+    def test_similarity_estimate(self):
+        """Test MinHash similarity tracks the Jaccard index of the shingle sets."""
+        a = shingles([self.BASE])
+        b = shingles([self.BASE + " please"])
+        jaccard = len(a & b) / len(a | b)
+        self.assertAlmostEqual(similarity(minhash(a), minhash(b)), jaccard, delta=0.15)
+        self.assertLess(similarity(minhash(a), minhash(shingles(["completely different text here"]))), 0.2)
+
+    def test_clusters_and_merge(self):
+        """Test near-copies cluster together, unrelated chats do not, and merge keeps one."""
+        original = self.create("Nginx", [self.BASE, "Use proxy_pass and the upgrade headers."])
+        reexport = self.create("Nginx (copy)", [self.BASE, "Use proxy_pass and the upgrade headers!"])
+        partial = self.create("Nginx short", [" ".join(self.BASE.split()[:20])])
+        other = self.create("Recipes", ["A slow cooked tomato sauce with basil garlic and olive oil"])
+
+        clusters = self.index.clusters()
+        self.assertEqual(len(clusters), 1)
+        self.assertEqual(set(clusters[0]), {original, reexport})
+        self.assertNotIn(other, clusters[0])
+        self.assertNotIn(partial, clusters[0])
+
+        self.assertEqual(UsageStats(self.db).totals()['messages'], 6)
+        result = self.index.merge(clusters[0])
+        self.assertEqual({result['kept']} | set(result['removed']), {original, reexport})
+        self.assertIsNotNone(Conversation(self.db).get(result['kept']))
+        self.assertIsNone(Conversation(self.db).get(result['removed'][0]))
+        self.assertEqual(self.index.clusters(), [])
+        # As mensagens das duplicatas removidas saem do rollup de uso
+        self.assertEqual(UsageStats(self.db).totals()['messages'], 4)
+
+    def test_chat_conversations_indexed_on_demand(self):
+        """Test conversations created outside the importers are indexed by clusters()."""
+        first = Conversation(self.db).create(provider="openai", model="gpt-4", title="Chat")
+        Message(self.db).create(conversation_id=first, role="user", content="unrelated opener")
+        self.assertEqual(self.index.clusters(), [])
+        self.assertIsNotNone(self.index._signature(first))
+
+        # Mensagem nova invalida a assinatura; o próximo clusters() recalcula
+        Message(self.db).create(conversation_id=first, role="user", content=self.BASE)
+        self.assertIsNone(self.index._signature(first))
+        second = Conversation(self.db).create(provider="openai", model="gpt-4", title="Chat 2")
+        Message(self.db).create(conversation_id=second, role="user", content=self.BASE)
+        self.assertEqual(self.index.clusters(), [sorted([first, second])])
+
+    def test_incremental_import_indexing(self):
+        """Test importers index conversations and re-imports show up as duplicates."""
+        chat = [{
+            "title": "Dup",
+            "mapping": {
+                "root": {"id": "root", "message": None, "parent": None, "children": ["a"]},
+                "a": {"id": "a", "parent": "root", "children": [], "message": {
+                    "author": {"role": "user"}, "create_time": 1700000000,
+                    "content": {"parts": [self.BASE]}}},
+            }
+        }]
+        path = Path(self.temp_dir) / "conversations.json"
+        path.write_text(json.dumps(chat), encoding='utf-8')
+        with redirect_stdout(io.StringIO()):
+            import_conversations(str(path), self.db)
+            # Assinatura da importação é reaproveitada, não recalculada
+            self.assertEqual(self.index.index_missing(), 0)
+            self.assertEqual(self.index.clusters(), [])
+            import_conversations(str(path), self.db)
+        self.assertEqual(len(self.index.clusters()), 1)
+
+        self.db.connect().execute("DELETE FROM conversation_signatures")
+        self.db.connect().execute("DELETE FROM lsh_buckets")
+        self.db.connect().commit()
+        self.assertEqual(self.index.index_missing(), 2)
+        self.assertEqual(len(self.index.clusters()), 1)
+
+
+class TestProfiling(unittest.TestCase):
+    """Test the opt-in profiling context."""
+
+    def setUp(self):
+        """Run inside a temporary directory (logs and profile artifacts are relative)."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.temp_dir)
+        self.previous_env = os.environ.pop(PROFILE_ENV, None)
+
+    def tearDown(self):
+        """Restore the environment and clean up temporary files."""
+        os.chdir(self.cwd)
+        os.environ.pop(PROFILE_ENV, None)
+        if self.previous_env is not None:
+            os.environ[PROFILE_ENV] = self.previous_env
+        shutil.rmtree(self.temp_dir)
+
+    def test_disabled_by_default(self):
+        """Test profiling is a no-op unless enabled."""
+        with Profiler("test.py") as profiler:
+            with phase('parse'):
+                pass
+        self.assertIsNone(profiler.results())
+        self.assertEqual(profiler.phases, {})
+        self.assertFalse(Path(".tmp/profiles").exists())
+
+    def test_phases_memory_and_cprofile(self):
+        """Test phase timings, memory stats, cProfile and the artifact file."""
+        with Profiler("test.py", cprofile=True) as profiler:
+            for _ in range(3):
+                with phase('parse'):
+                    data = [str(i) * 10 for i in range(20000)]
+            with phase('write'):
+                del data
+
+        results = profiler.results()
+        self.assertEqual(results['phases']['parse']['calls'], 3)
+        self.assertIn('write', results['phases'])
+        self.assertGreater(results['tracemalloc_peak_bytes'], 20000 * 10)
+        self.assertTrue(results['top_allocations'])
+        self.assertTrue(results['cprofile_top'])
+        self.assertTrue(Path(results['cprofile_stats']).exists())
+        with open(results['artifact'], 'r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['script_name'], "test.py")
+
+    def test_importer_logs_profile(self):
+        """Test importers report read/parse/linearize/write phases in the log entry."""
+        os.environ[PROFILE_ENV] = "1"
+        db = Database(str(Path(self.temp_dir) / "test.db"))
+        db.initialize_schema()
+        path = Path(self.temp_dir) / "conversations.json"
+        path.write_text(json.dumps(TestImportArchive.CHATGPT), encoding='utf-8')
+        with redirect_stdout(io.StringIO()):
+            import_conversations(str(path), db)
+        db.close()
+
+        log_file = ExecutionLogger().log_file
+        entries = [json.loads(line) for line in log_file.read_text(encoding='utf-8').splitlines()]
+        entry = [e for e in entries if e['script_name'] == "import_chatgpt.py"][-1]
+        self.assertLessEqual({'read', 'parse', 'linearize', 'write'}, set(entry['profile']['phases']))
+        self.assertTrue(Path(entry['profile']['artifact']).exists())
+
+    def test_profiler_released_when_import_fails(self):
+        """Test a failing import does not leave its profiler active for later runs."""
+        import profiling
+        os.environ[PROFILE_ENV] = "1"
+        db = Database(str(Path(self.temp_dir) / "test.db"))
+        db.initialize_schema()
+        path = Path(self.temp_dir) / "conversations.json"
+        path.write_text(json.dumps([{"unknown": "format"}]), encoding='utf-8')
+        try:
+            with self.assertRaises(ValueError):
+                import_conversations(str(path), db)
+        finally:
+            db.close()
+        self.assertIsNone(profiling._active)
+
+
+class TestChangeFeed(unittest.TestCase):
+    """Test the trigger-populated change feed."""
+
+    def setUp(self):
+        """Create a temporary database."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.temp_dir)  # ExecutionLogger grava em .tmp/logs relativo
+        self.db = Database(str(Path(self.temp_dir) / "test.db"))
+        self.db.initialize_schema()
+        self.feed = ChangeFeed(self.db)
+
+    def tearDown(self):
+        """Clean up temporary files."""
+        os.chdir(self.cwd)
+        self.db.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_changes_since_cursor(self):
+        """Test inserts/updates/deletes are logged in order and paged by seq."""
+        project_id = Project(self.db).create(name="Feed")
+        conv_id = Conversation(self.db).create(provider="openai", model="gpt-4", title="T",
+                                               project_id=project_id)
+        msg_id = Message(self.db).create(conversation_id=conv_id, role="user", content="Oi")
+
+        page = self.feed.changes_since(0)
+        ops = [(c['entity'], c['op']) for c in page['changes']]
+        self.assertEqual(ops, [('project', 'insert'), ('conversation', 'insert'),
+                               ('message', 'insert')])
+        self.assertEqual(page['changes'][2]['parent_id'], conv_id)
+        cursor = page['last_seq']
+        self.assertEqual(cursor, self.feed.latest_seq())
+
+        # Nada novo: página vazia com o mesmo cursor
+        self.assertEqual(self.feed.changes_since(cursor)['changes'], [])
+
+        self.db.write("UPDATE conversations SET title = 'Novo' WHERE id = ?", (conv_id,))
+        self.db.write("DELETE FROM messages WHERE id = ?", (msg_id,))
+        page = self.feed.changes_since(cursor, limit=1)
+        self.assertEqual([(c['entity'], c['op']) for c in page['changes']],
+                         [('conversation', 'update')])
+        self.assertTrue(page['has_more'])
+        page = self.feed.changes_since(page['last_seq'])
+        self.assertEqual([(c['entity_id'], c['op']) for c in page['changes']], [(msg_id, 'delete')])
+        self.assertFalse(page['reset'])
+
+    def test_compaction(self):
+        """Test compaction keeps the latest change per entity and raises the floor."""
+        conv_id = Conversation(self.db).create(provider="openai", model="gpt-4", title="T")
+        for i in range(5):
+            msg_id = Message(self.db).create(conversation_id=conv_id, role="user", content=str(i))
+            self.db.write("UPDATE messages SET content = 'editada' WHERE id = ?", (msg_id,))
+        last = self.feed.latest_seq()
+
+        stats = self.feed.compact(max_age_days=None)
+        self.assertEqual(stats['collapsed'], 5)
+        changes = self.feed.changes_since(0)['changes']
+        self.assertEqual(len(changes), 6)  # 1 conversa + 5 mensagens
+        self.assertEqual(changes[-1]['seq'], last)
+
+        conn = self.db.connect()
+        conn.execute("UPDATE changes SET changed_at = '2000-01-01 00:00:00'")
+        conn.commit()
+        self.assertEqual(self.feed.compact(max_age_days=30)['expired'], 6)
+        self.assertTrue(self.feed.changes_since(0)['reset'])
+        self.assertFalse(self.feed.changes_since(last)['reset'])
+
+        # seq continua monotônico depois da compactação
+        Message(self.db).create(conversation_id=conv_id, role="user", content="depois")
+        self.assertGreater(self.feed.changes_since(last)['changes'][0]['seq'], last)
+
+    def test_compaction_uses_entity_index(self):
+        """Test the per-entity MAX(seq) lookup in compaction reads the covering index."""
+        plan = ' '.join(row['detail'] for row in self.db.connect().execute(
+            "EXPLAIN QUERY PLAN SELECT MAX(seq) FROM changes GROUP BY entity, entity_id"
+        ))
+        self.assertIn("COVERING INDEX idx_changes_entity", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_wait_wakes_on_commit(self):
+        """Test a write from another thread wakes wait() without waiting for the poll interval."""
+        conv_id = Conversation(self.db).create(provider="openai", model="gpt-4", title="T")
+        cursor = self.feed.latest_seq()
+        self.db.enable_write_queue()
+
+        def writer():
+            time.sleep(0.1)
+            self.db.write("UPDATE conversations SET title = 'Novo' WHERE id = ?", (conv_id,))
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        start = time.monotonic()
+        page = self.feed.wait(cursor, timeout=10, poll_interval=10)
+        elapsed = time.monotonic() - start
+        thread.join()
+        self.assertEqual([c['op'] for c in page['changes']], ['update'])
+        self.assertLess(elapsed, 2)
+
+        # Sem alterações: volta vazio ao fim do timeout
+        page = self.feed.wait(page['last_seq'], timeout=0.2)
+        self.assertEqual(page['changes'], [])
+
+    def test_floor_cached_until_database_changes(self):
+        """Test floor() skips the settings lookup until a commit, from any connection, changes the database."""
+        conv_id = Conversation(self.db).create(provider="openai", model="gpt-4", title="T")
+        Message(self.db).create(conversation_id=conv_id, role="user", content="Oi")
+        self.assertEqual(self.feed.floor(), 0)
+
+        statements = []
+        self.db.connect().set_trace_callback(statements.append)
+        try:
+            for _ in range(3):
+                self.feed.changes_since(0)
+        finally:
+            self.db.connect().set_trace_callback(None)
+        self.assertFalse([s for s in statements if 'settings' in s])
+
+        # Compactação por outra instância, na mesma conexão
+        conn = self.db.connect()
+        conn.execute("UPDATE changes SET changed_at = '2000-01-01 00:00:00'")
+        conn.commit()
+        ChangeFeed(self.db).compact(max_age_days=30)
+        floor = self.feed.floor()
+        self.assertGreater(floor, 0)
+        self.assertTrue(self.feed.changes_since(0)['reset'])
+
+        # Floor alterado por outro processo (outra conexão)
+        other = sqlite3.connect(str(self.db.db_path))
+        with other:
+            other.execute("UPDATE settings SET value = ? WHERE key = 'change_feed'",
+                          (json.dumps({'floor': floor + 10}),))
+        other.close()
+        self.assertEqual(self.feed.floor(), floor + 10)
+
+    def test_archival_does_not_emit_changes(self):
+        """Test moving conversations to an archive leaves the feed untouched."""
+        conv_id = Conversation(self.db).create(provider="openai", model="gpt-4", title="T")
+        Message(self.db).create(conversation_id=conv_id, role="user", content="Oi")
+        last = self.feed.latest_seq()
+        Archiver(self.db).archive_older_than(months=0, now='2999-01-01')
+        self.assertEqual(self.feed.changes_since(last)['changes'], [])
+
+
+class TestRenderCache(unittest.TestCase):
+    """Test Markdown pre-rendering and the rendered-message cache."""
+
+    def setUp(self):
+        """Create a temporary database with one conversation."""
+        self.temp_dir = tempfile.mkdtemp()
+        self.db = Database(str(Path(self.temp_dir) / "test.db"))
+        self.db.initialize_schema()
+        self.conv_id = Conversation(self.db).create(provider="openai", model="gpt-4", title="T")
+        self.cache = RenderCache(self.db)
+
+    def tearDown(self):
+        """Clean up temporary files."""
+        self.db.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_render_markdown_is_sanitized(self):
+        """Test Markdown, code, LaTeX and link rendering never passes raw HTML through."""
+        rendered = render_markdown(
+            "# Título\n\n**negrito** <img src=x onerror=alert(1)> $E=mc^2$\n\n"
+            "[ok](https://example.com) [ruim](javascript:alert(1))\n\n"
+            "```python\ndef f():\n    return '<b>'\n```"
+        )
+        self.assertIn("<h1>Título</h1>", rendered)
+        self.assertIn("<strong>negrito</strong>", rendered)
+        self.assertIn("&lt;img src=x onerror=alert(1)&gt;", rendered)
+        self.assertIn('<span class="math-inline" data-tex="E=mc^2">', rendered)
+        self.assertIn('<a href="https://example.com"', rendered)
+        self.assertNotIn("javascript:", rendered)
+        self.assertIn('<code class="language-python"><span class="tok-keyword">def</span>', rendered)
+        self.assertIn("&#x27;&lt;b&gt;&#x27;", rendered)
+
+    def test_render_markdown_edge_cases(self):
+        """Test indented lists terminate, links keep balanced parentheses and `*` needs word boundaries."""
+        self.assertEqual(render_markdown("  - foo"), "<ul><li>foo</li></ul>")
+        self.assertEqual(render_markdown("text\n\n\t1. a"), "<p>text</p><ol><li>a</li></ol>")
+        self.assertEqual(
+            render_markdown("  1. a\n  2. b\n    - c"),
+            "<ol><li>a</li><li><p>b</p><ul><li>c</li></ul></li></ol>"
+        )
+        self.assertEqual(render_markdown("[x](javascript:alert(1))"), "<p>x</p>")
+        self.assertIn(
+            'href="https://en.wikipedia.org/wiki/Foo_(bar)"',
+            render_markdown("[w](https://en.wikipedia.org/wiki/Foo_(bar))")
+        )
+        self.assertEqual(render_markdown("2*3*4 = *24*"), "<p>2*3*4 = <em>24</em></p>")
+
+    def test_page_renders_lazily_and_shares_identical_content(self):
+        """Test pages carry HTML, cache by content hash and report the next offset."""
+        msg = Message(self.db)
+        for i in range(5):
+            msg.create(conversation_id=self.conv_id, role="user", content="*igual*")
+        page = self.cache.page_by_conversation(self.conv_id, limit=3)
+        self.assertEqual(len(page['messages']), 3)
+        self.assertEqual(page['next_offset'], 3)
+        self.assertEqual(page['messages'][0]['html'], "<p><em>igual</em></p>")
+        self.assertEqual(self.cache.stats['rendered'], 1)
+
+        page = self.cache.page_by_conversation(self.conv_id, offset=3, limit=3)
+        self.assertEqual(len(page['messages']), 2)
+        self.assertIsNone(page['next_offset'])
+        self.assertEqual(self.cache.stats['rendered'], 1)
+        rows = self.db.connect().execute("SELECT COUNT(*) FROM rendered_messages").fetchone()[0]
+        self.assertEqual(rows, 1)
+
+    def test_fill_pending_resumes_and_versions(self):
+        """Test background fill resumes from its checkpoint and restarts on a new version."""
+        msg = Message(self.db)
+        for i in range(5):
+            msg.create(conversation_id=self.conv_id, role="user", content=f"mensagem {i}")
+        self.assertEqual(self.cache.fill_pending(batch_size=2, budget_seconds=0)['scanned'], 0)
+        result = self.cache.fill_pending(batch_size=2)
+        self.assertEqual((result['scanned'], result['rendered'], result['pending']), (5, 5, False))
+
+        msg.create(conversation_id=self.conv_id, role="user", content="nova")
+        self.assertEqual(self.cache.fill_pending()['scanned'], 1)
+
+        next_version = RenderCache(self.db, version=self.cache.version + 1)
+        self.assertEqual(next_version.fill_pending()['rendered'], 6)
+        self.assertEqual(next_version.prune(), 6)
+
 
 class TestLogging(unittest.TestCase):
     """Test logging functionality."""
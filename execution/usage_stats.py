@@ -0,0 +1,176 @@
+"""
+Estatísticas de uso do NextMind (mensagens e tokens por provedor/modelo/dia).
+Lê exclusivamente a tabela de rollup `usage_daily`, mantida por trigger no schema.
+"""
+import json
+import time
+from typing import Optional, List, Dict, Any, Sequence
+from database import Database
+from logger import get_execution_logger
+
+
+# Dimensões de agrupamento suportadas -> expressão SQL sobre usage_daily
+GROUP_BY_COLUMNS = {
+    'day': 'day',
+    'month': 'substr(day, 1, 7)',
+    'year': 'substr(day, 1, 4)',
+    'provider': 'provider',
+    'model': 'model',
+}
+
+
+class UsageStats:
+    """API de consulta e manutenção dos rollups de uso."""
+
+    def __init__(self, db: Database):
+        self.db = db
+
+    def query(
+        self,
+        start_day: Optional[str] = None,
+        end_day: Optional[str] = None,
+        group_by: Sequence[str] = ('day',),
+        provider: Optional[str] = None,
+        model: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Agrega mensagens e tokens num intervalo de dias.
+
+        Args:
+            start_day: Dia inicial inclusivo ('YYYY-MM-DD'), None para sem limite
+            end_day: Dia final inclusivo ('YYYY-MM-DD'), None para sem limite
+            group_by: Dimensões de agrupamento ('day', 'month', 'year', 'provider', 'model')
+            provider: Filtra por provedor (opcional)
+            model: Filtra por modelo (opcional)
+
+        Returns:
+            Lista de dicts com as dimensões pedidas, `messages` e `tokens`
+        """
+        for dimension in group_by:
+            if dimension not in GROUP_BY_COLUMNS:
+                raise ValueError(f"Dimensão de agrupamento inválida: {dimension}")
+
+        conditions = []
+        params: List[Any] = []
+        if start_day is not None:
+            conditions.append("day >= ?")
+            params.append(start_day)
+        if end_day is not None:
+            conditions.append("day <= ?")
+            params.append(end_day)
+        if provider is not None:
+            conditions.append("provider = ?")
+            params.append(provider)
+        if model is not None:
+            conditions.append("model = ?")
+            params.append(model)
+
+        select = [f"{GROUP_BY_COLUMNS[d]} AS {d}" for d in group_by]
+        select.append("SUM(message_count) AS messages")
+        select.append("SUM(token_count) AS tokens")
+        sql = f"SELECT {', '.join(select)} FROM usage_daily"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        if group_by:
+            positions = ', '.join(str(i) for i in range(1, len(group_by) + 1))
+            sql += f" GROUP BY {positions} ORDER BY {positions}"
+
+        conn = self.db.connect()
+        rows = conn.execute(sql, params).fetchall()
+        return [dict(row) for row in rows if row['messages'] is not None]
+
+    def totals(
+        self,
+        start_day: Optional[str] = None,
+        end_day: Optional[str] = None
+    ) -> Dict[str, int]:
+        """Totais de mensagens e tokens no intervalo (sem agrupamento)."""
+        rows = self.query(start_day, end_day, group_by=())
+        if not rows:
+            return {'messages': 0, 'tokens': 0}
+        return rows[0]
+
+    def backfill(self) -> Dict[str, int]:
+        """
+        Reconstrói `usage_daily` a partir de `messages` (varredura completa, incluindo arquivos).
+        Usado uma vez para bancos criados antes dos rollups ou para corrigir divergências.
+
+        Returns:
+            Estatísticas da reconstrução
+        """
+        conn = self.db.connect()
+        # Conversas arquivadas continuam contando no uso histórico
+        source = " UNION ALL ".join(
+            f"""
+            SELECT m.timestamp, m.meta_info, c.provider, c.model
+            FROM {schema}.messages m
+            JOIN {schema}.conversations c ON c.id = m.conversation_id
+            """
+            for schema in self.db.schemas()
+        )
+        with conn:
+            conn.execute("DELETE FROM usage_daily")
+            conn.execute(
+                f"""
+                INSERT INTO usage_daily (day, provider, model, message_count, token_count)
+                SELECT
+                    substr(timestamp, 1, 10),
+                    provider,
+                    model,
+                    COUNT(*),
+                    SUM(CASE WHEN json_valid(meta_info)
+                             THEN CAST(COALESCE(json_extract(meta_info, '$.tokens'), 0) AS INTEGER)
+                             ELSE 0 END)
+                FROM ({source})
+                GROUP BY 1, 2, 3
+                """
+            )
+        row = conn.execute(
+            "SELECT COUNT(*) AS rollup_rows, COALESCE(SUM(message_count), 0) AS messages FROM usage_daily"
+        ).fetchone()
+        return {'rollup_rows': row['rollup_rows'], 'messages': row['messages']}
+
+
+def backfill_usage(db: Database) -> Dict[str, int]:
+    """
+    Executa o backfill dos rollups de uso registrando no ExecutionLogger.
+
+    Args:
+        db: Instância do Database
+
+    Returns:
+        Estatísticas da reconstrução
+    """
+    logger = get_execution_logger()
+    start_time = time.time()
+    try:
+        stats = UsageStats(db).backfill()
+    except Exception as e:
+        logger.log(
+            script_name="usage_stats.py",
+            inputs={"db_path": str(db.db_path)},
+            outputs={},
+            duration_seconds=time.time() - start_time,
+            status="error",
+            error=str(e)
+        )
+        raise
+
+    logger.log(
+        script_name="usage_stats.py",
+        inputs={"db_path": str(db.db_path)},
+        outputs=stats,
+        duration_seconds=time.time() - start_time,
+        status="success"
+    )
+    return stats
+
+
+if __name__ == "__main__":
+    # Backfill dos rollups para dados existentes
+    db = Database()
+    db.initialize_schema()
+
+    print(json.dumps(backfill_usage(db)))
+
+    db.close()